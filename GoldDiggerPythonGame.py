@@ -4,10 +4,21 @@
 #Created by Cody Holly - codyholly.com
 
 #Import required libraries
-import pygame
-import random
 import time
+
+# When each startup phase finished, reported by --startup-time
+startup_marks = [("start", time.perf_counter())]
+
+#Record the end of a startup phase the first time it is reached
+def mark_startup(phase):
+    if all(name != phase for name, _ in startup_marks):
+        startup_marks.append((phase, time.perf_counter()))
+
+import pygame
+import argparse
+import os
 import sys
+mark_startup("import pygame")
 
 # Initialize Pygame with error handling
 try:
@@ -15,156 +26,34 @@ try:
 except pygame.error as e:
     print(f"Failed to initialize Pygame: {e}")
     sys.exit(1)
+mark_startup("pygame.init")
 
-# Game window and grid for blocks
-WINDOW_WIDTH = 840
-WINDOW_HEIGHT = 600
-BLOCK_SIZE = 30
-GOLD_CHANCE = 0.03
-GRID_SIZE = 50
-BASE_DIG_TIME = 10.0
-MOVEMENT_DELAY = 0.05
-
-# Mining time for different block types (seconds)
-DIRT_MINE_TIME = .5
-STONE_MINE_TIME = .75
-HARD_STONE_MINE_TIME = 1.5
-VERYHARD_STONE_MINE_TIME = 2
+from settings import (
+    WINDOW_WIDTH, WINDOW_HEIGHT, BLOCK_SIZE, SAVE_PATH, PROFILER_TRACE_PATH, IDLE_WAKE_INTERVAL,
+    SIMULATION_STEP, MAX_FRAME_TIME, LOADING_REDRAW_INTERVAL, AUTODIG_SEARCH_RADIUS, MINIMAP_RECT, OVERVIEW_RECT,
+    LIGHTING_ENABLED, FALLING_BLOCKS, BLACK, BLUE, SKY_BLUE, WHITE,
+)
+from simulation import Simulation, WorldLoader, StepInput, EVENT_ARTIFACT, EVENT_PURCHASE_OFFER
+from render_cache import TerrainCache
+from text_cache import TextCache
+from savegame import Autosaver, SaveError, MappedWorld, load_game
+from world import parse_seed
+from profiler import FrameProfiler
+from pathing import AutoDigger
+from minimap import Minimap
+from lighting import LightMap, LightOverlay
 
-# Color definitions
-BLACK = (0, 0, 0)
-DARKGRAY = (80, 80, 80)
-TAN = (115, 90, 50)
-BROWN = (100, 69, 19)
-GOLD = (255, 215, 0)
-BLUE = (0, 0, 255)
-SKY_BLUE = (135, 206, 235)
-GRAY = (96, 96, 96)
-RED = (255, 0, 0)
-GREEN = (10, 255, 10)
-WHITE = (255, 255, 255)
-
-# Depth thresholds for different types of blocks
-DEPTH_THRESHOLD = 20 # Depth where stone starts appearing more frequently
-DEPTH_THRESHOLD2 = 30 # Depth where very hard stone starts appearing
-
-class Player:
-    #Class representing the player character
-    # Initialize player position and stats
-    def __init__(self, x, y):
-        self.grid_x = x
-        self.grid_y = y + 3
-        self.score = 0
-        self.dig_time_remaining = BASE_DIG_TIME
-        self.bonus_time = 0
-        self.mining_target = None
-        self.mining_start_time = 0
-        self.moving_direction = None
-        self.mining_elapsed_time = 0
-        self.last_move_time = 0
-        self.blocks = {}
-        self.found_artifact = False
-        
-    #Start mining a block at the given position
-    def start_mining(self, block_pos, current_time, block_progress):
-        self.mining_target = block_pos
-        self.mining_start_time = current_time
-        self.mining_elapsed_time = block_progress * self.blocks[self.mining_target].get_mine_time()
-    
-    #Stop mining and reset mining-related variables
-    def stop_mining(self):
-        self.mining_target = None
-        self.moving_direction = None
-        self.mining_elapsed_time = 0
-    
-    #Get the coordinates of the block the player is trying to mine based on direction
-    def get_target_block(self):
-        if self.moving_direction == "RIGHT":
-            return (self.grid_x + 1, self.grid_y)
-        elif self.moving_direction == "LEFT":
-            return (self.grid_x - 1, self.grid_y)
-        elif self.moving_direction == "DOWN":
-            return (self.grid_x, self.grid_y + 1)
-        elif self.moving_direction == "UP":
-            return (self.grid_x, self.grid_y - 1)
-        return None
-        
-    #Move player to new coordinates within grid boundaries
-    def move_to(self, x, y):
-        self.grid_x = max(0, min(x, GRID_SIZE - 1))
-        self.grid_y = max(3, min(y, GRID_SIZE - 1))
-        
-    #Check if enough time has passed to allow movement
-    def can_move(self, current_time):
-        return current_time - self.last_move_time >= MOVEMENT_DELAY
+# Map display modes, cycled with M
+MAP_HIDDEN = 0
+MAP_MINIMAP = 1
+MAP_OVERVIEW = 2
+MAP_MODES = (MAP_HIDDEN, MAP_MINIMAP, MAP_OVERVIEW)
 
-    #Draw the player on the screen
-    def draw(self, screen, camera_x, camera_y):
-        screen_x = int(self.grid_x * BLOCK_SIZE - camera_x)
-        screen_y = int(self.grid_y * BLOCK_SIZE - camera_y)
-        pygame.draw.rect(screen, BLUE, (screen_x, screen_y, BLOCK_SIZE, BLOCK_SIZE))
+# Events after which the window contents have to be drawn again
+REDRAW_EVENTS = (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED)
 
-class Block:
-    #Class representing a single block in the game world
-    # Initialize block properties
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.is_gold = random.random() < GOLD_CHANCE
-        self.is_veryhard_stone = False
-        self.is_artifact = False
-        
-        # Determine block type based on depth
-        if y > DEPTH_THRESHOLD:
-            if not self.is_gold:
-                self.is_stone = True
-                self.is_hard_stone = random.random() < 0.2
-                if y > DEPTH_THRESHOLD2:
-                    self.is_veryhard_stone = random.random() < 0.7
-            else:
-                self.is_stone = False
-                self.is_hard_stone = False
-        else:
-            self.is_stone = random.random() < 0.2
-            self.is_hard_stone = False
-        self.is_dug = False
-        self.mining_progress = 0.0
-    
-    #Get the time required to mine this block based on its type
-    def get_mine_time(self):
-        if self.is_veryhard_stone:
-            return VERYHARD_STONE_MINE_TIME
-        elif self.is_hard_stone:
-            return HARD_STONE_MINE_TIME
-        elif self.is_stone:
-            return STONE_MINE_TIME
-        return DIRT_MINE_TIME
-    #Draw the block on the screen with appropriate color and mining progress
-    def draw(self, screen, camera_x, camera_y):
-        screen_x = self.x * BLOCK_SIZE - int(camera_x)
-        screen_y = self.y * BLOCK_SIZE - int(camera_y)
-        
-        # Only draw blocks that are visible on screen and color
-        if 0 <= screen_x <= WINDOW_WIDTH and 0 <= screen_y <= WINDOW_HEIGHT:
-            if not self.is_dug:
-                if self.is_artifact:
-                    color = GREEN
-                elif self.is_gold:
-                    color = GOLD
-                elif self.is_veryhard_stone:
-                    color = DARKGRAY
-                elif self.is_hard_stone:
-                    color = GRAY
-                elif self.is_stone:
-                    color = BROWN
-                else:
-                    color = TAN if self.y <= DEPTH_THRESHOLD else GRAY
-                pygame.draw.rect(screen, color, (screen_x, screen_y, BLOCK_SIZE, BLOCK_SIZE))
-                
-                # Draw mining progress overlay
-                if self.mining_progress > 0:
-                    progress_height = int(BLOCK_SIZE * self.mining_progress)
-                    pygame.draw.rect(screen, SKY_BLUE, (screen_x, screen_y, BLOCK_SIZE, progress_height))
+from replay import InputRecorder, ReplayError, RECORD_STEP, RECORD_RESET, DECODED_INPUTS, apply_record, verify
+mark_startup("import game modules")
 
 class Game:
     #Main game class handling game logic and rendering
@@ -180,12 +69,8 @@ class Game:
         dialog_surface.fill(WHITE)
         pygame.draw.rect(dialog_surface, BLACK, (0, 0, dialog_width, dialog_height), 2)
         
-        # Set up fonts
-        font = pygame.font.Font(None, 32)
-        title_font = pygame.font.Font(None, 48)
-        
         # Prepare text elements
-        title = title_font.render("Welcome to Gold Digger!", True, BLACK)
+        title = self.text_cache.render("Welcome to Gold Digger!", 48)
         message = [
             "Use the arrow keys to mine Gold.",
             "",
@@ -204,68 +89,162 @@ class Game:
         # Draw message lines
         y_offset = 70
         for line in message:
-            text = font.render(line, True, BLACK)
+            text = self.text_cache.render(line, 32)
             text_rect = text.get_rect(centerx=dialog_width//2, top=y_offset)
             dialog_surface.blit(text, text_rect)
             y_offset += 30
         
-        # Wait for user input
+        # Draw once, then sleep until a key press or the window needs repainting
+        redraw = True
         waiting = True
         while waiting:
-            for event in pygame.event.get():
+            if redraw:
+                self.screen.fill(SKY_BLUE)
+                self.screen.blit(dialog_surface, (dialog_x, dialog_y))
+                pygame.display.flip()
+                mark_startup("welcome dialog")
+                redraw = False
+            for event in self.wait_for_events():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     sys.exit()
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_RETURN:
                         waiting = False
-
-            self.screen.fill(SKY_BLUE)
-            self.screen.blit(dialog_surface, (dialog_x, dialog_y))
-            pygame.display.flip()
-            self.clock.tick(60)
+                elif event.type in REDRAW_EVENTS:
+                    redraw = True
     
-    # Initialize pygame and create game window
-    def __init__(self):
-        pygame.init()  # Initialize pygame again to ensure it's ready
+    # Create the game window. With record_path every input is written to a
+    # recording; replaying skips the save file and welcome dialog. A new world
+    # is generated in the background while the welcome dialog is up.
+    # falling_blocks turns on gravity for loose dirt and gold.
+    def __init__(self, seed=None, record_path=None, replaying=False, falling_blocks=FALLING_BLOCKS):
         self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        pygame.display.set_caption("Gold Digger")
+        mark_startup("window")
         
         # Initialize game components       
         self.clock = pygame.time.Clock()
-        self.starting_x = GRID_SIZE // 2
-        self.starting_y = 0
-        self.player = Player(self.starting_x, self.starting_y)
+        self.text_cache = TextCache()
+        self.profiler = FrameProfiler()
+        self.hud_values = None
+        self.pending_events = []
+        self.dialog_shown = False
+        self.map_mode = MAP_HIDDEN
+        self.lighting = LIGHTING_ENABLED
+        self.light = None
+        self.hud_surfaces = []
         self.camera_x = 0
         self.camera_y = 0
-        # Create game world
-        self.blocks = {}
-        self.create_world()
-        # Set up game state        
-        self.player.blocks = self.blocks
-        self.show_game_over = False
-        self.game_over_alpha = 0
-        self.popup_shown = False
+        self.next_world = None
+        # A recording starts from a fresh seeded world so it can be replayed
+        saved_game = None
+        if seed is None and record_path is None and os.path.exists(SAVE_PATH):
+            saved_game = self.load_saved_game()
+        self.loader = WorldLoader(seed) if saved_game is None else None
         
         # Show welcome dialog when game starts
-        self.show_welcome_dialog()
+        if not replaying:
+            self.show_welcome_dialog()
+        
+        # Create game world and rules
+        if saved_game is None:
+            world = self.wait_for_world(self.loader)
+            self.sim = Simulation(world=world, size=world.width, falling_blocks=falling_blocks)
+        else:
+            world, player_state = saved_game
+            self.sim = Simulation(world=world, size=world.width, falling_blocks=falling_blocks)
+            player_state.apply(self.player)
+        self.auto_digger = AutoDigger(self.sim)
+        self.attach_world()
+        mark_startup("world ready")
+        self.recorder = InputRecorder(record_path, self.sim) if record_path else None
+        self.autosaver = None
+        if replaying:
+            return
+        try:
+            self.autosaver = Autosaver(self.sim)
+        except SaveError as e:
+            print(f"Autosave disabled: {e}")
     
-    #Generate the game world with blocks
-    def create_world(self):
-        #Create regular blocks
-        for y in range(GRID_SIZE):
-            for x in range(GRID_SIZE):
-                if y > 3:
-                    self.blocks[(x, y)] = Block(x, y)
-
-        # Place the special artifact block near the bottom
-        artifact_y = GRID_SIZE - 2
-        artifact_x = GRID_SIZE // 6
-        self.blocks[(artifact_x, artifact_y)] = Block(artifact_x, artifact_y)
-        self.blocks[(artifact_x, artifact_y)].is_artifact = True
+    # The simulation owns the player and world, the front end only draws them
+    @property
+    def player(self):
+        return self.sim.player
+    
+    @property
+    def world(self):
+        return self.sim.world
+    
+    @property
+    def show_game_over(self):
+        return self.sim.show_game_over
+    
+    @property
+    def game_over_alpha(self):
+        return self.sim.game_over_alpha
+    
+    #Read the save file, returns (world, player state) or None to start a new world
+    def load_saved_game(self):
+        try:
+            return load_game(SAVE_PATH)
+        except (OSError, SaveError) as e:
+            print(f"Could not load {SAVE_PATH}: {e}")
+            return None
+    
+    #Return the loader's world once the area around the spawn point is
+    #generated, showing progress if that takes longer than the welcome dialog
+    def wait_for_world(self, loader):
+        world = loader.wait(0)
+        while world is None:
+            message = self.text_cache.render(f"Generating world... {loader.progress:.0%}", 36)
+            self.screen.fill(SKY_BLUE)
+            self.screen.blit(message, message.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2)))
+            pygame.display.flip()
+            for event in pygame.event.get(pygame.QUIT):
+                pygame.quit()
+                sys.exit()
+            world = loader.wait(LOADING_REDRAW_INTERVAL)
+        return world
+    
+    #The loader has generated the rest of the world. Views that were filled
+    #in while it ran are rebuilt from the finished terrain.
+    def world_loaded(self):
+        ores = self.loader.ores
+        self.loader = None
+        # A world built in one go was complete when the round started, so its index is too
+        if ores is not None:
+            ores.catch_up()
+            self.sim.ores.close()
+            self.sim.ores = ores
+        self.minimap.close()
+        self.minimap = Minimap(self.world)
+        self.attach_light()
+        self.redraw_needed = True
     
-    #Display dialog when player finds the artifact
+    #Set up rendering for the simulation's current world
+    def attach_world(self):
+        # Show the seed so a world can be reproduced from a bug report
+        pygame.display.set_caption(f"Gold Digger (seed {self.sim.seed})")
+        self.terrain_cache = TerrainCache(self.world)
+        self.minimap = Minimap(self.world)
+        self.attach_light()
+        self.auto_digger.cancel()
+        self.overlay_rects = []
+        self.redraw_needed = True
+        self.previous_position = None
+    
+    #Start lighting the current world from scratch
+    def attach_light(self):
+        if self.light is not None:
+            self.light.close()
+        self.light = LightMap(self.world)
+        self.light_overlay = LightOverlay(self.light)
+        self.terrain_cache.invalidate_view()
+    
+    #Display dialog when player finds the artifact. The next world is
+    #generated in the background while it is open.
     def show_artifact_dialog(self):
+        self.next_world = WorldLoader(size=self.sim.size, backend=self.sim.backend)
         dialog_width = 600
         dialog_height = 200
         dialog_x = (WINDOW_WIDTH - dialog_width) // 2
@@ -275,7 +254,6 @@ class Game:
         dialog_surface.fill(WHITE)
         pygame.draw.rect(dialog_surface, BLACK, (0, 0, dialog_width, dialog_height), 2)
 
-        font = pygame.font.Font(None, 24)
         message = [
             "You found where the Alien Artifact lives!",
             "You saw how it looks like and became self actualized.",
@@ -286,24 +264,27 @@ class Game:
 
         y_offset = 30
         for line in message:
-            text = font.render(line, True, BLACK)
+            text = self.text_cache.render(line, 24)
             text_rect = text.get_rect(centerx=dialog_width//2, top=y_offset)
             dialog_surface.blit(text, text_rect)
             y_offset += 30
 
+        redraw = True
         waiting = True
         while waiting:
-            for event in pygame.event.get():
+            if redraw:
+                self.screen.blit(dialog_surface, (dialog_x, dialog_y))
+                pygame.display.flip()
+                redraw = False
+            for event in self.wait_for_events():
                 if event.type == pygame.QUIT:
                     return False
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_RETURN:
                         self.reset_game()
                         waiting = False
-
-            self.screen.blit(dialog_surface, (dialog_x, dialog_y))
-            pygame.display.flip()
-            self.clock.tick(60)
+                elif event.type in REDRAW_EVENTS:
+                    redraw = True
 
         return True
     
@@ -318,19 +299,49 @@ class Game:
         input_active = True
         dialog_done = False
         
+        # Static parts of the dialog are drawn once, only the gold and input lines change
+        dialog_background = pygame.Surface((dialog_width, dialog_height))
+        dialog_background.fill(WHITE)
+        pygame.draw.rect(dialog_background, BLACK, (0, 0, dialog_width, dialog_height), 2)
+        title_text = self.text_cache.render("Increase Drill Bit Durability?", 36)
+        info_text = self.text_cache.render("$100 Gold = +1% Durability", 36)
+        input_prompt = self.text_cache.render("Enter gold amount:", 36)
+        confirm_text = self.text_cache.render("Press Enter to confirm", 36)
+        cancel_text = self.text_cache.render("Press Esc to cancel", 36)
+        dialog_background.blit(title_text, (dialog_width//2 - title_text.get_width()//2, 20))
+        dialog_background.blit(info_text, (dialog_width//2 - info_text.get_width()//2, 100))
+        dialog_background.blit(input_prompt, (20, 140))
+        dialog_background.blit(confirm_text, (dialog_width//2 - confirm_text.get_width()//2, 210))
+        dialog_background.blit(cancel_text, (dialog_width//2 - cancel_text.get_width()//2, 230))
+        dialog_surface = dialog_background.copy()
+        
+        # Redraw only after the input changed or the window needs repainting
+        redraw = True
         while not dialog_done:
-            for event in pygame.event.get():
+            if redraw:
+                dialog_surface.blit(dialog_background, (0, 0))
+                cost_text = self.text_cache.render(f"Current Gold: {self.player.score}", 36)
+                input_display = self.text_cache.render(input_text + "|" if input_active else input_text, 36)
+                dialog_surface.blit(cost_text, (dialog_width//2 - cost_text.get_width()//2, 60))
+                dialog_surface.blit(input_display, (20, 180))
+                
+                self.screen.blit(dialog_surface, (dialog_x, dialog_y))
+                pygame.display.flip()
+                redraw = False
+            
+            for event in self.wait_for_events():
                 if event.type == pygame.QUIT:
                     return False
+                elif event.type in REDRAW_EVENTS:
+                    redraw = True
                 elif event.type == pygame.KEYDOWN:
+                    redraw = True
                     if event.key == pygame.K_RETURN:
                         try:
                             gold_to_spend = int(input_text) if input_text else 0
-                            if 0 <= gold_to_spend <= self.player.score:
-                                seconds_to_buy = gold_to_spend // 100
-                                if seconds_to_buy > 0:
-                                    self.player.bonus_time += seconds_to_buy
-                                    self.player.score -= seconds_to_buy * 100
+                            if self.sim.buy_durability(gold_to_spend):
+                                if self.recorder:
+                                    self.recorder.record_purchase(gold_to_spend)
                                 dialog_done = True
                         except ValueError:
                             pass
@@ -340,56 +351,88 @@ class Game:
                         input_text = input_text[:-1]
                     elif event.unicode.isdigit():
                         input_text += event.unicode
-
-            dialog_surface = pygame.Surface((dialog_width, dialog_height))
-            dialog_surface.fill(WHITE)
-            pygame.draw.rect(dialog_surface, BLACK, (0, 0, dialog_width, dialog_height), 2)
-            
-            font = pygame.font.Font(None, 36)
-            title_text = font.render("Increase Drill Bit Durability?", True, BLACK)
-            cost_text = font.render(f"Current Gold: {self.player.score}", True, BLACK)
-            info_text = font.render("$100 Gold = +1% Durability", True, BLACK)
-            input_prompt = font.render("Enter gold amount:", True, BLACK)
-            input_display = font.render(input_text + "|" if input_active else input_text, True, BLACK)
-            confirm_text = font.render("Press Enter to confirm", True, BLACK)
-            cancel_text = font.render("Press Esc to cancel", True, BLACK)
-            
-            dialog_surface.blit(title_text, (dialog_width//2 - title_text.get_width()//2, 20))
-            dialog_surface.blit(cost_text, (dialog_width//2 - cost_text.get_width()//2, 60))
-            dialog_surface.blit(info_text, (dialog_width//2 - info_text.get_width()//2, 100))
-            dialog_surface.blit(input_prompt, (20, 140))
-            dialog_surface.blit(input_display, (20, 180))
-            dialog_surface.blit(confirm_text, (dialog_width//2 - confirm_text.get_width()//2, 210))
-            dialog_surface.blit(cancel_text, (dialog_width//2 - cancel_text.get_width()//2, 230))
-            
-            self.screen.blit(dialog_surface, (dialog_x, dialog_y))
-            pygame.display.flip()
-            self.clock.tick(60)
         
         return True
     
-    #Reset game state to initial conditions
+    #Reset game state to initial conditions in a new world
     def reset_game(self):
-        self.player = Player(self.starting_x, self.starting_y)
-        self.create_world()
-        self.player.blocks = self.blocks
-        self.show_game_over = False
-        self.game_over_alpha = 0
-        self.popup_shown = False
+        self.loader = self.next_world or WorldLoader(size=self.sim.size, backend=self.sim.backend)
+        self.next_world = None
+        previous = self.sim.world
+        self.sim.start(self.wait_for_world(self.loader))
+        if self.recorder:
+            self.recorder.record_reset(self.sim.seed)
+        self.attach_world()
+        # A world loaded from the save keeps the file mapped until it is
+        # replaced. A save still queued may read from it, so let those finish first.
+        if isinstance(previous, MappedWorld):
+            if self.autosaver:
+                self.autosaver.jobs.join()
+            previous.close()
 
+    #Where to draw the player, blended between its positions before and after
+    #the last simulation step by alpha
+    def player_draw_position(self, alpha):
+        x, y = self.player.grid_x, self.player.grid_y
+        if self.previous_position is None or alpha >= 1.0:
+            return x, y
+        previous_x, previous_y = self.previous_position
+        # Only blend single-cell moves, anything else is a teleport or a new round
+        if abs(x - previous_x) + abs(y - previous_y) != 1:
+            return x, y
+        return previous_x + (x - previous_x) * alpha, previous_y + (y - previous_y) * alpha
+    
     #Update camera position to follow player
-    def update_camera(self):
-        self.camera_x = self.player.grid_x * BLOCK_SIZE - WINDOW_WIDTH // 2
-        self.camera_y = self.player.grid_y * BLOCK_SIZE - WINDOW_HEIGHT // 2
-        self.camera_x = max(0, min(self.camera_x, GRID_SIZE * BLOCK_SIZE - WINDOW_WIDTH))
-        self.camera_y = max(0, min(self.camera_y, GRID_SIZE * BLOCK_SIZE - WINDOW_HEIGHT))
+    def update_camera(self, player_x, player_y):
+        self.camera_x = int(player_x * BLOCK_SIZE) - WINDOW_WIDTH // 2
+        self.camera_y = int(player_y * BLOCK_SIZE) - WINDOW_HEIGHT // 2
+        self.camera_x = max(0, min(self.camera_x, self.world.width * BLOCK_SIZE - WINDOW_WIDTH))
+        self.camera_y = max(0, min(self.camera_y, self.world.height * BLOCK_SIZE - WINDOW_HEIGHT))
+        
+        # Keep the world loaded around both the player and the middle of the view
+        camera_center = (
+            int(self.camera_x + WINDOW_WIDTH // 2) // BLOCK_SIZE,
+            int(self.camera_y + WINDOW_HEIGHT // 2) // BLOCK_SIZE,
+        )
+        self.world.update_focus(((self.player.grid_x, self.player.grid_y), camera_center))
+    
+    #Draw the player on the screen
+    def draw_player(self, player_x, player_y):
+        screen_x = int(player_x * BLOCK_SIZE) - self.camera_x
+        screen_y = int(player_y * BLOCK_SIZE) - self.camera_y
+        return pygame.draw.rect(self.screen, BLUE, (screen_x, screen_y, BLOCK_SIZE, BLOCK_SIZE))
+    
+    #Draw the score and drill readouts, re-rendering them only when a value changes
+    def draw_hud(self):
+        hud_values = (self.player.score, f'{self.player.dig_time_remaining:.1f}', self.player.bonus_time)
+        if hud_values != self.hud_values:
+            self.hud_values = hud_values
+            score, durability, bonus = hud_values
+            self.hud_surfaces = [
+                self.text_cache.render(f'Gold: ${score}', 36),
+                self.text_cache.render(f'Drill bit condition: {durability}%', 36),
+                self.text_cache.render(f'Bonus Durability: {bonus}%', 36),
+            ]
+        return [self.screen.blit(surface, (10, 10 + 40 * line)) for line, surface in enumerate(self.hud_surfaces)]
+    
+    #Draw the minimap around the player, or the overview of the whole world
+    def draw_map(self):
+        player_position = (self.player.grid_x, self.player.grid_y)
+        if self.map_mode == MAP_MINIMAP:
+            return self.minimap.draw(self.screen, MINIMAP_RECT, *player_position, 0, player_position)
+        width, height = OVERVIEW_RECT[2], OVERVIEW_RECT[3]
+        level = self.minimap.fitting_level(width, height)
+        if self.world.width >> level <= width and self.world.height >> level <= height:
+            center = (self.world.width // 2, self.world.height // 2)
+        else:
+            center = player_position
+        return self.minimap.draw(self.screen, OVERVIEW_RECT, *center, level, player_position)
     
     #Display popup message when drill bit breaks
     def draw_game_over_message(self):
         if self.show_game_over:
-            font = pygame.font.Font(None, 48)
-            text1 = font.render("Your drill bit broke!", True, BLACK)
-            text2 = font.render("Resurface to get a new one.", True, BLACK)
+            text1 = self.text_cache.render("Your drill bit broke!", 48)
+            text2 = self.text_cache.render("Resurface to get a new one.", 48)
             
             padding = 20
             max_text_width = max(text1.get_width(), text2.get_width())
@@ -408,128 +451,271 @@ class Game:
             text_surface.blit(text1, text1_rect)
             text_surface.blit(text2, text2_rect)
             
-            self.screen.blit(text_surface, (rect_x, rect_y))
+            return self.screen.blit(text_surface, (rect_x, rect_y))
     
-    #Main game loop
+    #Main game loop. The simulation advances in fixed SIMULATION_STEP ticks
+    #taken from an accumulator of real time, so frame rate and hitches don't
+    #change how fast blocks are mined or how quickly the drill wears down.
     def run(self):
         running = True
-        last_time = time.time()
+        accumulator = 0.0
+        release_pending = False
+        last_time = time.perf_counter()
+
+        profiler = self.profiler
 
         while running:
-            current_time = time.time()
-            delta_time = current_time - last_time
+            current_time = time.perf_counter()
+            # A long stall is dropped rather than caught up on, so a slow frame
+            # can't snowball into ever more steps per frame
+            accumulator += min(current_time - last_time, MAX_FRAME_TIME)
             last_time = current_time
 
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                elif event.type == pygame.KEYUP:
-                    if self.player.mining_target:
-                        block = self.blocks[self.player.mining_target]
-                        block.mining_progress = min(self.player.mining_elapsed_time / block.get_mine_time(), 1.0)
-                    self.player.stop_mining()
-            
-            keys = pygame.key.get_pressed()
-            if not self.show_game_over:
-                if keys[pygame.K_RIGHT]:
-                    self.player.moving_direction = "RIGHT"
-                elif keys[pygame.K_LEFT]:
-                    self.player.moving_direction = "LEFT"
-                elif keys[pygame.K_DOWN]:
-                    self.player.moving_direction = "DOWN"
-                elif keys[pygame.K_UP]:
-                    self.player.moving_direction = "UP"
-            
-            if self.player.moving_direction:
-                target_pos = self.player.get_target_block()
-                
-                if target_pos in self.blocks:
-                    block = self.blocks[target_pos]
-                    if not block.is_dug:
-                        if self.player.dig_time_remaining > 0:
-                            if block.is_artifact:
-                                block.is_dug = True
-                                self.show_artifact_dialog()
-                                continue
-                                
-                            if self.player.mining_target != target_pos:
-                                self.player.start_mining(target_pos, current_time, block.mining_progress)
-                            
-                            self.player.mining_elapsed_time += delta_time
-                            mine_time = block.get_mine_time()
-                            block.mining_progress = min(self.player.mining_elapsed_time / mine_time, 1.0)
-                            
-                            self.player.dig_time_remaining -= delta_time
-                            
-                            if block.mining_progress >= 1.0:
-                                block.is_dug = True
-                                if block.is_gold:
-                                    self.player.score += 100
-                                self.player.move_to(target_pos[0], target_pos[1])
-                                self.player.stop_mining()
-                    elif block.is_dug and self.player.can_move(current_time):
-                        self.player.move_to(target_pos[0], target_pos[1])
-                        self.player.last_move_time = current_time
-                        self.player.stop_mining()
-                elif target_pos not in self.blocks and self.player.can_move(current_time):
-                    self.player.move_to(target_pos[0], target_pos[1])
-                    self.player.last_move_time = current_time
-                    self.player.stop_mining()
-            
-            # Handle game over state
-            if self.player.dig_time_remaining <= 0 and not self.show_game_over and not self.popup_shown:
-                self.show_game_over = True
-                self.game_over_alpha = 0
-                
-            if self.show_game_over:
-                self.game_over_alpha = min(self.game_over_alpha + 5, 255)
-                if self.game_over_alpha >= 255 and not self.popup_shown:
-                    self.popup_shown = True
-                    self.show_purchase_dialog()
-                    self.show_game_over = False
-            
-            # Reset game state when reaching surface
-            if self.player.grid_y == 3 and (self.popup_shown or self.show_game_over):
-                self.player.dig_time_remaining = BASE_DIG_TIME + self.player.bonus_time
-                self.player.stop_mining()
-                self.show_game_over = False
-                self.game_over_alpha = 0
-                self.popup_shown = False  # Reset for next round
-            
-            self.update_camera()
-            self.screen.fill(SKY_BLUE)
-            
-            # Draw blocks and player
-            start_x = max(0, int(self.camera_x // BLOCK_SIZE - 1))
-            end_x = min(GRID_SIZE, int((self.camera_x + WINDOW_WIDTH) // BLOCK_SIZE + 1))
-            start_y = max(0, int(self.camera_y // BLOCK_SIZE - 1))
-            end_y = min(GRID_SIZE, int((self.camera_y + WINDOW_HEIGHT) // BLOCK_SIZE + 1))
-            
-            for y in range(start_y, end_y):
-                for x in range(start_x, end_x):
-                    if (x, y) in self.blocks:
-                        self.blocks[(x, y)].draw(self.screen, self.camera_x, self.camera_y)
-            
-            self.player.draw(self.screen, self.camera_x, self.camera_y)
-            
-            # Draw UI
-            font = pygame.font.Font(None, 36)
-            score_text = font.render(f'Gold: ${self.player.score}', True, BLACK)
-            time_text = font.render(f'Drill bit condition: {self.player.dig_time_remaining:.1f}%', True, BLACK)
-            bonus_text = font.render(f'Bonus Durability: {self.player.bonus_time}%', True, BLACK)
-            self.screen.blit(score_text, (10, 10))
-            self.screen.blit(time_text, (10, 50))
-            self.screen.blit(bonus_text, (10, 90))
+            profiler.begin_frame()
+            if self.loader is not None and self.loader.finished.is_set():
+                # A world built right away is already complete, nothing to refill
+                if self.loader.thread is not None:
+                    self.world_loaded()
+                else:
+                    self.loader = None
+            running, inputs = self.read_input()
+            # A key release must reach the simulation even if no step runs this frame
+            if release_pending:
+                inputs = StepInput(inputs.direction, True)
+            profiler.mark("events")
             
-            if self.show_game_over:
-                self.draw_game_over_message()
+            # Nothing will change until the player presses a key, so sleep on the
+            # event queue instead of drawing identical frames
+            if running and self.is_idle(inputs):
+                if self.redraw_needed:
+                    self.render()
+                if self.autosaver:
+                    self.autosaver.update()
+                self.pending_events = self.wait_for_events(int(IDLE_WAKE_INTERVAL * 1000))
+                # Time spent asleep is not play time
+                last_time = time.perf_counter()
+                accumulator = 0.0
+                continue
             
-            pygame.display.flip()
+            draw_frame = True
+            release_pending = inputs.released
+            while accumulator >= SIMULATION_STEP:
+                accumulator -= SIMULATION_STEP
+                step_inputs = inputs
+                # Auto-dig steers whenever no arrow key is held
+                if self.auto_digger.active and inputs.direction is None:
+                    auto_inputs = self.auto_digger.next_input()
+                    step_inputs = StepInput(auto_inputs.direction, auto_inputs.released or inputs.released)
+                draw_frame = self.advance(step_inputs, SIMULATION_STEP)
+                inputs = StepInput(inputs.direction, False)
+                release_pending = False
+                # Time spent in a dialog is not play time either
+                if self.dialog_shown:
+                    self.dialog_shown = False
+                    last_time = time.perf_counter()
+                    accumulator = 0.0
+                if not draw_frame:
+                    break
+            profiler.mark("simulation")
+            if draw_frame:
+                self.render(accumulator / SIMULATION_STEP)
+                mark_startup("first frame")
+            if self.autosaver:
+                self.autosaver.update()
+            profiler.mark("autosave")
             self.clock.tick(60)
+            profiler.mark("idle")
+            profiler.end_frame()
         
+        if self.autosaver:
+            # The last save needs the whole world, which the loader may still be filling in
+            if self.loader is not None:
+                self.loader.finished.wait()
+            self.autosaver.close()
+        if self.recorder:
+            self.recorder.close()
+        pygame.quit()
+    
+    #Show a recorded session at the speed it was played, skipping its dialogs
+    def play_recording(self, recording):
+        self.sim = recording.new_simulation()
+        self.attach_world()
+        self.render()
+        expected = None
+        next_frame = time.perf_counter()
+        for tag, values in recording.records():
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                break
+            if tag != RECORD_STEP:
+                expected = apply_record(self.sim, tag, values) or expected
+                if tag == RECORD_RESET:
+                    self.attach_world()
+                continue
+            
+            events = self.sim.step(DECODED_INPUTS[values[0]], values[1])
+            # The next record starts the new round after the artifact dialog
+            if EVENT_ARTIFACT in events:
+                continue
+            if EVENT_PURCHASE_OFFER in events:
+                self.terrain_cache.invalidate_view()
+            self.render()
+            next_frame += values[1]
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+        else:
+            try:
+                verify(self.sim, expected)
+                print("Replay finished, final state matches the recording.")
+            except ReplayError as e:
+                print(e)
         pygame.quit()
+    
+    #Block until an event arrives or timeout_ms passes (0 waits forever), returns the events
+    def wait_for_events(self, timeout_ms=0):
+        event = pygame.event.wait(timeout_ms)
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+    
+    #True when stepping the simulation would change nothing on screen: no key
+    #held or released, no block being mined or falling and no animation playing
+    def is_idle(self, inputs):
+        return (inputs.direction is None and not inputs.released
+                and self.player.moving_direction is None
+                and not self.sim.show_game_over and not self.profiler.enabled
+                and not self.auto_digger.active
+                and not (self.sim.physics is not None and self.sim.physics.active)
+                and not (self.map_mode != MAP_HIDDEN and self.minimap.incomplete))
+    
+    #Poll pygame for this frame's input, returns (keep running, StepInput)
+    def read_input(self):
+        running = True
+        key_released = False
+        events = self.pending_events + pygame.event.get()
+        self.pending_events = []
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYUP:
+                key_released = True
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle()
+                    self.redraw_needed = True
+                elif event.key == pygame.K_F4 and self.profiler.frames_recorded:
+                    count = self.profiler.export_chrome_trace(PROFILER_TRACE_PATH)
+                    print(f"Wrote {count} trace events to {PROFILER_TRACE_PATH}")
+                elif event.key == pygame.K_m:
+                    self.map_mode = (self.map_mode + 1) % len(MAP_MODES)
+                    self.redraw_needed = True
+                elif event.key == pygame.K_l:
+                    self.lighting = not self.lighting
+                    self.light_overlay.origin = None
+                    self.terrain_cache.invalidate_view()
+                    self.redraw_needed = True
+                elif event.key == pygame.K_g:
+                    player = self.player
+                    self.auto_digger.start(self.sim.ores.nearest(
+                        player.grid_x, player.grid_y, max_distance=AUTODIG_SEARCH_RADIUS))
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                # Auto-dig to the clicked cell
+                mouse_x, mouse_y = event.pos
+                self.auto_digger.start(((mouse_x + self.camera_x) // BLOCK_SIZE, (mouse_y + self.camera_y) // BLOCK_SIZE))
+            elif event.type in REDRAW_EVENTS:
+                self.terrain_cache.invalidate_view()
+                self.redraw_needed = True
+        
+        keys = pygame.key.get_pressed()
+        direction = None
+        if keys[pygame.K_RIGHT]:
+            direction = "RIGHT"
+        elif keys[pygame.K_LEFT]:
+            direction = "LEFT"
+        elif keys[pygame.K_DOWN]:
+            direction = "DOWN"
+        elif keys[pygame.K_UP]:
+            direction = "UP"
+        if direction is not None:
+            self.auto_digger.cancel()
+        return running, StepInput(direction, key_released)
+    
+    #Step the simulation and open any dialogs it asks for. Returns False when
+    #the frame should not be drawn because the world was just replaced.
+    def advance(self, inputs, delta_time):
+        if self.recorder:
+            self.recorder.record_step(inputs, delta_time)
+        self.previous_position = (self.player.grid_x, self.player.grid_y)
+        events = self.sim.step(inputs, delta_time)
+        if EVENT_ARTIFACT in events:
+            self.show_artifact_dialog()
+            self.dialog_shown = True
+            return False
+        if EVENT_PURCHASE_OFFER in events:
+            self.show_purchase_dialog()
+            self.dialog_shown = True
+            self.terrain_cache.invalidate_view()
+        return True
+    
+    #Draw the frame and push only the changed parts of the screen. alpha is how
+    #far real time has run past the last simulation step, as a fraction of a step.
+    def render(self, alpha=1.0):
+        profiler = self.profiler
+        player_x, player_y = self.player_draw_position(alpha)
+        # A blended frame has to be followed by one at the real position
+        self.redraw_needed = (player_x, player_y) != (self.player.grid_x, self.player.grid_y)
+        self.update_camera(player_x, player_y)
+        
+        # Cells whose light changed are repainted with the terrain and shaded again
+        if self.lighting:
+            self.light.move_lamp(self.player.grid_x, self.player.grid_y)
+            for x, y in self.light_overlay.update(self.camera_x, self.camera_y):
+                self.terrain_cache.mark_dirty(x, y)
+        
+        # Repaint changed terrain from the cache, restoring what was drawn over it last frame
+        dirty_rects = self.terrain_cache.draw(self.screen, self.camera_x, self.camera_y, self.overlay_rects)
+        profiler.mark("terrain")
+        if self.lighting:
+            self.light_overlay.draw(self.screen, self.camera_x, self.camera_y, dirty_rects)
+            profiler.mark("lighting")
+        
+        self.overlay_rects = [self.draw_player(player_x, player_y)]
+        
+        # Draw UI
+        self.overlay_rects.extend(self.draw_hud())
+        
+        if self.show_game_over:
+            self.overlay_rects.append(self.draw_game_over_message())
+        
+        if self.map_mode != MAP_HIDDEN:
+            self.overlay_rects.append(self.draw_map())
+        
+        if profiler.enabled:
+            self.overlay_rects.append(profiler.draw_overlay(self.screen, self.text_cache))
+        profiler.mark("hud")
+        
+        pygame.display.update(dirty_rects + self.overlay_rects)
+        profiler.mark("display")
 
 #Start the game when the script is run
 if __name__ == "__main__":
-    game = Game()
-    game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Play Gold Digger.")
+    parser.add_argument("seed", type=parse_seed, nargs="?", help="World seed, continues the saved game if omitted")
+    parser.add_argument("--record", metavar="PATH", help="Record every input for replay.py")
+    parser.add_argument("--falling-blocks", action="store_true", default=FALLING_BLOCKS,
+                        help="Let loose dirt and gold fall into dug cells below them")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="Skip the welcome dialog, draw the first frame, print how long each startup phase took and exit")
+    args = parser.parse_args()
+    if args.startup_time:
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RETURN, unicode="\r"))
+    game = Game(args.seed, record_path=args.record, falling_blocks=args.falling_blocks)
+    if args.startup_time:
+        game.render()
+        mark_startup("first frame")
+        for (_, previous), (phase, finished) in zip(startup_marks, startup_marks[1:]):
+            print(f"{phase}: {(finished - previous) * 1000:.1f} ms")
+        print(f"total: {(startup_marks[-1][1] - startup_marks[0][1]) * 1000:.1f} ms")
+        if game.autosaver:
+            game.autosaver.close()
+        pygame.quit()
+    else:
+        game.run()
\ No newline at end of file
@@ -0,0 +1,271 @@
+#Batch simulation runner for balance statistics. Runs many seeded worlds
+#with a scripted, greedy or artifact-hunting digging policy across a process
+#pool and streams one row of metrics per run to CSV or JSON lines as soon as
+#it finishes. A run plays until the artifact is found or --max-time runs out:
+#whenever the drill breaks the player climbs back to the surface for a new
+#drill bit, optionally spending its gold on durability first.
+#
+#Usage: python batch.py --runs 5000 --policy greedy --output runs.csv
+#       python batch.py --runs 1000 --policy artifact --buy-durability
+#       python batch.py --runs 1000 --set GOLD_CHANCE=0.05 --set BASE_DIG_TIME=15
+
+import argparse
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from collections import deque
+
+import settings
+import simulation
+import world
+from settings import SURFACE_ROW
+from simulation import (
+    Simulation, StepInput, NO_INPUT, DURABILITY_PRICE,
+    EVENT_GOLD, EVENT_ARTIFACT, EVENT_DRILL_BROKE, EVENT_PURCHASE_OFFER,
+)
+
+STEP_TIME = 1 / 60
+DEFAULT_MAX_TIME = 600.0 # Simulated seconds before a run is cut off
+GREEDY_SEARCH_RADIUS = 8 # How far the greedy policy looks for gold
+
+# Settings that can be overridden with --set
+TUNABLE_SETTINGS = (
+    "GOLD_CHANCE", "BASE_DIG_TIME", "MOVEMENT_DELAY",
+    "DIRT_MINE_TIME", "STONE_MINE_TIME", "HARD_STONE_MINE_TIME", "VERYHARD_STONE_MINE_TIME",
+    "DEPTH_THRESHOLD", "DEPTH_THRESHOLD2", "GRID_SIZE",
+)
+INTEGER_SETTINGS = ("DEPTH_THRESHOLD", "DEPTH_THRESHOLD2", "GRID_SIZE")
+
+METRIC_FIELDS = (
+    "seed", "policy", "gold_collected", "score", "durability_spent", "drills_broken", "max_depth",
+    "artifact_found", "time_to_artifact", "sim_time", "steps",
+)
+MOVES = ((0, -1, "UP"), (1, 0, "RIGHT"), (-1, 0, "LEFT"), (0, 1, "DOWN"))
+
+#Apply setting overrides in this process, the modules copy settings at import time
+def apply_tuning(overrides):
+    for name, value in overrides.items():
+        if name not in TUNABLE_SETTINGS:
+            raise ValueError(f"Unknown tunable setting: {name}")
+        for module in (settings, world, simulation):
+            if hasattr(module, name):
+                setattr(module, name, value)
+    world.MINE_TIMES = (
+        0.0,
+        world.DIRT_MINE_TIME,
+        world.STONE_MINE_TIME,
+        world.HARD_STONE_MINE_TIME,
+        world.VERYHARD_STONE_MINE_TIME,
+        world.DIRT_MINE_TIME,
+        world.STONE_MINE_TIME,
+        world.DIRT_MINE_TIME,
+    )
+
+class ScriptedPolicy:
+    #Repeats a fixed pattern of moves, e.g. "DDDRRDDLL"
+    def __init__(self, pattern="D"):
+        directions = {"R": "RIGHT", "L": "LEFT", "D": "DOWN", "U": "UP"}
+        self.moves = [StepInput(directions[letter], False) for letter in pattern.upper()]
+        self.index = 0
+        self.last_position = None
+
+    def choose(self, sim):
+        player = sim.player
+        position = (player.grid_x, player.grid_y)
+        if self.last_position is not None and position != self.last_position:
+            self.index = (self.index + 1) % len(self.moves)
+        self.last_position = position
+        return self.moves[self.index]
+
+class GreedyPolicy:
+    #Heads for the nearest gold within a search radius, otherwise digs down
+    def __init__(self, radius=GREEDY_SEARCH_RADIUS):
+        self.radius = radius
+
+    #Find the closest undug gold block within the search radius by Manhattan distance
+    def nearest_gold(self, sim):
+        return sim.ores.nearest(sim.player.grid_x, sim.player.grid_y, max_distance=self.radius)
+
+    def choose(self, sim):
+        player = sim.player
+        if player.mining_target is not None:
+            return StepInput(player.moving_direction, False)
+        target = self.nearest_gold(sim)
+        if target is None:
+            if player.grid_y < sim.world.height - 1:
+                return StepInput("DOWN", False)
+            return StepInput("RIGHT" if player.grid_x < sim.world.width - 1 else "LEFT", False)
+        target_x, target_y = target
+        if target_x > player.grid_x:
+            return StepInput("RIGHT", False)
+        if target_x < player.grid_x:
+            return StepInput("LEFT", False)
+        return StepInput("DOWN" if target_y > player.grid_y else "UP", False)
+
+class ArtifactPolicy:
+    #Walks along the surface to the artifact's column and digs straight down
+    #to it. After a drill breaks the shaft leads straight back down.
+    def choose(self, sim):
+        player = sim.player
+        artifact = sim.ores.artifact()
+        if artifact is None:
+            return NO_INPUT
+        artifact_x = artifact[0]
+        if player.grid_x == artifact_x:
+            return StepInput("DOWN", False)
+        if player.grid_y > SURFACE_ROW:
+            return StepInput("UP", False)
+        return StepInput("RIGHT" if artifact_x > player.grid_x else "LEFT", False)
+
+def make_policy(name, pattern):
+    if name == "greedy":
+        return GreedyPolicy()
+    if name == "scripted":
+        return ScriptedPolicy(pattern)
+    if name == "artifact":
+        return ArtifactPolicy()
+    raise ValueError(f"Unknown policy: {name}")
+
+#Direction of the first step on the shortest walk to the surface through open
+#cells, which a broken drill can always take back the way it came. Blocks that
+#fell into the tunnel can be dug by hand, so they count as open.
+def surface_direction(sim):
+    world = sim.world
+    physics = sim.physics
+    player = sim.player
+    start = (player.grid_x, player.grid_y)
+    first_steps = {start: None}
+    queue = deque((start,))
+    while queue:
+        x, y = queue.popleft()
+        if y <= SURFACE_ROW:
+            return first_steps[(x, y)]
+        for offset_x, offset_y, direction in MOVES:
+            cell = (x + offset_x, y + offset_y)
+            if cell in first_steps or not world.in_bounds(*cell):
+                continue
+            if not (cell not in world or world.is_dug(*cell) or (physics is not None and physics.has_landed(*cell))):
+                continue
+            first_steps[cell] = first_steps[(x, y)] or direction
+            queue.append(cell)
+    return None
+
+#Play a seeded world until the artifact is found or max_time runs out and
+#return the run's metrics
+def run_one(task):
+    seed, policy_name, pattern, max_time, buy_durability = task
+    sim = Simulation(seed=seed, size=settings.GRID_SIZE)
+    policy = make_policy(policy_name, pattern)
+    max_depth = sim.player.grid_y
+    gold_collected = 0
+    durability_spent = 0.0
+    drills_broken = 0
+    time_to_artifact = None
+
+    while sim.time < max_time:
+        player = sim.player
+        if player.dig_time_remaining > 0:
+            inputs = policy.choose(sim)
+        else:
+            inputs = StepInput(surface_direction(sim), False)
+        durability = max(player.dig_time_remaining, 0.0)
+        events = sim.step(inputs, STEP_TIME)
+        durability_spent += max(durability - max(player.dig_time_remaining, 0.0), 0.0)
+        max_depth = max(max_depth, player.grid_y)
+        if events:
+            if EVENT_GOLD in events:
+                gold_collected += 1
+            if EVENT_ARTIFACT in events:
+                time_to_artifact = sim.time
+                break
+            if EVENT_DRILL_BROKE in events:
+                drills_broken += 1
+            if EVENT_PURCHASE_OFFER in events and buy_durability:
+                sim.buy_durability(player.score // DURABILITY_PRICE * DURABILITY_PRICE)
+
+    return {
+        "seed": seed,
+        "policy": policy_name,
+        "gold_collected": gold_collected,
+        "score": sim.player.score,
+        "durability_spent": round(durability_spent, 4),
+        "drills_broken": drills_broken,
+        "max_depth": max_depth,
+        "artifact_found": time_to_artifact is not None,
+        "time_to_artifact": "" if time_to_artifact is None else round(time_to_artifact, 4),
+        "sim_time": round(sim.time, 4),
+        "steps": sim.steps,
+    }
+
+class CsvWriter:
+    #Streams metric rows to a CSV file
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, fieldnames=METRIC_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+class JsonLinesWriter:
+    #Streams metric rows as one JSON object per line
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps(row) + "\n")
+
+#Run every task across a process pool, writing rows in completion order
+def run_batch(tasks, writer, workers=None, overrides=None, chunksize=8):
+    overrides = overrides or {}
+    if workers == 1:
+        apply_tuning(overrides)
+        for row in map(run_one, tasks):
+            writer.write(row)
+        return
+    with multiprocessing.Pool(workers, initializer=apply_tuning, initargs=(overrides,)) as pool:
+        for row in pool.imap_unordered(run_one, tasks, chunksize=chunksize):
+            writer.write(row)
+
+#Parse a NAME=VALUE override into the setting's type
+def parse_override(text):
+    name, _, value = text.partition("=")
+    if name not in TUNABLE_SETTINGS:
+        raise argparse.ArgumentTypeError(f"{name} is not tunable, choose from {', '.join(TUNABLE_SETTINGS)}")
+    try:
+        return name, int(value) if name in INTEGER_SETTINGS else float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Bad value for {name}: {value}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run seeded Gold Digger simulations in parallel.")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="First world seed, runs use consecutive seeds")
+    parser.add_argument("--policy", choices=("greedy", "scripted", "artifact"), default="greedy")
+    parser.add_argument("--pattern", default="DDDDRRRRDDDDLLLL", help="Move pattern for the scripted policy")
+    parser.add_argument("--max-time", type=float, default=DEFAULT_MAX_TIME)
+    parser.add_argument("--buy-durability", action="store_true",
+                        help="Spend all gold on durability whenever a drill breaks")
+    parser.add_argument("--workers", type=int, default=None, help="Processes to use, defaults to every core")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument("--output", default="-", help="Output file, - for stdout")
+    parser.add_argument("--set", dest="overrides", type=parse_override, action="append", default=[],
+                        metavar="NAME=VALUE", help="Override a tuning constant")
+    args = parser.parse_args(argv)
+
+    tasks = [(args.seed + run, args.policy, args.pattern, args.max_time, args.buy_durability)
+             for run in range(args.runs)]
+    stream = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        writer = (CsvWriter if args.format == "csv" else JsonLinesWriter)(stream)
+        start = time.perf_counter()
+        run_batch(tasks, writer, args.workers, dict(args.overrides))
+        elapsed = time.perf_counter() - start
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    print(f"{args.runs} runs in {elapsed:.2f}s ({args.runs / elapsed:.1f} runs/s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
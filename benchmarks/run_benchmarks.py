@@ -0,0 +1,278 @@
+#Performance benchmark suite for Gold Digger. Runs headless with the SDL dummy
+#video driver and measures world generation, memory per cell, startup time, steady-state
+#frame time for idle, mining, minimap and scrolling play, the dialog loops and raw
+#simulation speed with and without falling blocks. Results are written as JSON;
+#--compare checks them against a saved baseline and exits non-zero when a metric
+#got slower by more than the threshold.
+#
+#Usage: python benchmarks/run_benchmarks.py --output baseline.json
+#       python benchmarks/run_benchmarks.py --compare baseline.json --threshold 0.15
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_ROOT)
+
+import pygame
+
+from world import WorldGrid, SeededWorld
+from chunks import ChunkedWorld
+import terrain
+from simulation import Simulation, StepInput, NO_INPUT
+
+DEFAULT_THRESHOLD = 0.15 # Allowed slowdown before a metric counts as a regression
+WORLD_SIZES = (50, 200, 500, 1000)
+QUICK_WORLD_SIZES = (50, 200)
+TERRAIN_WORLD_SIZES = (200, 1000, 4096)
+QUICK_TERRAIN_WORLD_SIZES = (200,)
+FRAME_COUNT = 300
+DIALOG_ITERATIONS = 120
+
+class TickCounter:
+    #Stand-in for pygame.time.Clock that doesn't sleep
+    def __init__(self):
+        self.ticks = 0
+
+    def tick(self, framerate=0):
+        self.ticks += 1
+        return 0
+
+#Run fn repeats times and return the median wall time in milliseconds
+def median_ms(fn, repeats=5):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def bench_world_generation(sizes, terrain_sizes, results):
+    for size in sizes:
+        repeats = 5 if size <= 200 else 2
+        results[f"worldgen.grid.{size}"] = (median_ms(lambda: WorldGrid(size, size).generate(1), repeats), "ms")
+
+    # Strata, caves and veins for the whole map, when NumPy is installed
+    if terrain.np is not None:
+        generator = terrain.TerrainGenerator()
+        for size in terrain_sizes:
+            repeats = 5 if size <= 200 else 2
+            results[f"worldgen.terrain.{size}"] = (
+                median_ms(lambda: WorldGrid(size, size).generate(1, generator), repeats), "ms")
+
+    # A seeded world costs nothing to create, its cells are generated as the view reaches them
+    def seeded_view():
+        world = SeededWorld(100000, 100000, 1)
+        for y in range(10, 74):
+            for x in range(50000, 50064):
+                world.block_type(x, y)
+    results["worldgen.seeded.view_64x64"] = (median_ms(seeded_view), "ms")
+
+    # A chunked world only generates what is around the spawn point
+    def chunked_spawn():
+        world = ChunkedWorld(100000, 100000, seed=1)
+        world.update_focus([(50000, 10)])
+    results["worldgen.chunked.spawn"] = (median_ms(chunked_spawn, 3), "ms")
+
+def bench_memory(results):
+    size = 500
+    tracemalloc.start()
+    world = WorldGrid(size, size).generate(1)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results["memory.grid.bytes_per_cell"] = (current / (size * size), "bytes")
+    del world
+
+    # Seeded worlds only grow with what the player changes; dig a full row of cells
+    world = SeededWorld(size, size, 1)
+    for x in range(size):
+        world.set_dug(x, 10)
+    results["memory.seeded.bytes_per_dug_cell"] = (world.memory_usage() / size, "bytes")
+
+def bench_simulation(results):
+    down = StepInput("DOWN", False)
+    right = StepInput("RIGHT", False)
+    steps = 100000
+
+    # Again with loose blocks caving in behind the player as it digs sideways
+    for name, falling_blocks in (("simulation.step", False), ("simulation.step.falling_blocks", True)):
+        sim = Simulation(seed=1, falling_blocks=falling_blocks)
+        def run():
+            for step in range(steps):
+                sim.step(down if (step // 600) % 2 == 0 else right, 1 / 60)
+                if sim.popup_shown:
+                    sim.reset(1)
+        results[name] = (median_ms(run, 3) * 1000 / steps, "us")
+
+#Create a game without waiting on the welcome dialog or sleeping between frames
+def make_game():
+    import GoldDiggerPythonGame
+    pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RETURN, unicode="\r"))
+    game = GoldDiggerPythonGame.Game(seed=1)
+    game.clock = TickCounter()
+    if game.autosaver:
+        game.autosaver.close()
+        game.autosaver = None
+    return game
+
+#Average time of one advance-and-render frame while inputs_for(frame) drives the game
+def frame_time(game, inputs_for, before_frame=None):
+    game.render()
+    times = []
+    for frame in range(FRAME_COUNT):
+        if before_frame:
+            before_frame(frame)
+        start = time.perf_counter()
+        if game.advance(inputs_for(frame), 1 / 60):
+            game.render()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(times), sorted(times)[int(len(times) * 0.95)]
+
+def bench_frames(results):
+    from GoldDiggerPythonGame import MAP_HIDDEN, MAP_MINIMAP
+    game = make_game()
+    mean, p95 = frame_time(game, lambda frame: NO_INPUT)
+    results["frame.idle.mean"] = (mean, "ms")
+    results["frame.idle.p95"] = (p95, "ms")
+
+    game.reset_game()
+    game.sim.player.dig_time_remaining = 1e9
+    down = StepInput("DOWN", False)
+    mean, p95 = frame_time(game, lambda frame: down)
+    results["frame.mining.mean"] = (mean, "ms")
+    results["frame.mining.p95"] = (p95, "ms")
+
+    # Mining again with the minimap shown, which repaints a pixel per dug cell
+    game.reset_game()
+    game.sim.player.dig_time_remaining = 1e9
+    game.map_mode = MAP_MINIMAP
+    mean, p95 = frame_time(game, lambda frame: down)
+    game.map_mode = MAP_HIDDEN
+    results["frame.minimap.mean"] = (mean, "ms")
+    results["frame.minimap.p95"] = (p95, "ms")
+
+    # Walk the player back and forth along the open surface row so the camera scrolls every frame
+    game.reset_game()
+    def walk(frame):
+        game.sim.player.grid_x = 14 + abs(frame % 40 - 20)
+    mean, p95 = frame_time(game, lambda frame: NO_INPUT, walk)
+    results["frame.scrolling.mean"] = (mean, "ms")
+    results["frame.scrolling.p95"] = (p95, "ms")
+    return game
+
+#Average time to open, draw and close a modal dialog. Dialogs sleep on the
+#event queue between redraws, so each one is answered with a queued Enter.
+def dialog_time(game, show_dialog):
+    enter = pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RETURN, unicode="\r")
+    start = time.perf_counter()
+    for _ in range(DIALOG_ITERATIONS):
+        pygame.event.post(enter)
+        show_dialog()
+    return (time.perf_counter() - start) * 1000 / DIALOG_ITERATIONS
+
+def bench_dialogs(game, results):
+    results["dialog.welcome"] = (dialog_time(game, game.show_welcome_dialog), "ms")
+    results["dialog.purchase"] = (dialog_time(game, game.show_purchase_dialog), "ms")
+    results["dialog.artifact"] = (dialog_time(game, game.show_artifact_dialog), "ms")
+
+#Start the game in a fresh interpreter and record how long each startup phase
+#took, from importing pygame to the first frame, plus the whole process
+def bench_startup(results, repeats=3):
+    command = [sys.executable, os.path.join(REPO_ROOT, "GoldDiggerPythonGame.py"), "1", "--startup-time"]
+    phases = {}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        phases.setdefault("process", []).append((time.perf_counter() - start) * 1000)
+        for line in output.splitlines():
+            phase, separator, value = line.rpartition(": ")
+            if separator and value.endswith(" ms"):
+                phases.setdefault(phase.replace(" ", "_"), []).append(float(value[:-3]))
+    for phase, times in phases.items():
+        results[f"startup.{phase}"] = (statistics.median(times), "ms")
+
+def run_all(quick=False):
+    results = {}
+    bench_world_generation(QUICK_WORLD_SIZES if quick else WORLD_SIZES,
+                           QUICK_TERRAIN_WORLD_SIZES if quick else TERRAIN_WORLD_SIZES, results)
+    bench_memory(results)
+    bench_startup(results)
+    bench_simulation(results)
+    game = bench_frames(results)
+    bench_dialogs(game, results)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "video_driver": os.environ.get("SDL_VIDEODRIVER"),
+        },
+        "metrics": {name: {"value": value, "unit": unit} for name, (value, unit) in results.items()},
+    }
+
+#Return (name, baseline, current, change) for every metric that regressed past the threshold
+def find_regressions(baseline, current, threshold):
+    regressions = []
+    for name, metric in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None or base["value"] <= 0:
+            continue
+        change = metric["value"] / base["value"] - 1
+        if change > threshold:
+            regressions.append((name, base["value"], metric["value"], change))
+    return regressions
+
+def print_results(report, baseline=None):
+    for name, metric in report["metrics"].items():
+        line = f"{name:<36} {metric['value']:>12.4f} {metric['unit']}"
+        if baseline and name in baseline["metrics"] and baseline["metrics"][name]["value"] > 0:
+            change = metric["value"] / baseline["metrics"][name]["value"] - 1
+            line += f"  ({change:+.1%})"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Gold Digger benchmark suite.")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Fractional slowdown that counts as a regression (default %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="Skip the larger world sizes")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    # The game reads and writes its save file in the working directory, keep that out of the repo
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        report = run_all(args.quick)
+        os.chdir(REPO_ROOT)
+
+    print_results(report, baseline)
+    if output:
+        with open(output, "w") as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+    if baseline:
+        regressions = find_regressions(baseline, report, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:.4f} -> {after:.4f} ({change:+.1%})")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
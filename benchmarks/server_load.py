@@ -0,0 +1,118 @@
+#Load test for the multiplayer server. Starts a server on localhost, connects
+#a growing number of headless clients that wander and dig with random inputs,
+#and reports the server's tick time and the bytes it sends at each client
+#count. One client mirrors the world from the deltas it receives and is
+#checked against the server's world after every round.
+#
+#Usage: python benchmarks/server_load.py
+#       python benchmarks/server_load.py --clients 10 100 400 --duration 10 --output load.json
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from server import GameServer, HeadlessClient
+from world import parse_seed
+
+CLIENT_COUNTS = (1, 10, 50, 100, 200, 400)
+ROUND_DURATION = 5.0 # Seconds measured per client count
+WARMUP = 1.0 # Seconds run before measuring, while the joining snapshots go out
+CONNECT_BATCH = 50 # Clients connecting at once, keeps under the listen backlog
+INPUT_INTERVAL = 0.25 # Seconds between input changes
+INPUT_CHANGE_SHARE = 0.25 # Share of the clients that pick a new direction each time
+DIRECTIONS = ("DOWN", "DOWN", "LEFT", "RIGHT", "UP", None)
+WORLD_SIZE = 1000
+
+#Keep changing the held direction of a random share of the clients
+async def drive(clients, rng):
+    while True:
+        for client in rng.sample(clients, max(1, int(len(clients) * INPUT_CHANGE_SHARE))):
+            client.send_input(rng.choice(DIRECTIONS), released=True)
+        await asyncio.sleep(INPUT_INTERVAL)
+
+#True when the mirroring client has the same cells and players as the server
+def mirror_matches(server, mirror):
+    world = server.world
+    width = world.width
+    for index in server.cell_records:
+        x = index % width
+        y = index // width
+        if (mirror.world.block_type(x, y), mirror.world.is_dug(x, y)) != (world.block_type(x, y), world.is_dug(x, y)):
+            return False
+    expected = {session.player_id: session.last_record for session in server.sessions.values()}
+    return expected.keys() == mirror.players.keys() and all(
+        mirror.players[player_id][:4] == record[:4] for player_id, record in expected.items())
+
+async def run_round(count, duration, seed, falling_blocks):
+    server = GameServer(seed, WORLD_SIZE, "seeded", falling_blocks=falling_blocks)
+    port = await server.start("127.0.0.1", 0)
+    clients = [HeadlessClient(mirror=True)] + [HeadlessClient(keep_state=False) for _ in range(count - 1)]
+    for first in range(0, count, CONNECT_BATCH):
+        await asyncio.gather(*(client.connect("127.0.0.1", port) for client in clients[first:first + CONNECT_BATCH]))
+    driver = asyncio.create_task(drive(clients, random.Random(seed)))
+    await asyncio.sleep(WARMUP)
+
+    ticks_before = server.ticks
+    bytes_before = server.bytes_sent
+    server.tick_times.clear()
+    await asyncio.sleep(duration)
+    ticks = server.ticks - ticks_before
+    sent = server.bytes_sent - bytes_before
+    times = sorted(server.tick_times)
+
+    # Stop digging and let the last changes reach the clients before comparing
+    driver.cancel()
+    for client in clients:
+        client.send_input(None, released=True)
+    await asyncio.sleep(5 / server.tick_rate)
+    in_sync = mirror_matches(server, clients[0])
+    connected = len(server.sessions)
+    for client in clients:
+        await client.close()
+    await server.close()
+    return {
+        "clients": count,
+        "connected": connected,
+        "ticks": ticks,
+        "tick_rate": ticks / duration,
+        "tick.mean": statistics.mean(times),
+        "tick.p95": times[int(len(times) * 0.95)],
+        "tick.max": times[-1],
+        "bytes_per_tick": sent / max(ticks, 1),
+        "kbytes_per_second": sent / duration / 1024,
+        "bytes_per_second_per_client": sent / duration / count,
+        "mirror_in_sync": in_sync,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Gold Digger multiplayer server on localhost.")
+    parser.add_argument("--clients", type=int, nargs="+", default=CLIENT_COUNTS, help="Client counts to test")
+    parser.add_argument("--duration", type=float, default=ROUND_DURATION, help="Seconds measured per count")
+    parser.add_argument("--seed", type=parse_seed, default=1)
+    parser.add_argument("--falling-blocks", action="store_true", help="Run the server with falling blocks")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    print(f"{'clients':>8} {'ticks/s':>8} {'tick ms':>8} {'p95 ms':>8} {'max ms':>8} "
+          f"{'B/tick':>10} {'KB/s':>9} {'B/s/client':>11}  mirror")
+    rounds = []
+    for count in args.clients:
+        result = asyncio.run(run_round(count, args.duration, args.seed, args.falling_blocks))
+        rounds.append(result)
+        print(f"{result['clients']:>8} {result['tick_rate']:>8.1f} {result['tick.mean']:>8.2f} "
+              f"{result['tick.p95']:>8.2f} {result['tick.max']:>8.2f} {result['bytes_per_tick']:>10.0f} "
+              f"{result['kbytes_per_second']:>9.1f} {result['bytes_per_second_per_client']:>11.0f}  "
+              f"{'ok' if result['mirror_in_sync'] else 'OUT OF SYNC'}")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(rounds, output_file, indent=2)
+    return 0 if all(result["mirror_in_sync"] and result["connected"] == result["clients"] for result in rounds) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
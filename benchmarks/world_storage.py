@@ -0,0 +1,76 @@
+#Compare memory use and build time of the array-backed WorldGrid against the
+#original dict of per-cell Block objects.
+#
+#Usage: python benchmarks/world_storage.py [grid sizes...]
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from settings import GOLD_CHANCE, DEPTH_THRESHOLD, DEPTH_THRESHOLD2, SURFACE_ROW
+from world import WorldGrid
+
+DEFAULT_SIZES = (50, 200, 500, 1000)
+
+class LegacyBlock:
+    #Copy of the original per-cell Block, without drawing, for comparison
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.is_gold = random.random() < GOLD_CHANCE
+        self.is_veryhard_stone = False
+        self.is_artifact = False
+        if y > DEPTH_THRESHOLD:
+            if not self.is_gold:
+                self.is_stone = True
+                self.is_hard_stone = random.random() < 0.2
+                if y > DEPTH_THRESHOLD2:
+                    self.is_veryhard_stone = random.random() < 0.7
+            else:
+                self.is_stone = False
+                self.is_hard_stone = False
+        else:
+            self.is_stone = random.random() < 0.2
+            self.is_hard_stone = False
+        self.is_dug = False
+        self.mining_progress = 0.0
+
+def build_legacy(size):
+    blocks = {}
+    for y in range(SURFACE_ROW + 1, size):
+        for x in range(size):
+            blocks[(x, y)] = LegacyBlock(x, y)
+    return blocks
+
+def build_grid(size):
+    return WorldGrid(size, size).generate(seed=size)
+
+#Build a world twice and return (seconds, peak traced bytes). Timing is taken
+#without tracemalloc running since tracing slows allocation-heavy code unevenly.
+def measure(build, size):
+    start = time.perf_counter()
+    world = build(size)
+    elapsed = time.perf_counter() - start
+    del world
+
+    tracemalloc.start()
+    world = build(size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del world
+    return elapsed, peak
+
+def main(sizes):
+    print(f"{'size':>6} {'dict time':>10} {'dict MB':>9} {'grid time':>10} {'grid MB':>9} {'mem ratio':>10}")
+    for size in sizes:
+        legacy_time, legacy_bytes = measure(build_legacy, size)
+        grid_time, grid_bytes = measure(build_grid, size)
+        print(f"{size:>6} {legacy_time:>9.3f}s {legacy_bytes / 1e6:>9.2f} "
+              f"{grid_time:>9.3f}s {grid_bytes / 1e6:>9.2f} {legacy_bytes / max(grid_bytes, 1):>9.1f}x")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
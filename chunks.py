@@ -0,0 +1,228 @@
+#Chunked world storage for maps too large to keep in memory. Chunks are
+#generated on first access from the world seed and their cell coordinates, cold
+#chunks are evicted to stay under a memory budget and chunks the player has
+#dug into are written to disk so they come back as they were left.
+
+import os
+import tempfile
+from array import array
+
+from settings import (
+    SURFACE_ROW, CHUNK_SIZE, CHUNK_MEMORY_BUDGET, CHUNK_FOCUS_RADIUS, CHUNK_CACHE_DIR,
+)
+from world import (
+    ObservableWorld, BLOCK_EMPTY, BLOCK_ARTIFACT, GOLD_TYPES, MINE_TIMES,
+    seeded_row_types, new_seed, artifact_position,
+)
+
+# Rough per-chunk bookkeeping cost on top of the cell arrays
+CHUNK_OVERHEAD = 512
+
+class Chunk:
+    #A square piece of the world holding its own cell arrays
+    def __init__(self, chunk_x, chunk_y, size):
+        self.chunk_x = chunk_x
+        self.chunk_y = chunk_y
+        cell_count = size * size
+        self.types = bytearray(cell_count)
+        self.dug = bytearray(cell_count)
+        self.progress = array('f', bytes(4 * cell_count))
+        self.touched = False # Set once the player digs into this chunk
+        self.last_used = 0
+
+    def memory_usage(self):
+        return len(self.types) + len(self.dug) + 4 * len(self.progress) + CHUNK_OVERHEAD
+
+    #Serialize the chunk state to bytes
+    def to_bytes(self):
+        return bytes(self.types) + bytes(self.dug) + self.progress.tobytes()
+
+    #Restore the chunk state from bytes written by to_bytes
+    def load_bytes(self, data):
+        cell_count = len(self.types)
+        self.types[:] = data[:cell_count]
+        self.dug[:] = data[cell_count:2 * cell_count]
+        self.progress = array('f')
+        self.progress.frombytes(data[2 * cell_count:])
+        self.touched = True
+
+class ChunkedWorld(ObservableWorld):
+    #World made of lazily generated chunks with LRU eviction
+    def __init__(self, width, height, seed=None, chunk_size=CHUNK_SIZE,
+                 memory_budget=CHUNK_MEMORY_BUDGET, cache_dir=CHUNK_CACHE_DIR):
+        self.width = width
+        self.height = height
+        self.seed = new_seed() if seed is None else seed
+        self.chunk_size = chunk_size
+        self.chunk_shift = chunk_size.bit_length() - 1
+        if 1 << self.chunk_shift != chunk_size:
+            raise ValueError(f"Chunk size must be a power of two, got {chunk_size}")
+        self.chunk_mask = chunk_size - 1
+        self.chunks_across = (width + chunk_size - 1) // chunk_size
+        self.memory_budget = memory_budget
+        if cache_dir is None:
+            self._temp_dir = tempfile.TemporaryDirectory(prefix="golddigger-chunks-")
+            cache_dir = self._temp_dir.name
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.artifact_pos = artifact_position(width, height)
+        self.chunks = {}
+        self.hot_chunks = set()
+        self.memory_in_use = 0
+        self.tick = 0
+        self.chunks_generated = 0
+        self.chunks_loaded = 0
+        self.chunks_evicted = 0
+
+    #Path of the file a touched chunk is saved to. The seed and size are part
+    #of the name so worlds sharing a cache directory never load each other's chunks.
+    def chunk_path(self, chunk_x, chunk_y):
+        return os.path.join(self.cache_dir, f"chunk_{self.seed}_{self.width}x{self.height}_{chunk_x}_{chunk_y}.bin")
+
+    #Fill a chunk with the blocks generated for the world seed at its coordinates
+    def generate_chunk(self, chunk):
+        size = self.chunk_size
+        origin_x = chunk.chunk_x * size
+        origin_y = chunk.chunk_y * size
+        row_length = min(size, self.width - origin_x)
+        types = chunk.types
+        for local_y in range(size):
+            y = origin_y + local_y
+            if y <= SURFACE_ROW or y >= self.height:
+                continue
+            row = local_y * size
+            types[row:row + row_length] = seeded_row_types(self.seed, y, origin_x, row_length)
+
+        artifact_x, artifact_y = self.artifact_pos
+        if artifact_x >> self.chunk_shift == chunk.chunk_x and artifact_y >> self.chunk_shift == chunk.chunk_y:
+            types[(artifact_y & self.chunk_mask) * size + (artifact_x & self.chunk_mask)] = BLOCK_ARTIFACT
+
+    #Return the chunk at the given chunk coordinates, loading or generating it
+    def get_chunk(self, chunk_x, chunk_y):
+        key = chunk_y * self.chunks_across + chunk_x
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = Chunk(chunk_x, chunk_y, self.chunk_size)
+            path = self.chunk_path(chunk_x, chunk_y)
+            if os.path.exists(path):
+                with open(path, "rb") as chunk_file:
+                    chunk.load_bytes(chunk_file.read())
+                self.chunks_loaded += 1
+            else:
+                self.generate_chunk(chunk)
+                self.chunks_generated += 1
+            self.chunks[key] = chunk
+            self.memory_in_use += chunk.memory_usage()
+        chunk.last_used = self.tick
+        return chunk
+
+    #Look up the chunk holding a cell and the cell's index inside it
+    def _locate(self, x, y):
+        chunk = self.get_chunk(x >> self.chunk_shift, y >> self.chunk_shift)
+        return chunk, (y & self.chunk_mask) * self.chunk_size + (x & self.chunk_mask)
+
+    #Write a touched chunk to disk and drop it from memory
+    def evict_chunk(self, key):
+        chunk = self.chunks.pop(key)
+        if chunk.touched:
+            with open(self.chunk_path(chunk.chunk_x, chunk.chunk_y), "wb") as chunk_file:
+                chunk_file.write(chunk.to_bytes())
+        self.memory_in_use -= chunk.memory_usage()
+        self.chunks_evicted += 1
+
+    #Keep chunks around the given cell positions loaded and evict cold ones
+    def update_focus(self, positions, radius=CHUNK_FOCUS_RADIUS):
+        self.tick += 1
+        max_chunk_x = self.chunks_across - 1
+        max_chunk_y = (self.height - 1) >> self.chunk_shift
+        hot_chunks = set()
+        for x, y in positions:
+            center_x = x >> self.chunk_shift
+            center_y = y >> self.chunk_shift
+            for chunk_y in range(max(0, center_y - radius), min(max_chunk_y, center_y + radius) + 1):
+                for chunk_x in range(max(0, center_x - radius), min(max_chunk_x, center_x + radius) + 1):
+                    self.get_chunk(chunk_x, chunk_y)
+                    hot_chunks.add(chunk_y * self.chunks_across + chunk_x)
+        self.hot_chunks = hot_chunks
+
+        if self.memory_in_use > self.memory_budget:
+            cold_chunks = sorted(
+                (chunk.last_used, key) for key, chunk in self.chunks.items() if key not in hot_chunks
+            )
+            for _, key in cold_chunks:
+                if self.memory_in_use <= self.memory_budget:
+                    break
+                self.evict_chunk(key)
+
+    #Save every touched chunk still in memory
+    def flush(self):
+        for chunk in self.chunks.values():
+            if chunk.touched:
+                with open(self.chunk_path(chunk.chunk_x, chunk.chunk_y), "wb") as chunk_file:
+                    chunk_file.write(chunk.to_bytes())
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    #Check if there is a block (dug or not) at the given position
+    def __contains__(self, pos):
+        x, y = pos
+        if not (0 <= x < self.width and SURFACE_ROW < y < self.height):
+            return False
+        chunk, index = self._locate(x, y)
+        return chunk.types[index] != BLOCK_EMPTY
+
+    def block_type(self, x, y):
+        chunk, index = self._locate(x, y)
+        return chunk.types[index]
+
+    def set_block_type(self, x, y, block_type):
+        chunk, index = self._locate(x, y)
+        chunk.types[index] = block_type
+        chunk.touched = True
+        self.notify(x, y)
+
+    def is_dug(self, x, y):
+        chunk, index = self._locate(x, y)
+        return chunk.dug[index] != 0
+
+    def set_dug(self, x, y):
+        chunk, index = self._locate(x, y)
+        chunk.dug[index] = 1
+        chunk.touched = True
+        self.notify(x, y)
+
+    #Put an undug block in a cell, clearing its dug flag and mining progress
+    def fill(self, x, y, block_type):
+        chunk, index = self._locate(x, y)
+        chunk.types[index] = block_type
+        chunk.dug[index] = 0
+        chunk.progress[index] = 0.0
+        chunk.touched = True
+        self.notify(x, y)
+
+    def is_gold(self, x, y):
+        chunk, index = self._locate(x, y)
+        return chunk.types[index] in GOLD_TYPES
+
+    def is_artifact(self, x, y):
+        chunk, index = self._locate(x, y)
+        return chunk.types[index] == BLOCK_ARTIFACT
+
+    def get_progress(self, x, y):
+        chunk, index = self._locate(x, y)
+        return chunk.progress[index]
+
+    def set_progress(self, x, y, value):
+        chunk, index = self._locate(x, y)
+        chunk.progress[index] = value
+        chunk.touched = True
+        self.notify(x, y)
+
+    #Get the time required to mine the block at the given position
+    def get_mine_time(self, x, y):
+        chunk, index = self._locate(x, y)
+        return MINE_TIMES[chunk.types[index]]
+
+    def memory_usage(self):
+        return self.memory_in_use
@@ -0,0 +1,287 @@
+#Fog of war for Gold Digger. Light enters the ground from the open sky above
+#the surface row and from the player's lamp, spreads through open cells (dug
+#out or empty) and loses one level per cell it travels, so long tunnels and
+#deep shafts get darker. Solid blocks are lit one level below the brightest
+#open cell next to them; anything else stays dark.
+#
+#Sky light is kept per open cell and updated incrementally through the world
+#observer: digging a cell floods light outward from it, filling one in removes
+#the light that came through it and relights the area from what is left. The
+#lamp is recomputed around the player when it moves. The LightOverlay turns
+#light levels into a cached darkness surface that is blitted over the terrain,
+#scrolled along with the view and refilled only for cells whose light changed.
+
+from collections import deque
+
+import pygame
+
+from settings import (
+    WINDOW_WIDTH, WINDOW_HEIGHT, BLOCK_SIZE, SURFACE_ROW, LIGHT_LEVELS, LAMP_LEVEL,
+)
+from world import BLOCK_EMPTY
+
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+SCAN_COLUMNS = 32 # Columns of the first row below the sky scanned for openings at a time
+
+class LightMap:
+    #Light level of every cell near the player, from the sky and the lamp
+    def __init__(self, world, levels=LIGHT_LEVELS, lamp_level=LAMP_LEVEL):
+        self.world = world
+        self.max_level = levels - 1
+        self.lamp_level = lamp_level
+        self.sky = {} # (x, y) -> sky light of open cells below the surface
+        self.lamp = {} # (x, y) -> lamp light of open cells around the player
+        self.lamp_position = None
+        self.scanned = bytearray((world.width + SCAN_COLUMNS - 1) // SCAN_COLUMNS)
+        self.changed = set() # Open cells whose light changed since the last take_changes
+        world.add_observer(self.cell_changed)
+
+    def close(self):
+        self.world.remove_observer(self.cell_changed)
+
+    #Open cells let light through: the sky, empty cells and dug blocks
+    def is_open(self, x, y):
+        world = self.world
+        if not world.in_bounds(x, y):
+            return False
+        return y <= SURFACE_ROW or world.block_type(x, y) == BLOCK_EMPTY or world.is_dug(x, y)
+
+    #Light of an open cell
+    def open_level(self, x, y):
+        if y <= SURFACE_ROW:
+            return self.max_level
+        position = (x, y)
+        return max(self.sky.get(position, 0), self.lamp.get(position, 0))
+
+    #Light of any cell. Solid blocks show the light of their brightest open neighbour.
+    def level(self, x, y):
+        if self.is_open(x, y):
+            return self.open_level(x, y)
+        brightest = 0
+        for offset_x, offset_y in NEIGHBOURS:
+            if self.is_open(x + offset_x, y + offset_y):
+                brightest = max(brightest, self.open_level(x + offset_x, y + offset_y))
+        return max(brightest - 1, 0)
+
+    #Sky light an open cell gets from its neighbours
+    def sky_from_neighbours(self, x, y):
+        brightest = 0
+        for offset_x, offset_y in NEIGHBOURS:
+            neighbour_y = y + offset_y
+            if neighbour_y <= SURFACE_ROW:
+                brightest = self.max_level
+            else:
+                brightest = max(brightest, self.sky.get((x + offset_x, neighbour_y), 0))
+        return max(brightest - 1, 0)
+
+    #Spread sky light outward from the queued cells, raising levels only
+    def flood(self, queue):
+        sky = self.sky
+        while queue:
+            x, y = queue.popleft()
+            # A queued cell may have lost its light to a later removal
+            spread = sky.get((x, y), 0) - 1
+            if spread <= 0:
+                continue
+            for offset_x, offset_y in NEIGHBOURS:
+                neighbour = (x + offset_x, y + offset_y)
+                if neighbour[1] > SURFACE_ROW and sky.get(neighbour, 0) < spread and self.is_open(*neighbour):
+                    sky[neighbour] = spread
+                    self.changed.add(neighbour)
+                    queue.append(neighbour)
+
+    #Make sure openings below the sky within these columns have been found
+    def ensure_columns(self, first_x, last_x):
+        first_block = max(first_x, 0) // SCAN_COLUMNS
+        last_block = min(last_x, self.world.width - 1) // SCAN_COLUMNS
+        missing = self.scanned.find(0, first_block, last_block + 1)
+        while missing != -1:
+            self.scanned[missing] = 1
+            y = SURFACE_ROW + 1
+            queue = deque()
+            for x in range(missing * SCAN_COLUMNS, min((missing + 1) * SCAN_COLUMNS, self.world.width)):
+                if self.is_open(x, y) and self.sky.get((x, y), 0) < self.max_level - 1:
+                    self.sky[(x, y)] = self.max_level - 1
+                    self.changed.add((x, y))
+                    queue.append((x, y))
+            self.flood(queue)
+            missing = self.scanned.find(0, missing + 1, last_block + 1)
+
+    #World observer: a cell was dug, mined or replaced
+    def cell_changed(self, x, y):
+        if y <= SURFACE_ROW:
+            return
+        position = (x, y)
+        current = self.sky.get(position, 0)
+        is_open = self.is_open(x, y)
+        if is_open:
+            level = self.sky_from_neighbours(x, y)
+            if level > current:
+                self.sky[position] = level
+                self.changed.add(position)
+                self.flood(deque((position,)))
+        elif current:
+            self.remove(position)
+        # Mining progress notifies every step, the lamp only cares when a cell opens or closes
+        if is_open != (position in self.lamp) and self.near_lamp(x, y):
+            self.move_lamp(*self.lamp_position, force=True)
+
+    def near_lamp(self, x, y):
+        if self.lamp_position is None:
+            return False
+        return abs(x - self.lamp_position[0]) + abs(y - self.lamp_position[1]) < self.lamp_level
+
+    #Take away the sky light that reached cells through a cell that was filled
+    #in, then relight them from the light that is left around the hole
+    def remove(self, position):
+        sky = self.sky
+        removal = deque(((position, sky.pop(position)),))
+        self.changed.add(position)
+        relight = deque()
+        while removal:
+            (x, y), level = removal.popleft()
+            for offset_x, offset_y in NEIGHBOURS:
+                neighbour = (x + offset_x, y + offset_y)
+                if neighbour[1] <= SURFACE_ROW:
+                    continue
+                neighbour_level = sky.get(neighbour, 0)
+                if neighbour_level and neighbour_level < level:
+                    del sky[neighbour]
+                    self.changed.add(neighbour)
+                    removal.append((neighbour, neighbour_level))
+                elif neighbour_level >= level:
+                    relight.append(neighbour)
+            # A removed cell right under the sky is lit again straight away
+            if y == SURFACE_ROW + 1 and (x, y) != position and self.is_open(x, y):
+                sky[(x, y)] = self.max_level - 1
+                relight.append((x, y))
+        self.flood(relight)
+
+    #Light the open cells around the player with the lamp. Only reruns when
+    #the player moved, or force is set because the cells around it changed.
+    def move_lamp(self, x, y, force=False):
+        if (x, y) == self.lamp_position and not force:
+            return
+        self.lamp_position = (x, y)
+        old_lamp = self.lamp
+        lamp = {(x, y): self.lamp_level}
+        queue = deque(((x, y),))
+        while queue:
+            cell_x, cell_y = queue.popleft()
+            spread = lamp[(cell_x, cell_y)] - 1
+            if spread <= 0:
+                continue
+            for offset_x, offset_y in NEIGHBOURS:
+                neighbour = (cell_x + offset_x, cell_y + offset_y)
+                if neighbour not in lamp and neighbour[1] > SURFACE_ROW and self.is_open(*neighbour):
+                    lamp[neighbour] = spread
+                    queue.append(neighbour)
+        self.lamp = lamp
+        for position in old_lamp.keys() | lamp.keys():
+            if old_lamp.get(position) != lamp.get(position):
+                self.changed.add(position)
+
+    #Return the open cells whose light changed since the last call
+    def take_changes(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+class LightOverlay:
+    #Darkness over the visible cells, one flat square per cell, blitted only
+    #over the parts of the screen that changed
+    def __init__(self, light):
+        self.light = light
+        self.columns = WINDOW_WIDTH // BLOCK_SIZE + 2
+        self.rows = WINDOW_HEIGHT // BLOCK_SIZE + 2
+        self.shade = pygame.Surface((self.columns * BLOCK_SIZE, self.rows * BLOCK_SIZE), pygame.SRCALPHA)
+        self.origin = None
+        self.cells_shaded = 0
+
+    #Darkness of a cell, opaque black when no light reaches it
+    def shade_color(self, x, y):
+        light = self.light
+        return (0, 0, 0, 255 * (light.max_level - light.level(x, y)) // light.max_level)
+
+    #Shade every cell of the view. Whether each cell is open is looked up once
+    #for the view plus a border, since solid cells read all their neighbours.
+    def rebuild(self):
+        light = self.light
+        max_level = light.max_level
+        first_x = self.origin[0] - 1
+        first_y = self.origin[1] - 1
+        is_open = [[light.is_open(x, y) for x in range(first_x, first_x + self.columns + 2)]
+                   for y in range(first_y, first_y + self.rows + 2)]
+        fill = self.shade.fill
+        for row in range(1, self.rows + 1):
+            for column in range(1, self.columns + 1):
+                x = first_x + column
+                y = first_y + row
+                if is_open[row][column]:
+                    level = light.open_level(x, y)
+                else:
+                    level = 0
+                    for offset_x, offset_y in NEIGHBOURS:
+                        if is_open[row + offset_y][column + offset_x]:
+                            level = max(level, light.open_level(x + offset_x, y + offset_y) - 1)
+                fill((0, 0, 0, 255 * (max_level - level) // max_level),
+                     ((column - 1) * BLOCK_SIZE, (row - 1) * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
+        self.cells_shaded += self.rows * self.columns
+
+    #Shade one cell if it is in view, returns True when its shade changed
+    def shade_cell(self, x, y):
+        column = x - self.origin[0]
+        row = y - self.origin[1]
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return False
+        color = self.shade_color(x, y)
+        if self.shade.get_at((column * BLOCK_SIZE, row * BLOCK_SIZE)) == color:
+            return False
+        self.shade.fill(color, (column * BLOCK_SIZE, row * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
+        self.cells_shaded += 1
+        return True
+
+    #Bring the shade up to date for the view at this camera position. Returns
+    #the cells whose shade changed, whose terrain has to be repainted first.
+    def update(self, camera_x, camera_y):
+        light = self.light
+        origin = (camera_x // BLOCK_SIZE, camera_y // BLOCK_SIZE)
+        light.ensure_columns(origin[0] - light.max_level, origin[0] + self.columns + light.max_level)
+        changed = light.take_changes()
+        if self.origin is None or abs(origin[0] - self.origin[0]) >= self.columns \
+                or abs(origin[1] - self.origin[1]) >= self.rows:
+            # Jumped to another part of the world: the whole view is repainted anyway
+            self.origin = origin
+            self.rebuild()
+            return []
+
+        if origin != self.origin:
+            # Scrolled: move the shade along and shade the rows and columns that came into view
+            shift_x = origin[0] - self.origin[0]
+            shift_y = origin[1] - self.origin[1]
+            self.shade.scroll(-shift_x * BLOCK_SIZE, -shift_y * BLOCK_SIZE)
+            self.origin = origin
+            new_columns = range(self.columns - shift_x, self.columns) if shift_x > 0 else range(-shift_x)
+            new_rows = range(self.rows - shift_y, self.rows) if shift_y > 0 else range(-shift_y)
+            for column in new_columns:
+                for row in range(self.rows):
+                    self.shade_cell(origin[0] + column, origin[1] + row)
+            for row in new_rows:
+                for column in range(self.columns):
+                    self.shade_cell(origin[0] + column, origin[1] + row)
+
+        # Open cells that changed and the blocks next to them
+        cells = set()
+        for x, y in changed:
+            cells.add((x, y))
+            for offset_x, offset_y in NEIGHBOURS:
+                cells.add((x + offset_x, y + offset_y))
+        return [(x, y) for x, y in cells if self.shade_cell(x, y)]
+
+    #Darken the given screen rectangles, which were just repainted with terrain
+    def draw(self, screen, camera_x, camera_y, rects):
+        offset_x = self.origin[0] * BLOCK_SIZE - camera_x
+        offset_y = self.origin[1] * BLOCK_SIZE - camera_y
+        for rect in rects:
+            rect = pygame.Rect(rect)
+            screen.blit(self.shade, rect.topleft, rect.move(-offset_x, -offset_y))
@@ -0,0 +1,231 @@
+#Minimap and zoomed-out map view. Terrain is kept as a pyramid of levels where
+#level k shows 2**k cells per pixel side: level 0 tiles are rasterised from the
+#world one pixel per cell, every higher level tile is its four children
+#averaged down with smoothscale. Tiles are cached per level and built under a
+#per-frame time budget, level 0 tiles a few rows at a time. When a cell
+#changes, only its pixel in each cached level is recomputed, going up the
+#levels until one already shows the new colour.
+
+import time
+from collections import OrderedDict
+
+import pygame
+
+from settings import (
+    SURFACE_ROW, DEPTH_THRESHOLD, SKY_BLUE, BLACK, RED, GRAY,
+    MINIMAP_TILE_PIXELS, MINIMAP_LEVELS, MINIMAP_TILE_CACHE_SIZE, MINIMAP_BUILD_BUDGET,
+)
+from world import WorldGrid, SeededWorld, BLOCK_EMPTY, BLOCK_DIRT, BLOCK_ARTIFACT, BLOCK_COLORS, seeded_row_types
+
+# Level 0 tiles are rasterised as 8-bit images whose palette index is the block
+# type code, plus one entry for dirt below the depth threshold and one for cells
+# outside the world
+DEEP_DIRT = len(BLOCK_COLORS)
+UNEXPLORED = DEEP_DIRT + 1
+PALETTE = [SKY_BLUE] + list(BLOCK_COLORS[1:]) + [GRAY, BLACK]
+DEEP_ROW_TABLE = bytes(DEEP_DIRT if code == BLOCK_DIRT else code for code in range(256))
+
+#Block type codes of cells first..end-1 of a row below the surface, with dug cells cleared
+def world_row(world, y, first, end):
+    index = y * world.width
+    if isinstance(world, WorldGrid):
+        row = world.types[index + first:index + end]
+        dug = world.dug[index + first:index + end]
+        position = dug.find(1)
+        while position != -1:
+            row[position] = BLOCK_EMPTY
+            position = dug.find(1, position + 1)
+        return row
+    if isinstance(world, SeededWorld):
+        row = seeded_row_types(world.seed, y, first, end - first)
+        artifact_x, artifact_y = world.artifact_pos
+        if artifact_y == y and first <= artifact_x < end:
+            row[artifact_x - first] = BLOCK_ARTIFACT
+        if world.replaced or world.dug:
+            for x in range(first, end):
+                if index + x in world.dug:
+                    row[x - first] = BLOCK_EMPTY
+                elif index + x in world.replaced:
+                    row[x - first] = world.replaced[index + x]
+        return row
+    return bytearray(BLOCK_EMPTY if world.is_dug(x, y) else world.block_type(x, y) for x in range(first, end))
+
+#Palette indices of count cells of row y starting at start_x
+def row_palette_indices(world, y, start_x, count):
+    if not 0 <= y < world.height:
+        return bytearray([UNEXPLORED]) * count
+    if y <= SURFACE_ROW:
+        return bytearray(count)
+    first = min(max(start_x, 0), start_x + count)
+    end = min(start_x + count, world.width)
+    row = bytearray([UNEXPLORED]) * (first - start_x)
+    if first < end:
+        row += world_row(world, y, first, end)
+    row += bytearray([UNEXPLORED]) * (count - len(row))
+    if y > DEPTH_THRESHOLD:
+        row = row.translate(DEEP_ROW_TABLE)
+    return row
+
+class Minimap:
+    #Mip-mapped overview of a world, updated cell by cell as it changes
+    def __init__(self, world, levels=MINIMAP_LEVELS, tile_pixels=MINIMAP_TILE_PIXELS,
+                 max_tiles=MINIMAP_TILE_CACHE_SIZE):
+        self.world = world
+        self.levels = levels
+        self.tile_pixels = tile_pixels
+        self.max_tiles = max_tiles
+        self.tiles = [OrderedDict() for _ in range(levels)]
+        self.dirty_cells = set()
+        self.partial = {} # Level 0 tile -> palette indices of the rows rasterised so far
+        self.incomplete = False # Some tile of the last drawn view is still missing
+        self.tiles_built = 0
+        self.pixels_updated = 0
+        world.add_observer(self.mark_dirty)
+
+    def close(self):
+        self.world.remove_observer(self.mark_dirty)
+
+    def mark_dirty(self, x, y):
+        self.dirty_cells.add((x, y))
+
+    #Colour of one cell as the main view draws it, without mining progress
+    def cell_color(self, x, y):
+        return PALETTE[row_palette_indices(self.world, y, x, 1)[0]]
+
+    #Average colour of the square of cells behind one pixel of a level
+    def pixel_color(self, level, pixel_x, pixel_y):
+        span = 1 << level
+        red = green = blue = 0
+        for y in range(pixel_y * span, (pixel_y + 1) * span):
+            for index in row_palette_indices(self.world, y, pixel_x * span, span):
+                color = PALETTE[index]
+                red += color[0]
+                green += color[1]
+                blue += color[2]
+        count = span * span
+        return (red // count, green // count, blue // count)
+
+    def new_surface(self, size):
+        surface = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        return surface
+
+    #Rasterise a level 0 tile from the world, one pixel per cell. Rows are
+    #added until the deadline passes, at least one per call; returns None
+    #until the last row is in.
+    def rasterize_tile(self, tile_x, tile_y, deadline=None):
+        size = self.tile_pixels
+        origin_x = tile_x * size
+        key = (tile_x, tile_y)
+        indices = self.partial.pop(key, None) or bytearray()
+        for row in range(len(indices) // size, size):
+            indices += row_palette_indices(self.world, tile_y * size + row, origin_x, size)
+            if deadline is not None and row + 1 < size and time.perf_counter() > deadline:
+                self.partial[key] = indices
+                if len(self.partial) > self.max_tiles:
+                    del self.partial[next(iter(self.partial))]
+                return None
+        indexed = pygame.image.frombuffer(bytes(indices), (size, size), "P")
+        indexed.set_palette(PALETTE)
+        surface = self.new_surface((size, size))
+        surface.blit(indexed, (0, 0))
+        return surface
+
+    #Return a cached tile, building it and any missing children unless the
+    #deadline has passed, in which case None is returned and the children
+    #built so far are kept for the next try
+    def get_tile(self, level, tile_x, tile_y, deadline=None):
+        tiles = self.tiles[level]
+        key = (tile_x, tile_y)
+        tile = tiles.get(key)
+        if tile is not None:
+            tiles.move_to_end(key)
+            return tile
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+        size = self.tile_pixels
+        if level == 0:
+            tile = self.rasterize_tile(tile_x, tile_y, deadline)
+            if tile is None:
+                return None
+        else:
+            children = []
+            for child_y in range(2):
+                for child_x in range(2):
+                    child = self.get_tile(level - 1, tile_x * 2 + child_x, tile_y * 2 + child_y, deadline)
+                    if child is None:
+                        return None
+                    children.append((child, (child_x * size, child_y * size)))
+            composed = self.new_surface((size * 2, size * 2))
+            composed.blits(children, doreturn=False)
+            tile = pygame.transform.smoothscale(composed, (size, size))
+        self.tiles_built += 1
+        tiles[key] = tile
+        if len(tiles) > self.max_tiles:
+            tiles.popitem(last=False)
+        return tile
+
+    #Repaint the pixels of changed cells in every cached level. Mining progress
+    #notifies every step without changing the colour, so a level whose pixel
+    #already shows the colour ends the climb: the coarser ones were drawn from it.
+    def apply_changes(self):
+        size = self.tile_pixels
+        for x, y in self.dirty_cells:
+            tile_key = (x // size, y // size)
+            rows = self.partial.get(tile_key)
+            if rows is not None:
+                # Rasterise again from the changed row on
+                del rows[(y % size) * size:]
+            for level in range(self.levels):
+                pixel_x = x >> level
+                pixel_y = y >> level
+                tile = self.tiles[level].get((pixel_x // size, pixel_y // size))
+                if tile is None:
+                    continue
+                pixel_color = self.cell_color(x, y) if level == 0 else self.pixel_color(level, pixel_x, pixel_y)
+                position = (pixel_x % size, pixel_y % size)
+                if tuple(tile.get_at(position))[:3] == tuple(pixel_color):
+                    break
+                tile.set_at(position, pixel_color)
+                self.pixels_updated += 1
+        self.dirty_cells.clear()
+
+    #Draw the map into rect on the screen centred on a cell, and return rect.
+    #Tiles not built yet are filled in over the next frames within the build budget.
+    def draw(self, screen, rect, center_x, center_y, level, marker=None):
+        self.apply_changes()
+        rect = pygame.Rect(rect)
+        size = self.tile_pixels
+        origin_x = (center_x >> level) - rect.width // 2
+        origin_y = (center_y >> level) - rect.height // 2
+        deadline = time.perf_counter() + MINIMAP_BUILD_BUDGET
+        self.incomplete = False
+
+        screen.set_clip(rect)
+        screen.fill(BLACK, rect)
+        # Only tiles that overlap the world, the rest of the rect stays black
+        span = size << level
+        last_x = min((origin_x + rect.width) // size, (self.world.width - 1) // span)
+        last_y = min((origin_y + rect.height) // size, (self.world.height - 1) // span)
+        for tile_y in range(max(origin_y // size, 0), last_y + 1):
+            for tile_x in range(max(origin_x // size, 0), last_x + 1):
+                tile = self.get_tile(level, tile_x, tile_y, deadline)
+                if tile is None:
+                    self.incomplete = True
+                else:
+                    screen.blit(tile, (rect.x + tile_x * size - origin_x, rect.y + tile_y * size - origin_y))
+        if marker is not None:
+            marker_x = rect.x + (marker[0] >> level) - origin_x
+            marker_y = rect.y + (marker[1] >> level) - origin_y
+            screen.fill(RED, (marker_x - 1, marker_y - 1, 3, 3))
+        screen.set_clip(None)
+        pygame.draw.rect(screen, BLACK, rect, 1)
+        return rect
+
+    #Most detailed level at which the whole world fits in a rectangle
+    def fitting_level(self, width, height):
+        for level in range(self.levels):
+            if self.world.width >> level <= width and self.world.height >> level <= height:
+                return level
+        return self.levels - 1
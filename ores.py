@@ -0,0 +1,295 @@
+#Spatial index of the ore left in a world. Cells are grouped into square
+#buckets that each hold the positions of their undug gold and artifact blocks,
+#which nearest() searches ring by ring outward from a point, and are kept
+#current through the world's observers as cells are dug or replaced.
+#
+#Worlds that hold every cell in memory (a generated grid or a loaded save) get
+#the whole index built when it is created, straight from their type and dug
+#arrays. Region counts then come from per-type prefix sums along each bucket
+#row, plus a bisect of the sorted ore columns of each cell row for the rows of
+#buckets the region only partly covers, so a count costs a few lookups per
+#bucket row whatever the size of the region.
+#
+#Seeded and chunked worlds are the exception: they are generated lazily, so
+#indexing them up front would cost a pass over the whole map. Their buckets
+#are filled the first time a query reaches them, with a per-bucket count kept
+#in one array per bucket row so region counts sum whole rows of buckets at C
+#speed, and the buckets a region only partly covers are scanned.
+
+import re
+from array import array
+from bisect import bisect_left, insort
+from itertools import accumulate
+
+from settings import ORE_BUCKET_SIZE
+from world import BLOCK_GOLD, BLOCK_STONE_GOLD, BLOCK_ARTIFACT, GOLD_TYPES
+
+ORE_TYPES = (BLOCK_GOLD, BLOCK_STONE_GOLD, BLOCK_ARTIFACT)
+ORE_PATTERN = re.compile(b"[" + re.escape(bytes(ORE_TYPES)) + b"]")
+UNDUG_MASK = bytes((0xFF,)) + bytes(255) # Dug flag -> 0xFF for undug cells, 0 for dug ones
+
+class OreIndex:
+    #Undug ore positions of one world, bucketed by area. An index built on
+    #another thread (background set) only records the cells that change while
+    #it is built; catch_up applies them on the thread that owns the world.
+    def __init__(self, world, bucket_size=ORE_BUCKET_SIZE, background=False):
+        self.world = world
+        self.bucket_size = bucket_size
+        self.columns = (world.width + bucket_size - 1) // bucket_size
+        self.rows = (world.height + bucket_size - 1) // bucket_size
+        self.buckets = {} # (bucket x, bucket y) -> {(x, y): ore type}
+        self.built_rows = {} # Bucket y -> bytearray, 1 where the bucket is filled
+        self.counts = {ore_type: {} for ore_type in ORE_TYPES} # Ore type -> bucket y -> array of counts
+        self.prefix = None # Ore type -> per bucket row, ore in the columns left of each x
+        self.row_ores = None # Ore type -> cell y -> sorted columns holding that ore
+        self.pending = set() if background else None # Cells changed during a background build
+        world.add_observer(self.cell_changed)
+        cell_arrays = getattr(world, "cell_arrays", None)
+        arrays = cell_arrays() if cell_arrays is not None else None
+        if arrays is not None:
+            self.build_from_arrays(*arrays)
+
+    #Index every cell from a world's block type codes and 0/1 dug flags
+    def build_from_arrays(self, types, dug):
+        width = self.world.width
+        size = self.bucket_size
+        cell_count = width * self.world.height
+        # Blank out the dug cells so only undug ore is left to find
+        undug = int.from_bytes(dug.translate(UNDUG_MASK), "little")
+        live = (int.from_bytes(types, "little") & undug).to_bytes(cell_count, "little")
+        buckets = self.buckets = {(bucket_x, bucket_y): {} for bucket_y in range(self.rows)
+                                  for bucket_x in range(self.columns)}
+        self.built_rows = {bucket_y: bytearray([1]) * self.columns for bucket_y in range(self.rows)}
+        columns = {ore_type: [array('i', bytes(4 * width)) for _ in range(self.rows)] for ore_type in ORE_TYPES}
+        row_ores = self.row_ores = {ore_type: {} for ore_type in ORE_TYPES}
+        finditer = ORE_PATTERN.finditer
+        for y in range(self.world.height):
+            row_start = y * width
+            bucket_y = y // size
+            for match in finditer(live, row_start, row_start + width):
+                x = match.start() - row_start
+                ore_type = live[row_start + x]
+                buckets[(x // size, bucket_y)][(x, y)] = ore_type
+                columns[ore_type][bucket_y][x] += 1
+                row_ores[ore_type].setdefault(y, []).append(x)
+        self.prefix = {ore_type: [array('i', accumulate(row, initial=0)) for row in rows]
+                       for ore_type, rows in columns.items()}
+        # Per-bucket counts, read off the prefix sums at the bucket edges
+        edges = [min(bucket_x * size, width) for bucket_x in range(self.columns + 1)]
+        for ore_type, rows in self.prefix.items():
+            self.counts[ore_type] = {bucket_y: array('i', (prefix[end] - prefix[start]
+                                                           for start, end in zip(edges, edges[1:])))
+                                     for bucket_y, prefix in enumerate(rows)}
+
+    #Apply the cells that changed while a background build ran. Call it from
+    #the thread that changes the world, once the build has finished.
+    def catch_up(self):
+        pending = self.pending
+        self.pending = None
+        for x, y in pending or ():
+            self.cell_changed(x, y)
+
+    #Fill every bucket now instead of on first use
+    def build(self):
+        for bucket_y in range(self.rows):
+            self.ensure_row(bucket_y, 0, self.columns)
+        return self
+
+    def close(self):
+        self.world.remove_observer(self.cell_changed)
+
+    def count_row(self, ore_type, bucket_y):
+        row = self.counts[ore_type].get(bucket_y)
+        if row is None:
+            row = self.counts[ore_type][bucket_y] = array('i', bytes(4 * self.columns))
+        return row
+
+    #Scan one bucket's cells for undug ore
+    def build_bucket(self, bucket_x, bucket_y):
+        world = self.world
+        size = self.bucket_size
+        found = {}
+        block_type = world.block_type
+        is_dug = world.is_dug
+        x_range = range(bucket_x * size, min((bucket_x + 1) * size, world.width))
+        for y in range(bucket_y * size, min((bucket_y + 1) * size, world.height)):
+            for x in x_range:
+                cell_type = block_type(x, y)
+                if cell_type in ORE_TYPES and not is_dug(x, y):
+                    found[(x, y)] = cell_type
+        self.buckets[(bucket_x, bucket_y)] = found
+        for cell_type in found.values():
+            self.count_row(cell_type, bucket_y)[bucket_x] += 1
+        return found
+
+    #Make sure buckets first_x..end_x-1 of a bucket row are filled
+    def ensure_row(self, bucket_y, first_x, end_x):
+        built = self.built_rows.get(bucket_y)
+        if built is None:
+            built = self.built_rows[bucket_y] = bytearray(self.columns)
+        missing = built.find(0, first_x, end_x)
+        while missing != -1:
+            self.build_bucket(missing, bucket_y)
+            built[missing] = 1
+            missing = built.find(0, missing + 1, end_x)
+
+    def bucket(self, bucket_x, bucket_y):
+        found = self.buckets.get((bucket_x, bucket_y))
+        if found is None:
+            self.ensure_row(bucket_y, bucket_x, bucket_x + 1)
+            found = self.buckets[(bucket_x, bucket_y)]
+        return found
+
+    #World observer: bring a filled bucket up to date with a changed cell
+    def cell_changed(self, x, y):
+        if self.pending is not None:
+            self.pending.add((x, y))
+            return
+        bucket_x = x // self.bucket_size
+        bucket_y = y // self.bucket_size
+        found = self.buckets.get((bucket_x, bucket_y))
+        if found is None:
+            return
+        position = (x, y)
+        listed = found.get(position)
+        block_type = self.world.block_type(x, y)
+        if listed is None and block_type not in ORE_TYPES:
+            return
+        current = block_type if block_type in ORE_TYPES and not self.world.is_dug(x, y) else None
+        if current == listed:
+            return
+        if listed is not None:
+            del found[position]
+            self.counts[listed][bucket_y][bucket_x] -= 1
+            if self.prefix is not None:
+                self.shift_prefix(listed, x, y, -1)
+        if current is not None:
+            found[position] = current
+            self.count_row(current, bucket_y)[bucket_x] += 1
+            if self.prefix is not None:
+                self.shift_prefix(current, x, y, 1)
+
+    #Add (change 1) or take away (change -1) one ore in the prefix sums and row columns
+    def shift_prefix(self, ore_type, x, y, change):
+        columns = self.row_ores[ore_type].setdefault(y, [])
+        if change > 0:
+            insort(columns, x)
+        else:
+            del columns[bisect_left(columns, x)]
+        prefix = self.prefix[ore_type][y // self.bucket_size]
+        for index in range(x + 1, len(prefix)):
+            prefix[index] += change
+
+    #Number of undug blocks of the given types in the cells x0 <= x < x1, y0 <= y < y1
+    def count(self, x0, y0, x1, y1, types=GOLD_TYPES):
+        x0 = max(x0, 0)
+        y0 = max(y0, 0)
+        x1 = min(x1, self.world.width)
+        y1 = min(y1, self.world.height)
+        if x0 >= x1 or y0 >= y1:
+            return 0
+        if self.prefix is not None:
+            return self.count_prefix(x0, y0, x1, y1, types)
+        size = self.bucket_size
+        first_x, last_x = x0 // size, (x1 - 1) // size
+        # Buckets whose columns lie completely inside the region
+        full_x0 = first_x if x0 % size == 0 else first_x + 1
+        full_x1 = last_x + 1 if x1 % size == 0 or x1 == self.world.width else last_x
+        total = 0
+        for bucket_y in range(y0 // size, (y1 - 1) // size + 1):
+            self.ensure_row(bucket_y, first_x, last_x + 1)
+            row_top = bucket_y * size
+            rows_inside = y0 <= row_top and min(row_top + size, self.world.height) <= y1
+            if rows_inside and full_x0 < full_x1:
+                for ore_type in types:
+                    counts = self.counts[ore_type].get(bucket_y)
+                    if counts is not None:
+                        total += sum(counts[full_x0:full_x1])
+                partial = [bucket_x for bucket_x in (first_x, last_x) if not full_x0 <= bucket_x < full_x1]
+            else:
+                partial = range(first_x, last_x + 1)
+            for bucket_x in set(partial):
+                found = self.buckets[(bucket_x, bucket_y)]
+                total += sum(1 for (x, y), ore_type in found.items()
+                             if ore_type in types and x0 <= x < x1 and y0 <= y < y1)
+        return total
+
+    #count for a fully built index: prefix sums for the bucket rows the region
+    #covers from top to bottom, sorted row columns for the rest
+    def count_prefix(self, x0, y0, x1, y1, types):
+        types = [ore_type for ore_type in types if ore_type in self.prefix]
+        size = self.bucket_size
+        height = self.world.height
+        total = 0
+        y = y0
+        while y < y1:
+            bucket_y = y // size
+            row_end = min((bucket_y + 1) * size, height)
+            if y == bucket_y * size and row_end <= y1:
+                for ore_type in types:
+                    prefix = self.prefix[ore_type][bucket_y]
+                    total += prefix[x1] - prefix[x0]
+                y = row_end
+                continue
+            stop = min(row_end, y1)
+            for ore_type in types:
+                rows = self.row_ores[ore_type]
+                for cell_y in range(y, stop):
+                    columns = rows.get(cell_y)
+                    if columns:
+                        total += bisect_left(columns, x1) - bisect_left(columns, x0)
+            y = stop
+        return total
+
+    #Closest undug block of the given types by Manhattan distance, ties going to
+    #the lowest row then column. Returns (x, y) or None. Without max_distance
+    #the search can reach every bucket of the world.
+    def nearest(self, x, y, types=GOLD_TYPES, max_distance=None):
+        size = self.bucket_size
+        center_x = x // size
+        center_y = y // size
+        max_ring = max(self.columns, self.rows)
+        if max_distance is not None:
+            max_ring = min(max_ring, max_distance // size + 1)
+        best = None
+        best_key = None
+        for ring in range(max_ring + 1):
+            # Every cell in this ring is more than (ring - 1) buckets away
+            if best_key is not None and best_key[0] <= (ring - 1) * size:
+                break
+            for bucket_x, bucket_y in self.ring(center_x, center_y, ring):
+                for position, ore_type in self.bucket(bucket_x, bucket_y).items():
+                    if ore_type not in types:
+                        continue
+                    cell_x, cell_y = position
+                    distance = abs(cell_x - x) + abs(cell_y - y)
+                    if max_distance is not None and distance > max_distance:
+                        continue
+                    key = (distance, cell_y, cell_x)
+                    if best_key is None or key < best_key:
+                        best_key = key
+                        best = position
+        return best
+
+    #Buckets at Chebyshev distance ring from a bucket, clipped to the world
+    def ring(self, center_x, center_y, ring):
+        if ring == 0:
+            return [(center_x, center_y)]
+        first_x = max(center_x - ring, 0)
+        last_x = min(center_x + ring, self.columns - 1)
+        buckets = []
+        for bucket_y in (center_y - ring, center_y + ring):
+            if 0 <= bucket_y < self.rows:
+                buckets.extend((bucket_x, bucket_y) for bucket_x in range(first_x, last_x + 1))
+        for bucket_x in (center_x - ring, center_x + ring):
+            if 0 <= bucket_x < self.columns:
+                buckets.extend((bucket_x, bucket_y) for bucket_y in range(max(center_y - ring + 1, 0),
+                                                                          min(center_y + ring, self.rows)))
+        return buckets
+
+    #Where the artifact still waits to be dug up, or None once it has been found
+    def artifact(self):
+        artifact_x, artifact_y = self.world.artifact_pos
+        if self.world.is_dug(artifact_x, artifact_y):
+            return None
+        return self.world.artifact_pos
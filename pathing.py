@@ -0,0 +1,218 @@
+#Auto-dig routing for Gold Digger. A DistanceField holds, for every cell in a
+#window around the player and a target, the cheapest time to reach the target
+#and mine it: entering an open or dug cell costs one move, entering a solid
+#block costs its mine time. The field is built once per target with Dijkstra
+#and then repaired in place when a cell is dug, since digging only ever makes
+#routes cheaper. The AutoDigger turns the field into one StepInput per step.
+
+import heapq
+from array import array
+
+from settings import MOVEMENT_DELAY, SIMULATION_STEP, SURFACE_ROW, AUTODIG_MARGIN
+from world import BLOCK_EMPTY, BLOCK_ARTIFACT, MINE_TIMES
+from simulation import StepInput, NO_INPUT
+
+INFINITY = float("inf")
+# Neighbour offsets and the direction that moves the player onto them
+MOVES = ((1, 0, "RIGHT"), (-1, 0, "LEFT"), (0, 1, "DOWN"), (0, -1, "UP"))
+
+class DistanceField:
+    #Cost to reach and mine a target from every cell of a window of the world
+    def __init__(self, world, target, start, margin=AUTODIG_MARGIN):
+        self.world = world
+        self.target = target
+        self.left = max(min(target[0], start[0]) - margin, 0)
+        self.top = max(min(target[1], start[1]) - margin, SURFACE_ROW)
+        self.right = min(max(target[0], start[0]) + margin + 1, world.width)
+        self.bottom = min(max(target[1], start[1]) + margin + 1, world.height)
+        self.width = self.right - self.left
+        assert self.contains(*target), f"Auto-dig target {target} is outside the routing window"
+        cell_count = self.width * (self.bottom - self.top)
+        self.cost = array('d', [INFINITY]) * cell_count # Time to enter each cell
+        self.distance = array('d', [INFINITY]) * cell_count # Time from each cell to the mined target
+        self.stale = False
+        self.cells_settled = 0
+        for y in range(self.top, self.bottom):
+            for x in range(self.left, self.right):
+                self.cost[self.index(x, y)] = self.enter_cost(x, y)
+        self.distance[self.index(*target)] = 0.0
+        self.propagate([(0.0, self.index(*target))])
+        world.add_observer(self.cell_changed)
+
+    def close(self):
+        self.world.remove_observer(self.cell_changed)
+
+    def contains(self, x, y):
+        return self.left <= x < self.right and self.top <= y < self.bottom
+
+    def index(self, x, y):
+        return (y - self.top) * self.width + (x - self.left)
+
+    #Time to step onto a cell. The artifact ends the round, so it is only
+    #entered when it is the target.
+    def enter_cost(self, x, y):
+        world = self.world
+        block_type = world.block_type(x, y)
+        if block_type == BLOCK_EMPTY or world.is_dug(x, y):
+            return MOVEMENT_DELAY
+        if block_type == BLOCK_ARTIFACT and (x, y) != self.target:
+            return INFINITY
+        return MINE_TIMES[block_type]
+
+    #Dijkstra outward from the queued cells, lowering distances as it goes
+    def propagate(self, heap):
+        cost = self.cost
+        distance = self.distance
+        width = self.width
+        row_count = self.bottom - self.top
+        while heap:
+            cell_distance, index = heapq.heappop(heap)
+            if cell_distance > distance[index]:
+                continue
+            self.cells_settled += 1
+            # Reaching this cell from a neighbour means paying to enter it
+            through = cell_distance + cost[index]
+            row, column = divmod(index, width)
+            if column + 1 < width and through < distance[index + 1]:
+                distance[index + 1] = through
+                heapq.heappush(heap, (through, index + 1))
+            if column > 0 and through < distance[index - 1]:
+                distance[index - 1] = through
+                heapq.heappush(heap, (through, index - 1))
+            if row + 1 < row_count and through < distance[index + width]:
+                distance[index + width] = through
+                heapq.heappush(heap, (through, index + width))
+            if row > 0 and through < distance[index - width]:
+                distance[index - width] = through
+                heapq.heappush(heap, (through, index - width))
+
+    #World observer: a dug cell got cheaper to cross, so only distances through
+    #it can drop. Anything that got dearer, such as a replaced block, marks the
+    #field stale so it is rebuilt.
+    def cell_changed(self, x, y):
+        if not self.contains(x, y):
+            return
+        index = self.index(x, y)
+        new_cost = self.enter_cost(x, y)
+        old_cost = self.cost[index]
+        if new_cost == old_cost:
+            return
+        self.cost[index] = new_cost
+        if new_cost > old_cost:
+            self.stale = True
+        elif self.distance[index] < INFINITY:
+            self.propagate([(self.distance[index], index)])
+
+    def distance_from(self, x, y):
+        if not self.contains(x, y):
+            return INFINITY
+        return self.distance[self.index(x, y)]
+
+    #Direction of the cheapest first step from a cell, or None when the
+    #target can't be reached from it inside the window
+    def next_direction(self, x, y):
+        best = None
+        best_direction = None
+        for offset_x, offset_y, direction in MOVES:
+            next_x = x + offset_x
+            next_y = y + offset_y
+            if not self.contains(next_x, next_y):
+                continue
+            index = self.index(next_x, next_y)
+            total = self.cost[index] + self.distance[index]
+            if total < INFINITY and (best is None or total < best):
+                best = total
+                best_direction = direction
+        return best_direction
+
+    #Cells along the cheapest route from a cell to the target, start excluded
+    def route(self, x, y):
+        cells = []
+        while (x, y) != self.target and len(cells) <= self.width * (self.bottom - self.top):
+            direction = self.next_direction(x, y)
+            if direction is None:
+                return None
+            offset_x, offset_y = next((dx, dy) for dx, dy, name in MOVES if name == direction)
+            x += offset_x
+            y += offset_y
+            cells.append((x, y))
+        return cells
+
+    #Drill time the route from a cell would use up, counting only blocks still
+    #to mine. Mining runs in whole simulation steps, so each block can take up
+    #to one step more than its mine time.
+    def durability_needed(self, x, y):
+        cells = self.route(x, y)
+        if cells is None:
+            return INFINITY
+        needed = 0.0
+        for cell_x, cell_y in cells:
+            cost = self.cost[self.index(cell_x, cell_y)]
+            if cost != MOVEMENT_DELAY:
+                needed += cost * (1.0 - self.world.get_progress(cell_x, cell_y)) + SIMULATION_STEP
+        return needed
+
+class AutoDigger:
+    #Steers the player to a target cell along a cached distance field
+    def __init__(self, sim):
+        self.sim = sim
+        self.field = None
+        self.status = None
+
+    @property
+    def active(self):
+        return self.field is not None
+
+    #Route to a cell, returns False when it can't be reached or the drill
+    #wouldn't last the whole way
+    def start(self, target):
+        self.cancel()
+        sim = self.sim
+        player = sim.player
+        # The sky rows have nothing to dig and lie outside every routing window
+        if (target is None or not sim.world.in_bounds(*target) or target[1] <= SURFACE_ROW
+                or sim.world.is_dug(*target)):
+            self.status = "no target"
+            return False
+        field = DistanceField(sim.world, target, (player.grid_x, player.grid_y))
+        needed = field.durability_needed(player.grid_x, player.grid_y)
+        if needed == INFINITY:
+            self.status = "unreachable"
+        elif needed > player.dig_time_remaining:
+            self.status = "not enough durability"
+        else:
+            self.field = field
+            self.status = "digging"
+            return True
+        field.close()
+        return False
+
+    def cancel(self):
+        if self.field is not None:
+            self.field.close()
+            self.field = None
+
+    #Input for the next simulation step
+    def next_input(self):
+        field = self.field
+        player = self.sim.player
+        if field is None:
+            return NO_INPUT
+        if player.dig_time_remaining <= 0 or self.sim.show_game_over:
+            self.status = "drill broke"
+            self.cancel()
+            return StepInput(None, True)
+        if field.world is not self.sim.world or (player.grid_x, player.grid_y) == field.target:
+            self.status = "arrived"
+            self.cancel()
+            return StepInput(None, True)
+        if field.stale:
+            self.field = DistanceField(field.world, field.target, (player.grid_x, player.grid_y))
+            field.close()
+            field = self.field
+        direction = field.next_direction(player.grid_x, player.grid_y)
+        if direction is None:
+            self.status = "unreachable"
+            self.cancel()
+            return StepInput(None, True)
+        return StepInput(direction, direction != player.moving_direction and player.mining_target is not None)
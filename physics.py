@@ -0,0 +1,89 @@
+#Falling blocks for Gold Digger. Loose material, dirt and gold nuggets, drops
+#into an open cell below it one cell per fall step until it lands on something
+#solid, so tunnels dug under dirt cave in behind the player. Stone, gold in
+#stone and the artifact never move.
+#
+#Only an active set of cells is checked each step: the cell above any cell that
+#changed, found through the world observer, and every block that is still
+#falling. A step costs as much as the digging and falling going on, whatever
+#the size of the map. Cells are handled bottom up so a column drops together.
+#
+#Cells a falling block came to rest in are remembered as landed, since they
+#are the only blocks a player with a broken drill can dig out by hand.
+
+from settings import SURFACE_ROW, FALL_INTERVAL
+from world import BLOCK_EMPTY, BLOCK_DIRT, BLOCK_GOLD
+
+LOOSE_TYPES = frozenset((BLOCK_DIRT, BLOCK_GOLD))
+
+class FallingBlocks:
+    #Gravity for the loose blocks of one world
+    def __init__(self, world, interval=FALL_INTERVAL):
+        self.world = world
+        self.interval = interval
+        self.active = set() # Cells that may be able to fall
+        self.resting = set() # Blocks held up by a player, checked again once players move
+        self.resting_on = frozenset()
+        self.landed = set() # Undug cells filled by a block that fell into them
+        self.elapsed = 0.0
+        self.blocks_moved = 0
+        world.add_observer(self.cell_changed)
+
+    def close(self):
+        self.world.remove_observer(self.cell_changed)
+
+    #World observer: whatever happened to a cell, the block above may have lost its support
+    def cell_changed(self, x, y):
+        if y > SURFACE_ROW + 1:
+            self.active.add((x, y - 1))
+        if (x, y) in self.landed and self.world.is_dug(x, y):
+            self.landed.discard((x, y))
+
+    #True when the cell holds a block that fell into it and hasn't been dug out since
+    def has_landed(self, x, y):
+        return (x, y) in self.landed
+
+    def is_open(self, x, y):
+        world = self.world
+        return world.block_type(x, y) == BLOCK_EMPTY or world.is_dug(x, y)
+
+    #True when the cell holds an undug loose block with an open cell below it
+    def can_fall(self, x, y):
+        world = self.world
+        if y + 1 >= world.height or world.block_type(x, y) not in LOOSE_TYPES or world.is_dug(x, y):
+            return False
+        return self.is_open(x, y + 1)
+
+    #Advance by dt seconds and drop every active block that has room to fall.
+    #A block never falls into an occupied cell, it rests on the player until
+    #the player moves away. Returns the number of blocks that moved.
+    def step(self, dt, occupied=frozenset()):
+        if self.resting and occupied != self.resting_on:
+            self.active |= self.resting
+            self.resting = set()
+        if not self.active:
+            self.elapsed = 0.0
+            return 0
+        self.elapsed += dt
+        if self.elapsed < self.interval:
+            return 0
+        self.elapsed -= self.interval
+        world = self.world
+        cells = sorted(self.active, key=lambda cell: (-cell[1], cell[0]))
+        self.active = set()
+        moved = 0
+        for x, y in cells:
+            if not self.can_fall(x, y):
+                continue
+            if (x, y + 1) in occupied:
+                self.resting.add((x, y))
+                self.resting_on = occupied
+                continue
+            # The block moves down and leaves an open cell, which activates the one above
+            world.fill(x, y + 1, world.block_type(x, y))
+            world.set_dug(x, y)
+            self.landed.add((x, y + 1))
+            self.active.add((x, y + 1))
+            moved += 1
+        self.blocks_moved += moved
+        return moved
@@ -0,0 +1,143 @@
+#Frame profiler. Records how long each phase of a frame took into a ring
+#buffer, draws a toggleable overlay with percentiles and a frame-time graph,
+#and exports the recorded frames as a Chrome trace (chrome://tracing or
+#Perfetto). While disabled every call returns straight away.
+
+import json
+import time
+from array import array
+
+import pygame
+
+from settings import PROFILER_FRAMES, WINDOW_WIDTH, WHITE, GREEN, RED
+
+FRAME_BUDGET_MS = 1000 / 60
+GRAPH_FRAMES = 150
+GRAPH_HEIGHT = 60
+GRAPH_SCALE_MS = 2 * FRAME_BUDGET_MS # Frame time at the top of the graph
+PANEL_WIDTH = 320
+PANEL_ALPHA = 200
+
+#Value at the given percentile (0-100) of a sorted list
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+class FrameProfiler:
+    #Per-phase frame timings kept for the last PROFILER_FRAMES frames
+    def __init__(self, capacity=PROFILER_FRAMES, enabled=False):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.phases = {} # Phase name -> array of durations in ms, indexed by frame slot
+        self.frame_starts = array('d', bytes(8 * capacity))
+        self.frame_totals = array('d', bytes(8 * capacity))
+        self.frames_recorded = 0
+        self.frame_start = 0.0
+        self.last_mark = 0.0
+        self.slot = 0
+        self.in_frame = False # begin_frame ran while enabled and end_frame hasn't yet
+
+    #Turning the profiler on mid-frame, e.g. from the input handler, starts
+    #recording with the next begin_frame
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.in_frame = False
+
+    #Start timing a new frame
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.frame_start = now
+        self.last_mark = now
+        self.in_frame = True
+        self.slot = self.frames_recorded % self.capacity
+        for durations in self.phases.values():
+            durations[self.slot] = 0.0
+
+    #Charge the time since the previous mark to the named phase
+    def mark(self, phase):
+        if not self.in_frame:
+            return
+        now = time.perf_counter()
+        durations = self.phases.get(phase)
+        if durations is None:
+            durations = self.phases[phase] = array('d', bytes(8 * self.capacity))
+        durations[self.slot] += (now - self.last_mark) * 1000
+        self.last_mark = now
+
+    #Finish the current frame and store it in the ring buffer
+    def end_frame(self):
+        if not self.in_frame:
+            return
+        self.in_frame = False
+        self.frame_starts[self.slot] = self.frame_start
+        self.frame_totals[self.slot] = (time.perf_counter() - self.frame_start) * 1000
+        self.frames_recorded += 1
+
+    #Buffer slots of the recorded frames, oldest first
+    def recorded_slots(self):
+        count = min(self.frames_recorded, self.capacity)
+        first = self.frames_recorded - count
+        return [frame % self.capacity for frame in range(first, self.frames_recorded)]
+
+    #Percentiles in ms for the whole frame and each phase
+    def summary(self):
+        slots = self.recorded_slots()
+        rows = {"frame": sorted(self.frame_totals[slot] for slot in slots)}
+        for phase, durations in self.phases.items():
+            rows[phase] = sorted(durations[slot] for slot in slots)
+        return {
+            name: {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+            for name, values in rows.items()
+        }
+
+    #Write the recorded frames as Chrome trace events
+    def export_chrome_trace(self, path):
+        events = []
+        for frame_number, slot in enumerate(self.recorded_slots()):
+            start_us = self.frame_starts[slot] * 1e6
+            events.append({
+                "name": "frame", "ph": "X", "pid": 1, "tid": 1,
+                "ts": start_us, "dur": self.frame_totals[slot] * 1000,
+                "args": {"frame": frame_number},
+            })
+            offset_us = start_us
+            for phase, durations in self.phases.items():
+                duration_us = durations[slot] * 1000
+                if duration_us > 0:
+                    events.append({"name": phase, "ph": "X", "pid": 1, "tid": 2, "ts": offset_us, "dur": duration_us})
+                offset_us += duration_us
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        return len(events)
+
+    #Draw the stats panel and frame-time graph, returns the screen rect it covered
+    def draw_overlay(self, screen, text_cache, position=(WINDOW_WIDTH - PANEL_WIDTH - 10, 10)):
+        summary = self.summary()
+        lines = [f"frame  p50 {summary['frame']['p50']:5.2f}  p95 {summary['frame']['p95']:5.2f}  p99 {summary['frame']['p99']:5.2f} ms"]
+        for phase in self.phases:
+            lines.append(f"{phase:<10} p50 {summary[phase]['p50']:5.2f}  p95 {summary[phase]['p95']:5.2f} ms")
+
+        line_height = 16
+        panel_height = 8 + line_height * len(lines) + GRAPH_HEIGHT + 8
+        panel = pygame.Surface((PANEL_WIDTH, panel_height), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, PANEL_ALPHA))
+        for row, line in enumerate(lines):
+            panel.blit(text_cache.render(line, 18, WHITE), (6, 4 + row * line_height))
+
+        # Frame-time graph with a line at the 60 FPS budget
+        graph_top = 8 + line_height * len(lines)
+        graph_bottom = graph_top + GRAPH_HEIGHT
+        budget_y = graph_bottom - int(GRAPH_HEIGHT * FRAME_BUDGET_MS / GRAPH_SCALE_MS)
+        pygame.draw.line(panel, GREEN, (0, budget_y), (PANEL_WIDTH, budget_y))
+        bar_width = PANEL_WIDTH / GRAPH_FRAMES
+        for column, slot in enumerate(self.recorded_slots()[-GRAPH_FRAMES:]):
+            total = self.frame_totals[slot]
+            height = min(GRAPH_HEIGHT, int(GRAPH_HEIGHT * total / GRAPH_SCALE_MS))
+            color = RED if total > FRAME_BUDGET_MS else WHITE
+            left = int(column * bar_width)
+            pygame.draw.line(panel, color, (left, graph_bottom), (left, graph_bottom - height))
+        return screen.blit(panel, position)
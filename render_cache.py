@@ -0,0 +1,132 @@
+#Cached terrain rendering. The world is pre-rendered into fixed-size tile
+#surfaces, only cells whose state changed are redrawn into their tile, and
+#the screen rectangles that actually changed are collected for
+#pygame.display.update instead of flipping the whole window.
+
+from collections import OrderedDict
+
+import pygame
+
+from settings import (
+    WINDOW_WIDTH, WINDOW_HEIGHT, BLOCK_SIZE, SURFACE_ROW, SKY_BLUE,
+    TERRAIN_TILE_CELLS, TERRAIN_TILE_CACHE_SIZE,
+)
+from world import block_color
+
+class TerrainCache:
+    #Tile cache of rendered terrain that tracks which cells need redrawing
+    def __init__(self, world, tile_cells=TERRAIN_TILE_CELLS, max_tiles=TERRAIN_TILE_CACHE_SIZE):
+        self.world = world
+        self.tile_cells = tile_cells
+        self.tile_pixels = tile_cells * BLOCK_SIZE
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.dirty_cells = set()
+        self.last_camera = None
+        self.tiles_built = 0
+        self.cells_redrawn = 0
+        world.add_observer(self.mark_dirty)
+
+    #Record that the cell at (x, y) changed and must be re-rasterised
+    def mark_dirty(self, x, y):
+        self.dirty_cells.add((x, y))
+
+    #Force the next draw to repaint the whole view, e.g. after a dialog covered it
+    def invalidate_view(self):
+        self.last_camera = None
+
+    #Draw one cell into a surface at the given pixel position
+    def draw_cell(self, surface, x, y, pixel_x, pixel_y):
+        cell_rect = (pixel_x, pixel_y, BLOCK_SIZE, BLOCK_SIZE)
+        world = self.world
+        if y <= SURFACE_ROW or not world.in_bounds(x, y):
+            surface.fill(SKY_BLUE, cell_rect)
+            return
+        block_type = world.block_type(x, y)
+        if not block_type or world.is_dug(x, y):
+            surface.fill(SKY_BLUE, cell_rect)
+            return
+        surface.fill(block_color(block_type, y), cell_rect)
+
+        # Draw mining progress overlay
+        progress = world.get_progress(x, y)
+        if progress > 0:
+            surface.fill(SKY_BLUE, (pixel_x, pixel_y, BLOCK_SIZE, int(BLOCK_SIZE * progress)))
+
+    #Render a whole tile from the world
+    def build_tile(self, tile_x, tile_y):
+        surface = pygame.Surface((self.tile_pixels, self.tile_pixels))
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        surface.fill(SKY_BLUE)
+        origin_x = tile_x * self.tile_cells
+        origin_y = tile_y * self.tile_cells
+        for local_y in range(self.tile_cells):
+            y = origin_y + local_y
+            if y <= SURFACE_ROW or y >= self.world.height:
+                continue
+            for local_x in range(self.tile_cells):
+                x = origin_x + local_x
+                if x < self.world.width:
+                    self.draw_cell(surface, x, y, local_x * BLOCK_SIZE, local_y * BLOCK_SIZE)
+        self.tiles_built += 1
+        return surface
+
+    #Return a cached tile surface, building it and evicting old tiles as needed
+    def get_tile(self, tile_x, tile_y):
+        key = (tile_x, tile_y)
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.build_tile(tile_x, tile_y)
+            self.tiles[key] = tile
+            if len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+        else:
+            self.tiles.move_to_end(key)
+        return tile
+
+    #Blit every visible tile, limited to the screen clip area if one is set
+    def blit_view(self, screen, camera_x, camera_y):
+        tile_pixels = self.tile_pixels
+        first_tile_x = camera_x // tile_pixels
+        first_tile_y = camera_y // tile_pixels
+        last_tile_x = (camera_x + WINDOW_WIDTH) // tile_pixels
+        last_tile_y = (camera_y + WINDOW_HEIGHT) // tile_pixels
+        clip = screen.get_clip()
+        for tile_y in range(first_tile_y, last_tile_y + 1):
+            for tile_x in range(first_tile_x, last_tile_x + 1):
+                position = (tile_x * tile_pixels - camera_x, tile_y * tile_pixels - camera_y)
+                if clip.colliderect((position, (tile_pixels, tile_pixels))):
+                    screen.blit(self.get_tile(tile_x, tile_y), position)
+
+    #Redraw changed terrain onto the screen and return the rectangles that changed.
+    #restore_rects are areas drawn over last frame (player, HUD) to be repainted.
+    def draw(self, screen, camera_x, camera_y, restore_rects=()):
+        camera_x = int(camera_x)
+        camera_y = int(camera_y)
+
+        # Re-rasterise changed cells into the tiles that are already cached
+        changed_rects = []
+        tile_cells = self.tile_cells
+        for x, y in self.dirty_cells:
+            tile = self.tiles.get((x // tile_cells, y // tile_cells))
+            if tile is not None:
+                self.draw_cell(tile, x, y, (x % tile_cells) * BLOCK_SIZE, (y % tile_cells) * BLOCK_SIZE)
+                self.cells_redrawn += 1
+            changed_rects.append(pygame.Rect(x * BLOCK_SIZE - camera_x, y * BLOCK_SIZE - camera_y, BLOCK_SIZE, BLOCK_SIZE))
+        self.dirty_cells.clear()
+
+        # Scrolling repaints the whole view from the cached tiles
+        if (camera_x, camera_y) != self.last_camera:
+            self.last_camera = (camera_x, camera_y)
+            self.blit_view(screen, camera_x, camera_y)
+            return [screen.get_rect()]
+
+        screen_rect = screen.get_rect()
+        changed_rects = [rect for rect in changed_rects if rect.colliderect(screen_rect)]
+        changed_rects.extend(restore_rects)
+        for rect in changed_rects:
+            screen.set_clip(rect)
+            self.blit_view(screen, camera_x, camera_y)
+        screen.set_clip(None)
+        return changed_rects
@@ -0,0 +1,180 @@
+#Input recording and replay for Gold Digger. A recording holds the world seed
+#and everything that fed the simulation: each frame's input and delta time,
+#purchases made in the durability dialog and the seed of every new round.
+#Replaying feeds the same values back into a Simulation, which reproduces the
+#session exactly; a closing record of the final player state is checked to
+#prove it. Headless replays run uncapped, thousands of times faster than the
+#game was played.
+#
+#Layout: a gzip stream of a header, then records that each start with a tag byte
+#  header        magic, version, seed, world size, backend name, falling blocks flag
+#  step          input byte (direction index | released << 3), delta time
+#  purchase      gold spent on durability
+#  reset         seed of the new round
+#  end           steps, score, x, y, bonus, durability of the final state
+#
+#Usage: python GoldDiggerPythonGame.py --record session.gdr
+#       python replay.py session.gdr
+#       python replay.py session.gdr --visual
+
+import argparse
+import gzip
+import struct
+import sys
+import time
+
+from simulation import Simulation, StepInput
+from world import check_seed
+
+MAGIC = b"GDRP"
+VERSION = 2
+HEADER = struct.Struct("<4sHQi16s?")
+RECORD_STEP = 0
+RECORD_PURCHASE = 1
+RECORD_RESET = 2
+RECORD_END = 3
+STEP = struct.Struct("<Bd")
+PURCHASE = struct.Struct("<q")
+RESET = struct.Struct("<Q")
+END = struct.Struct("<qqiiqd")
+
+DIRECTIONS = (None, "RIGHT", "LEFT", "DOWN", "UP")
+INPUT_CODES = {direction: index for index, direction in enumerate(DIRECTIONS)}
+# Every possible input byte decoded once
+DECODED_INPUTS = [StepInput(DIRECTIONS[code & 7], bool(code & 8)) if code & 7 < len(DIRECTIONS) else None
+                  for code in range(16)]
+
+class ReplayError(Exception):
+    #Raised when a recording can't be read or a replay diverges from it
+    pass
+
+def encode_input(inputs):
+    return INPUT_CODES[inputs.direction] | (8 if inputs.released else 0)
+
+#Final player state stored at the end of a recording
+def end_state(sim):
+    player = sim.player
+    return (sim.steps, player.score, player.grid_x, player.grid_y, player.bonus_time, player.dig_time_remaining)
+
+#Seeds are recorded as unsigned 64-bit numbers, the same as in saves
+def check_recordable_seed(seed):
+    try:
+        check_seed(seed)
+    except ValueError as e:
+        raise ReplayError(f"Can't record this world: {e}")
+
+class InputRecorder:
+    #Writes everything that drives a Simulation to a recording file
+    def __init__(self, path, sim):
+        self.sim = sim
+        check_recordable_seed(sim.seed)
+        self.stream = gzip.open(path, "wb")
+        self.stream.write(HEADER.pack(MAGIC, VERSION, sim.seed, sim.size, sim.backend.encode(), sim.falling_blocks))
+
+    def record_step(self, inputs, dt):
+        self.stream.write(bytes((RECORD_STEP,)) + STEP.pack(encode_input(inputs), dt))
+
+    def record_purchase(self, gold_spent):
+        self.stream.write(bytes((RECORD_PURCHASE,)) + PURCHASE.pack(gold_spent))
+
+    def record_reset(self, seed):
+        check_recordable_seed(seed)
+        self.stream.write(bytes((RECORD_RESET,)) + RESET.pack(seed))
+
+    #Write the final state and close the file
+    def close(self):
+        self.stream.write(bytes((RECORD_END,)) + END.pack(*end_state(self.sim)))
+        self.stream.close()
+
+class Recording:
+    #A recording read back into memory
+    def __init__(self, path):
+        with gzip.open(path, "rb") as stream:
+            self.data = stream.read()
+        if len(self.data) < HEADER.size:
+            raise ReplayError(f"{path} is too short to be a recording")
+        magic, version, self.seed, self.size, backend, self.falling_blocks = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ReplayError(f"{path} is not a Gold Digger recording")
+        if version != VERSION:
+            raise ReplayError(f"{path} is recording version {version}, expected {VERSION}")
+        self.backend = backend.rstrip(b"\0").decode()
+
+    #Yield (tag, values) for every record in order
+    def records(self):
+        data = self.data
+        offset = HEADER.size
+        formats = {RECORD_STEP: STEP, RECORD_PURCHASE: PURCHASE, RECORD_RESET: RESET, RECORD_END: END}
+        while offset < len(data):
+            tag = data[offset]
+            record = formats.get(tag)
+            if record is None or offset + 1 + record.size > len(data):
+                raise ReplayError(f"Corrupt record at byte {offset}")
+            yield tag, record.unpack_from(data, offset + 1)
+            offset += 1 + record.size
+
+    def new_simulation(self):
+        return Simulation(self.seed, self.size, self.backend, falling_blocks=self.falling_blocks)
+
+#Apply one non-step record to a simulation, returns the expected end state for an end record
+def apply_record(sim, tag, values):
+    if tag == RECORD_PURCHASE:
+        if not sim.buy_durability(values[0]):
+            raise ReplayError(f"Recorded purchase of {values[0]} gold was refused at step {sim.steps}")
+    elif tag == RECORD_RESET:
+        sim.reset(values[0])
+    elif tag == RECORD_END:
+        return values
+    return None
+
+#Check the replayed simulation against the recorded final state
+def verify(sim, expected):
+    if expected is None:
+        raise ReplayError("Recording has no end record, the session did not close cleanly")
+    actual = end_state(sim)
+    if actual != tuple(expected):
+        raise ReplayError(f"Replay diverged: recorded {tuple(expected)}, replayed {actual}")
+
+#Re-run a recording as fast as possible without a display.
+#Returns (simulation, steps replayed, seconds of play replayed).
+def replay_headless(recording):
+    sim = recording.new_simulation()
+    step = sim.step
+    expected = None
+    steps = 0
+    play_time = 0.0
+    for tag, values in recording.records():
+        if tag == RECORD_STEP:
+            step(DECODED_INPUTS[values[0]], values[1])
+            steps += 1
+            play_time += values[1]
+        else:
+            expected = apply_record(sim, tag, values) or expected
+    verify(sim, expected)
+    return sim, steps, play_time
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded Gold Digger session.")
+    parser.add_argument("recording")
+    parser.add_argument("--visual", action="store_true", help="Show the replay in a window at the recorded speed")
+    args = parser.parse_args(argv)
+
+    try:
+        recording = Recording(args.recording)
+        if args.visual:
+            from GoldDiggerPythonGame import Game
+            game = Game(recording.seed, replaying=True, falling_blocks=recording.falling_blocks)
+            game.play_recording(recording)
+            return 0
+        start = time.perf_counter()
+        _, steps, play_time = replay_headless(recording)
+        elapsed = time.perf_counter() - start
+    except (OSError, ReplayError) as e:
+        print(f"Replay failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Replayed {steps} steps ({play_time:.1f}s of play) in {elapsed:.3f}s, "
+          f"{play_time / max(elapsed, 1e-9):.0f}x real time. Final state matches the recording.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,472 @@
+#Save files for Gold Digger. A save holds the player state, the world's block
+#types packed four bits per cell, a dug bitmap and a sparse table of partial
+#mining progress. Loading memory-maps the file so large worlds open at once
+#and pages are only read as the camera reaches them. Autosave runs on a
+#background thread and rewrites only the bytes for cells changed since the
+#previous save.
+#
+#Layout (little-endian):
+#  header        player state, world size and seed, padded to SECTION_ALIGN
+#  types         4-bit block type codes, two cells per byte, low nibble first
+#  dug           one bit per cell, lowest bit first
+#  progress      progress_count entries of (uint32 cell index, float32 progress)
+
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+from settings import SAVE_PATH, AUTOSAVE_INTERVAL, SURFACE_ROW
+from world import (
+    ObservableWorld, WorldGrid, SeededWorld, BLOCK_EMPTY, BLOCK_ARTIFACT, GOLD_TYPES, MINE_TIMES,
+    artifact_position, check_seed,
+)
+
+MAGIC = b"GDSV"
+VERSION = 1
+TYPE_BITS = 4
+SECTION_ALIGN = 4096
+HEADER = struct.Struct("<4sHBxIIQiiqdiB3xI")
+PROGRESS_ENTRY = struct.Struct("<If")
+
+# Byte translation tables used to pack and unpack whole sections at C speed
+HIGH_NIBBLE = bytes((value << 4) & 0xFF for value in range(256))
+UNPACK_LOW_NIBBLE = bytes(value & 0x0F for value in range(256))
+UNPACK_HIGH_NIBBLE = bytes(value >> 4 for value in range(256))
+BIT_TABLES = [bytes((1 << bit) if value else 0 for value in range(256)) for bit in range(8)]
+UNPACK_BIT_TABLES = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+
+class SaveError(Exception):
+    #Raised when a save file is missing pieces or was written by another version
+    pass
+
+class PlayerState:
+    #The parts of the player that are saved
+    FIELDS = ("grid_x", "grid_y", "score", "dig_time_remaining", "bonus_time", "found_artifact")
+
+    def __init__(self, grid_x, grid_y, score, dig_time_remaining, bonus_time, found_artifact):
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.score = score
+        self.dig_time_remaining = dig_time_remaining
+        self.bonus_time = bonus_time
+        self.found_artifact = bool(found_artifact)
+
+    @classmethod
+    def from_player(cls, player):
+        return cls(*(getattr(player, field) for field in cls.FIELDS))
+
+    #Copy the saved values onto a player
+    def apply(self, player):
+        for field in self.FIELDS:
+            setattr(player, field, getattr(self, field))
+
+class SaveLayout:
+    #Section offsets and sizes for a world of the given size
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cell_count = width * height
+        self.types_offset = align(HEADER.size)
+        self.types_size = (self.cell_count + 1) // 2
+        self.dug_offset = align(self.types_offset + self.types_size)
+        self.dug_size = (self.cell_count + 7) // 8
+        self.progress_offset = align(self.dug_offset + self.dug_size)
+
+def align(offset):
+    return (offset + SECTION_ALIGN - 1) // SECTION_ALIGN * SECTION_ALIGN
+
+#Pack one block type code per byte into two codes per byte
+def pack_nibbles(types):
+    if len(types) % 2:
+        types = bytes(types) + b"\0"
+    low = types[0::2]
+    high = types[1::2].translate(HIGH_NIBBLE)
+    return (int.from_bytes(low, "little") | int.from_bytes(high, "little")).to_bytes(len(low), "little")
+
+#Pack one 0/1 flag per byte into a bitmap
+def pack_flags(flags):
+    padding = -len(flags) % 8
+    if padding:
+        flags = bytes(flags) + bytes(padding)
+    packed = 0
+    for bit in range(8):
+        packed |= int.from_bytes(flags[bit::8].translate(BIT_TABLES[bit]), "little")
+    return packed.to_bytes(len(flags) // 8, "little")
+
+def encode_header(layout, seed, player_state, progress_count):
+    return HEADER.pack(
+        MAGIC, VERSION, TYPE_BITS, layout.width, layout.height, seed,
+        player_state.grid_x, player_state.grid_y, player_state.score,
+        player_state.dig_time_remaining, player_state.bonus_time,
+        player_state.found_artifact, progress_count,
+    )
+
+def encode_progress(progress_table):
+    return b"".join(PROGRESS_ENTRY.pack(index, value) for index, value in sorted(progress_table.items()))
+
+class WorldSnapshot:
+    #Copy of a world's state taken on the game thread and written on the save thread
+    def __init__(self, width, height, seed, types, dug_flags, dug_indexes, progress):
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.types = types # Callable returning one byte per cell
+        self.dug_flags = dug_flags # Callable returning one 0/1 byte per cell, or None
+        self.dug_indexes = dug_indexes # Dug cell indexes when dug_flags is None
+        self.progress = progress # Callable returning {index: progress} for undug cells
+
+#Capture what a full save needs; the copies are cheap, the packing happens later
+def snapshot_world(world):
+    width = world.width
+    height = world.height
+    if isinstance(world, WorldGrid):
+        # Generating the missing chunks here would stall whoever asked for the save
+        if world.is_generating():
+            raise SaveError("The world is still being generated")
+        types = bytes(world.types)
+        dug = bytes(world.dug)
+        progress = world.progress[:]
+        def grid_progress():
+            return {index: value for index, value in enumerate(progress) if 0.0 < value < 1.0 and not dug[index]}
+        return WorldSnapshot(width, height, world.seed, lambda: types, lambda: dug, None, grid_progress)
+
+    if isinstance(world, (SeededWorld, MappedWorld)):
+        replaced = dict(world.replaced)
+        dug_indexes = set(world.dug)
+        progress = {index: value for index, value in world.progress.items() if 0.0 < value < 1.0}
+        base_types = world.base_types
+        base_dug = world.base_dug_flags if isinstance(world, MappedWorld) else None
+        filled_indexes = set(world.filled) if isinstance(world, MappedWorld) else ()
+        def overlay_types():
+            types = base_types()
+            for index, block_type in replaced.items():
+                types[index] = block_type
+            return types
+        def overlay_progress():
+            return {index: value for index, value in progress.items() if index not in dug_indexes}
+        if base_dug is None:
+            return WorldSnapshot(width, height, world.seed, overlay_types, None, dug_indexes, overlay_progress)
+        def overlay_dug():
+            flags = base_dug()
+            for index in filled_indexes:
+                flags[index] = 0
+            for index in dug_indexes:
+                flags[index] = 1
+            return flags
+        return WorldSnapshot(width, height, world.seed, overlay_types, overlay_dug, None, overlay_progress)
+
+    raise SaveError(f"{type(world).__name__} can't be saved")
+
+#Write a complete save file next to the target and move it into place
+def write_full_save(path, snapshot, player_state):
+    layout = SaveLayout(snapshot.width, snapshot.height)
+    if snapshot.dug_flags is not None:
+        dug_bitmap = pack_flags(snapshot.dug_flags())
+    else:
+        bitmap = bytearray(layout.dug_size)
+        for index in snapshot.dug_indexes:
+            bitmap[index >> 3] |= 1 << (index & 7)
+        dug_bitmap = bytes(bitmap)
+    progress_table = snapshot.progress()
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as save_file:
+        save_file.write(encode_header(layout, snapshot.seed, player_state, len(progress_table)))
+        save_file.seek(layout.types_offset)
+        save_file.write(pack_nibbles(snapshot.types()))
+        save_file.seek(layout.dug_offset)
+        save_file.write(dug_bitmap)
+        save_file.truncate(layout.progress_offset)
+        save_file.seek(layout.progress_offset)
+        save_file.write(encode_progress(progress_table))
+    os.replace(temp_path, path)
+    return progress_table
+
+#Write changed type and dug bytes in place, then the header and progress table
+def write_patch(path, layout, seed, player_state, byte_writes, progress_table):
+    with open(path, "r+b") as save_file:
+        for offset, data in byte_writes:
+            save_file.seek(offset)
+            save_file.write(data)
+        save_file.seek(layout.progress_offset)
+        save_file.write(encode_progress(progress_table))
+        save_file.truncate()
+        save_file.seek(0)
+        save_file.write(encode_header(layout, seed, player_state, len(progress_table)))
+
+#Group single-byte writes at consecutive offsets into runs
+def coalesce(writes):
+    runs = []
+    for offset, value in sorted(writes.items()):
+        if runs and runs[-1][0] + len(runs[-1][1]) == offset:
+            runs[-1][1].append(value)
+        else:
+            runs.append((offset, bytearray((value,))))
+    return runs
+
+class MappedWorld(ObservableWorld):
+    #World backed by a memory-mapped save file. The file is only read; cells
+    #changed after loading are kept in overlays until the next save writes them.
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        header = self.file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise SaveError(f"{path} is too short to be a save file")
+        fields = HEADER.unpack(header)
+        magic, version, type_bits, width, height, seed = fields[:6]
+        if magic != MAGIC or version != VERSION or type_bits != TYPE_BITS:
+            raise SaveError(f"{path} is not a version {VERSION} Gold Digger save")
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.artifact_pos = artifact_position(width, height)
+        self.player_state = PlayerState(*fields[6:12])
+        self.layout = SaveLayout(width, height)
+        self.map = mmap.mmap(self.file.fileno(), self.layout.progress_offset, access=mmap.ACCESS_READ)
+
+        self.file.seek(self.layout.progress_offset)
+        progress_count = fields[12]
+        table = self.file.read(progress_count * PROGRESS_ENTRY.size)
+        self.progress = dict(PROGRESS_ENTRY.iter_unpack(table))
+        self.dug = set()
+        self.filled = set() # Cells dug in the file that have been filled in again since
+        self.replaced = {}
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    #Block type codes for every cell straight from the mapped file
+    def base_types(self):
+        layout = self.layout
+        packed = self.map[layout.types_offset:layout.types_offset + layout.types_size]
+        types = bytearray(layout.types_size * 2)
+        types[0::2] = packed.translate(UNPACK_LOW_NIBBLE)
+        types[1::2] = packed.translate(UNPACK_HIGH_NIBBLE)
+        del types[layout.cell_count:]
+        return types
+
+    #One 0/1 byte per cell from the mapped dug bitmap
+    def base_dug_flags(self):
+        layout = self.layout
+        bitmap = self.map[layout.dug_offset:layout.dug_offset + layout.dug_size]
+        flags = bytearray(layout.dug_size * 8)
+        for bit in range(8):
+            flags[bit::8] = bitmap.translate(UNPACK_BIT_TABLES[bit])
+        del flags[layout.cell_count:]
+        return flags
+
+    #Block type codes and 0/1 dug flags of every cell, with the changes made since loading
+    def cell_arrays(self):
+        types = self.base_types()
+        for index, block_type in self.replaced.items():
+            types[index] = block_type
+        dug = self.base_dug_flags()
+        for index in self.dug:
+            dug[index] = 1
+        for index in self.filled:
+            dug[index] = 0
+        return types, dug
+
+    def block_type(self, x, y):
+        index = y * self.width + x
+        if self.replaced and index in self.replaced:
+            return self.replaced[index]
+        byte = self.map[self.layout.types_offset + (index >> 1)]
+        return (byte >> ((index & 1) << 2)) & 0x0F
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    #Check if there is a block (dug or not) at the given position
+    def __contains__(self, pos):
+        x, y = pos
+        return 0 <= x < self.width and SURFACE_ROW < y < self.height and self.block_type(x, y) != BLOCK_EMPTY
+
+    def set_block_type(self, x, y, block_type):
+        self.replaced[y * self.width + x] = block_type
+        self.notify(x, y)
+
+    def is_dug(self, x, y):
+        index = y * self.width + x
+        if index in self.dug:
+            return True
+        if self.filled and index in self.filled:
+            return False
+        return (self.map[self.layout.dug_offset + (index >> 3)] >> (index & 7)) & 1 == 1
+
+    def set_dug(self, x, y):
+        index = y * self.width + x
+        self.dug.add(index)
+        self.filled.discard(index)
+        self.notify(x, y)
+
+    #Put an undug block in a cell, clearing its dug flag and mining progress
+    def fill(self, x, y, block_type):
+        index = y * self.width + x
+        self.replaced[index] = block_type
+        self.dug.discard(index)
+        self.filled.add(index)
+        self.progress.pop(index, None)
+        self.notify(x, y)
+
+    def is_gold(self, x, y):
+        return self.block_type(x, y) in GOLD_TYPES
+
+    def is_artifact(self, x, y):
+        return self.block_type(x, y) == BLOCK_ARTIFACT
+
+    def get_progress(self, x, y):
+        return self.progress.get(y * self.width + x, 0.0)
+
+    def set_progress(self, x, y, value):
+        self.progress[y * self.width + x] = value
+        self.notify(x, y)
+
+    #Get the time required to mine the block at the given position
+    def get_mine_time(self, x, y):
+        return MINE_TIMES[self.block_type(x, y)]
+
+    def update_focus(self, positions):
+        pass
+
+    #Resident memory is up to the OS page cache, count only the overlays
+    def memory_usage(self):
+        return 64 * (len(self.dug) + len(self.filled) + len(self.progress) + len(self.replaced))
+
+#Open a save file, returning the mapped world and the saved player state
+def load_game(path=SAVE_PATH):
+    world = MappedWorld(path)
+    return world, world.player_state
+
+class Autosaver:
+    #Saves the simulation periodically on a background thread. The first save
+    #of a world writes the whole file; later ones write only changed cells.
+    def __init__(self, sim, path=SAVE_PATH, interval=AUTOSAVE_INTERVAL):
+        self.sim = sim
+        self.path = path
+        self.interval = interval
+        self.world = None
+        self.layout = None
+        self.dirty = set()
+        self.needs_full_save = True
+        self.last_save = time.monotonic()
+        self.saves_written = 0
+        self.bytes_written = 0
+        try:
+            check_seed(sim.seed)
+        except ValueError as e:
+            raise SaveError(str(e))
+        self.jobs = queue.Queue()
+        self.progress_table = {} # Owned by the save thread
+        self.thread = threading.Thread(target=self.save_loop, name="autosave", daemon=True)
+        self.thread.start()
+        self.watch_world()
+
+    #Start tracking changes in the simulation's current world
+    def watch_world(self):
+        if not isinstance(self.sim.world, (WorldGrid, SeededWorld, MappedWorld)):
+            raise SaveError(f"{type(self.sim.world).__name__} can't be saved; chunked worlds persist through their chunk cache")
+        if self.world is not None:
+            self.world.remove_observer(self.mark_dirty)
+        self.world = self.sim.world
+        self.layout = SaveLayout(self.world.width, self.world.height)
+        self.world.add_observer(self.mark_dirty)
+        self.dirty = set()
+        # A world mapped from our own save file already matches it on disk
+        self.needs_full_save = not (isinstance(self.world, MappedWorld)
+                                    and os.path.abspath(self.world.path) == os.path.abspath(self.path))
+        if not self.needs_full_save:
+            self.jobs.put(("table", dict(self.world.progress)))
+
+    def mark_dirty(self, x, y):
+        self.dirty.add(y * self.world.width + x)
+
+    #Save if the interval has passed; call once per frame
+    def update(self, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self.last_save >= self.interval:
+            self.save()
+            self.last_save = now
+
+    #Queue a save of everything changed since the last one
+    def save(self):
+        if self.sim.world is not self.world:
+            self.watch_world()
+        player_state = PlayerState.from_player(self.sim.player)
+        if self.needs_full_save:
+            # A grid filled in the background gets its first save once the
+            # loader is done; changes made until then are all in that save
+            if isinstance(self.world, WorldGrid) and self.world.is_generating():
+                return
+            self.jobs.put(("full", snapshot_world(self.world), player_state))
+            self.needs_full_save = False
+            self.dirty = set()
+            return
+        if not self.dirty:
+            self.jobs.put(("patch", self.world.seed, player_state, [], {}))
+            return
+
+        # Read the current bytes for every changed cell while still on the game thread
+        world = self.world
+        width = world.width
+        cell_count = self.layout.cell_count
+        byte_values = {}
+        progress_changes = {}
+        for index in self.dirty:
+            pair = index & ~1
+            low = world.block_type(pair % width, pair // width)
+            high = world.block_type((pair + 1) % width, (pair + 1) // width) if pair + 1 < cell_count else 0
+            byte_values[self.layout.types_offset + (index >> 1)] = low | (high << 4)
+
+            first = index & ~7
+            bits = 0
+            for bit, cell in enumerate(range(first, min(first + 8, cell_count))):
+                if world.is_dug(cell % width, cell // width):
+                    bits |= 1 << bit
+            byte_values[self.layout.dug_offset + (index >> 3)] = bits
+
+            x = index % width
+            y = index // width
+            progress = world.get_progress(x, y)
+            progress_changes[index] = progress if 0.0 < progress < 1.0 and not world.is_dug(x, y) else None
+        self.dirty = set()
+        self.jobs.put(("patch", world.seed, player_state, coalesce(byte_values), progress_changes))
+
+    #Save thread: apply queued jobs in order
+    def save_loop(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                kind = job[0]
+                if kind == "table":
+                    self.progress_table = job[1]
+                elif kind == "full":
+                    _, snapshot, player_state = job
+                    self.progress_table = write_full_save(self.path, snapshot, player_state)
+                    self.bytes_written += os.path.getsize(self.path)
+                    self.saves_written += 1
+                else:
+                    _, seed, player_state, byte_writes, progress_changes = job
+                    for index, value in progress_changes.items():
+                        if value is None:
+                            self.progress_table.pop(index, None)
+                        else:
+                            self.progress_table[index] = value
+                    write_patch(self.path, self.layout, seed, player_state, byte_writes, self.progress_table)
+                    self.bytes_written += sum(len(data) for _, data in byte_writes) + HEADER.size
+                    self.saves_written += 1
+            finally:
+                self.jobs.task_done()
+
+    #Write any pending changes and wait for the save thread to finish
+    def close(self):
+        self.save()
+        self.jobs.put(None)
+        self.thread.join()
@@ -0,0 +1,398 @@
+#Local authoritative multiplayer for Gold Digger. The GameServer owns one
+#world and a Simulation per connected miner, all sharing that world, and steps
+#them on a fixed tick with the last input each client sent. Clients never
+#simulate: the first state a client gets holds every cell changed since the
+#world was created, every later one only the cells and players that changed
+#during the tick, so bandwidth follows what the miners do, not the map size.
+#Everything runs on asyncio over TCP, and HeadlessClient plays without a
+#display, so a whole session can be tested on localhost.
+#
+#Every message is a kind byte and a payload length followed by the payload
+#  welcome       player id, seed, world size, backend name, falling blocks flag, tick rate
+#  state         tick, counts, then changed cells (index, type, dug, progress
+#                0-255), changed players and the ids of players that left. A
+#                player is its id and a bit mask of the fields that follow, so
+#                a miner walking along only costs its id, mask and one coordinate
+#  input         input byte as in replay.py (direction index | released << 3)
+#  purchase      gold the player spends on drill durability
+#
+#Usage: python server.py --seed 1 --port 7777
+
+import argparse
+import asyncio
+import struct
+import sys
+import time
+from collections import deque
+
+from settings import (
+    GRID_SIZE, WORLD_BACKEND, FALLING_BLOCKS,
+    SERVER_HOST, SERVER_PORT, SERVER_TICK_RATE, SERVER_MAX_CLIENT_BUFFER,
+)
+from world import new_seed, parse_seed
+from ores import OreIndex
+from physics import FallingBlocks
+from simulation import Simulation, StepInput, create_world
+from replay import DECODED_INPUTS, encode_input
+
+MESSAGE_WELCOME = 0
+MESSAGE_STATE = 1
+MESSAGE_INPUT = 2
+MESSAGE_PURCHASE = 3
+
+FRAME = struct.Struct("<BI")
+WELCOME = struct.Struct("<IQi16s?H")
+STATE = struct.Struct("<IIII")
+CELL = struct.Struct("<IBBB")
+PLAYER = struct.Struct("<IB")
+# Fields of a player record after the id, in mask bit order
+PLAYER_FIELDS = tuple(struct.Struct(code) for code in ("<i", "<i", "<q", "<f", "<i", "<?"))
+REMOVED = struct.Struct("<I")
+INPUT = struct.Struct("<B")
+PURCHASE = struct.Struct("<q")
+
+TICK_HISTORY = 10000 # Tick times kept for stats
+
+class ProtocolError(Exception):
+    #Raised when the other end sends something that isn't a valid message
+    pass
+
+def frame(kind, payload):
+    return FRAME.pack(kind, len(payload)) + payload
+
+#Read one message, returns (kind, payload)
+async def read_message(reader):
+    kind, length = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return kind, await reader.readexactly(length) if length else b""
+
+#Encode the fields of a player record that differ from the previous one, all
+#of them when there is no previous record
+def encode_player(record, previous):
+    mask = 0
+    fields = []
+    for bit, field in enumerate(PLAYER_FIELDS):
+        value = record[bit + 1]
+        if previous is None or previous[bit + 1] != value:
+            mask |= 1 << bit
+            fields.append(field.pack(value))
+    return PLAYER.pack(record[0], mask) + b"".join(fields)
+
+#players holds (record, record the clients already have or None) pairs
+def encode_state(tick, cells, players, removed):
+    parts = [STATE.pack(tick, len(cells), len(players), len(removed))]
+    parts.extend(CELL.pack(*cell) for cell in cells)
+    parts.extend(encode_player(record, previous) for record, previous in players)
+    parts.extend(REMOVED.pack(player_id) for player_id in removed)
+    return b"".join(parts)
+
+#Returns (tick, cells, players, removed player ids) from a state payload, with
+#each player as (id, {field bit: value}) holding only the fields sent
+def decode_state(payload):
+    try:
+        tick, cell_count, player_count, removed_count = STATE.unpack_from(payload)
+        offset = STATE.size
+        end = offset + cell_count * CELL.size
+        cells = list(CELL.iter_unpack(payload[offset:end]))
+        offset = end
+        players = []
+        for _ in range(player_count):
+            player_id, mask = PLAYER.unpack_from(payload, offset)
+            offset += PLAYER.size
+            fields = {}
+            for bit, field in enumerate(PLAYER_FIELDS):
+                if mask & (1 << bit):
+                    fields[bit], = field.unpack_from(payload, offset)
+                    offset += field.size
+            players.append((player_id, fields))
+    except struct.error as e:
+        raise ProtocolError(f"Truncated state message: {e}")
+    end = offset + removed_count * REMOVED.size
+    if end != len(payload):
+        raise ProtocolError(f"State message is {len(payload)} bytes, its counts need {end}")
+    removed = [player_id for (player_id,) in REMOVED.iter_unpack(payload[offset:end])]
+    return tick, cells, players, removed
+
+#What the clients are told about a player. Drill time is rounded to tenths
+#as the HUD shows it, so a mining player isn't resent every tick.
+def player_record(player_id, player):
+    return (player_id, player.grid_x, player.grid_y, player.score,
+            round(player.dig_time_remaining, 1), player.bonus_time, player.found_artifact)
+
+class ClientSession:
+    #Server side of one connection: the player's simulation and its pending input
+    def __init__(self, player_id, sim, writer):
+        self.player_id = player_id
+        self.sim = sim
+        self.writer = writer
+        self.direction = None # Direction held, as last reported by the client
+        self.released = False # A key was released since the last tick
+        self.purchases = []
+        self.last_record = None # Player record last sent to the clients
+        self.synced = False # Has been sent the full state
+
+class GameServer:
+    #Owns the world and every player, steps them on a fixed tick and sends each
+    #client what changed
+    def __init__(self, seed=None, size=GRID_SIZE, backend=WORLD_BACKEND, tick_rate=SERVER_TICK_RATE,
+                 falling_blocks=FALLING_BLOCKS):
+        self.backend = backend
+        self.tick_rate = tick_rate
+        self.world = create_world(new_seed() if seed is None else seed, size, backend)
+        # The players' simulations share one ore index and one set of falling
+        # blocks instead of each watching the world on its own
+        self.ores = OreIndex(self.world)
+        self.physics = FallingBlocks(self.world) if falling_blocks else None
+        self.sessions = {} # Player id -> ClientSession
+        self.handlers = set() # Tasks reading from the connected clients
+        self.next_player_id = 1
+        self.changed_cells = set() # Cell indexes changed during this tick
+        self.cell_records = {} # Cell index -> last sent record, for every cell changed since the start
+        self.removed_players = []
+        self.ticks = 0
+        self.tick_times = deque(maxlen=TICK_HISTORY) # Milliseconds per tick
+        self.bytes_sent = 0
+        self.server = None
+        self.ticker = None
+        self.world.add_observer(self.cell_changed)
+
+    def cell_changed(self, x, y):
+        self.changed_cells.add(y * self.world.width + x)
+
+    #Start listening and ticking, returns the port, which is picked by the OS when port is 0
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.ticker = asyncio.create_task(self.run_ticks())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.ticker.cancel()
+        self.server.close()
+        for session in list(self.sessions.values()):
+            self.drop(session)
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+    #Add a player for a new connection and read its messages until it goes away
+    async def handle_client(self, reader, writer):
+        handler = asyncio.current_task()
+        self.handlers.add(handler)
+        player_id = self.next_player_id
+        self.next_player_id += 1
+        # The falling blocks stay stepped here, the player's rules only read them
+        sim = Simulation(size=self.world.width, world=self.world, falling_blocks=False, shared_physics=self.physics)
+        sim.ores.close()
+        sim.ores = self.ores
+        session = self.sessions[player_id] = ClientSession(player_id, sim, writer)
+        writer.write(frame(MESSAGE_WELCOME, WELCOME.pack(
+            player_id, self.world.seed, self.world.width, self.backend.encode(),
+            self.physics is not None, self.tick_rate)))
+        try:
+            while True:
+                kind, payload = await read_message(reader)
+                if kind == MESSAGE_INPUT and len(payload) == INPUT.size:
+                    inputs = DECODED_INPUTS[payload[0] & 15]
+                    if inputs is not None:
+                        session.direction = inputs.direction
+                        session.released = session.released or inputs.released
+                elif kind == MESSAGE_PURCHASE and len(payload) == PURCHASE.size:
+                    session.purchases.append(PURCHASE.unpack(payload)[0])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.drop(session)
+            self.handlers.discard(handler)
+
+    #Remove a player; the others hear about it with the next tick
+    def drop(self, session):
+        if self.sessions.pop(session.player_id, None) is None:
+            return
+        self.removed_players.append(session.player_id)
+        session.writer.close()
+
+    #Step every player and the falling blocks by one tick and send out the changes
+    def tick(self):
+        start = time.perf_counter()
+        dt = 1 / self.tick_rate
+        sessions = list(self.sessions.values())
+        for session in sessions:
+            for gold in session.purchases:
+                session.sim.buy_durability(gold)
+            session.purchases.clear()
+            session.sim.step(StepInput(session.direction, session.released), dt)
+            session.released = False
+        if self.physics is not None:
+            self.physics.step(dt, frozenset((session.sim.player.grid_x, session.sim.player.grid_y)
+                                            for session in sessions))
+
+        # Cells whose sent state changed; mining progress is rounded to a byte
+        world = self.world
+        width = world.width
+        cells = []
+        for index in self.changed_cells:
+            x = index % width
+            y = index // width
+            record = (index, world.block_type(x, y), world.is_dug(x, y), int(world.get_progress(x, y) * 255))
+            if self.cell_records.get(index) != record:
+                self.cell_records[index] = record
+                cells.append(record)
+        self.changed_cells = set()
+        players = []
+        for session in sessions:
+            record = player_record(session.player_id, session.sim.player)
+            if record != session.last_record:
+                players.append((record, session.last_record))
+                session.last_record = record
+        removed = self.removed_players
+        self.removed_players = []
+
+        delta = None
+        if cells or players or removed:
+            delta = frame(MESSAGE_STATE, encode_state(self.ticks, cells, players, removed))
+        snapshot = None
+        for session in sessions:
+            if session.synced:
+                message = delta
+            else:
+                if snapshot is None:
+                    snapshot = frame(MESSAGE_STATE, encode_state(
+                        self.ticks, list(self.cell_records.values()),
+                        [(other.last_record, None) for other in sessions], ()))
+                message = snapshot
+                session.synced = True
+            if message is None:
+                continue
+            # A client that stopped reading would make the server buffer every tick for it
+            if session.writer.transport.get_write_buffer_size() > SERVER_MAX_CLIENT_BUFFER:
+                self.drop(session)
+                continue
+            session.writer.write(message)
+            self.bytes_sent += len(message)
+        self.ticks += 1
+        self.tick_times.append((time.perf_counter() - start) * 1000)
+
+    #Tick at the tick rate. A server that falls behind skips the lost time
+    #instead of running a burst of ticks to catch up.
+    async def run_ticks(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        next_tick = loop.time()
+        while True:
+            self.tick()
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < -interval:
+                next_tick = loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+class HeadlessClient:
+    #Plays on a server without a display: sends inputs and keeps the cells and
+    #players it is told about. With mirror set it also builds the world from
+    #the seed and applies every change to it. With keep_state unset it only
+    #counts what it receives, which is all a load test needs.
+    def __init__(self, mirror=False, keep_state=True):
+        self.mirror = mirror
+        self.keep_state = keep_state or mirror
+        self.world = None
+        self.cells = {} # Cell index -> (type, dug, progress)
+        self.players = {} # Player id -> player record as in player_record
+        self.tick = None
+        self.states_received = 0
+        self.bytes_received = 0
+        self.synced = asyncio.Event() # The first state arrived
+        self.reader = None
+        self.writer = None
+        self.receiver = None
+
+    async def connect(self, host=SERVER_HOST, port=SERVER_PORT):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        kind, payload = await read_message(self.reader)
+        if kind != MESSAGE_WELCOME or len(payload) != WELCOME.size:
+            raise ProtocolError("The server did not send a welcome message")
+        self.bytes_received += FRAME.size + len(payload)
+        self.player_id, self.seed, self.size, backend, self.falling_blocks, self.tick_rate = WELCOME.unpack(payload)
+        self.backend = backend.rstrip(b"\0").decode()
+        if self.mirror:
+            self.world = create_world(self.seed, self.size, self.backend)
+        self.receiver = asyncio.create_task(self.receive())
+
+    async def receive(self):
+        try:
+            while True:
+                kind, payload = await read_message(self.reader)
+                self.bytes_received += FRAME.size + len(payload)
+                if kind == MESSAGE_STATE:
+                    if self.keep_state:
+                        self.apply_state(payload)
+                    else:
+                        self.states_received += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def apply_state(self, payload):
+        self.tick, cells, players, removed = decode_state(payload)
+        self.states_received += 1
+        world = self.world
+        for index, block_type, dug, progress in cells:
+            self.cells[index] = (block_type, dug, progress)
+            if world is not None:
+                x = index % world.width
+                y = index // world.width
+                world.fill(x, y, block_type)
+                if dug:
+                    world.set_dug(x, y)
+                world.set_progress(x, y, progress / 255)
+        for player_id, fields in players:
+            record = list(self.players.get(player_id, (player_id, 0, 0, 0, 0.0, 0, False)))
+            for bit, value in fields.items():
+                record[bit + 1] = value
+            self.players[player_id] = tuple(record)
+        for player_id in removed:
+            self.players.pop(player_id, None)
+        self.synced.set()
+
+    #Hold a direction ("RIGHT", "LEFT", "DOWN", "UP") or None, optionally
+    #reporting that a key was released
+    def send_input(self, direction, released=False):
+        self.writer.write(frame(MESSAGE_INPUT, INPUT.pack(encode_input(StepInput(direction, released)))))
+
+    def buy_durability(self, gold_to_spend):
+        self.writer.write(frame(MESSAGE_PURCHASE, PURCHASE.pack(gold_to_spend)))
+
+    async def close(self):
+        self.receiver.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def serve(args):
+    server = GameServer(args.seed, args.size, args.backend, args.tick_rate, args.falling_blocks)
+    port = await server.start(args.host, args.port)
+    print(f"Serving seed {server.world.seed} on {args.host}:{port}")
+    while True:
+        await asyncio.sleep(10)
+        times = list(server.tick_times)
+        if times:
+            print(f"{len(server.sessions)} players, tick {sum(times) / len(times):.2f} ms, "
+                  f"{server.bytes_sent} bytes sent")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a Gold Digger multiplayer server.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--seed", type=parse_seed, help="World seed, random if omitted")
+    parser.add_argument("--size", type=int, default=GRID_SIZE, help="World width and height in cells")
+    parser.add_argument("--backend", default=WORLD_BACKEND, choices=("seeded", "grid", "chunked", "terrain"))
+    parser.add_argument("--tick-rate", type=int, default=SERVER_TICK_RATE, help="Ticks per second")
+    parser.add_argument("--falling-blocks", action="store_true", default=FALLING_BLOCKS,
+                        help="Let loose dirt and gold fall into dug cells below them")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
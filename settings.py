@@ -0,0 +1,120 @@
+#Shared settings for Gold Digger. Kept free of pygame so the world and
+#simulation modules can be imported without a display.
+
+# Game window and grid for blocks
+WINDOW_WIDTH = 840
+WINDOW_HEIGHT = 600
+BLOCK_SIZE = 30
+GOLD_CHANCE = 0.03
+GRID_SIZE = 50
+BASE_DIG_TIME = 10.0
+MOVEMENT_DELAY = 0.05
+
+# Game logic runs in fixed steps of SIMULATION_STEP seconds whatever the frame rate
+SIMULATION_STEP = 1 / 60
+MAX_FRAME_TIME = 0.25 # Longest frame caught up on, anything longer is dropped
+
+# Mining time for different block types (seconds)
+DIRT_MINE_TIME = .5
+STONE_MINE_TIME = .75
+HARD_STONE_MINE_TIME = 1.5
+VERYHARD_STONE_MINE_TIME = 2
+
+# Color definitions
+BLACK = (0, 0, 0)
+DARKGRAY = (80, 80, 80)
+TAN = (115, 90, 50)
+BROWN = (100, 69, 19)
+GOLD = (255, 215, 0)
+BLUE = (0, 0, 255)
+SKY_BLUE = (135, 206, 235)
+GRAY = (96, 96, 96)
+RED = (255, 0, 0)
+GREEN = (10, 255, 10)
+WHITE = (255, 255, 255)
+
+# Depth thresholds for different types of blocks
+DEPTH_THRESHOLD = 20 # Depth where stone starts appearing more frequently
+DEPTH_THRESHOLD2 = 30 # Depth where very hard stone starts appearing
+
+# Rows above this one are open sky with no blocks
+SURFACE_ROW = 3
+
+# World storage backend: "seeded" derives blocks from the seed and stores only
+# changes, "grid" keeps every cell in memory, "chunked" generates
+# chunks on demand and evicts cold ones for very large maps, "terrain" keeps
+# every cell in memory like "grid" but generates strata, caves and gold veins
+# with NumPy
+WORLD_BACKEND = "seeded"
+CHUNK_SIZE = 32 # Cells per chunk side
+CHUNK_MEMORY_BUDGET = 64 * 1024 * 1024 # Bytes of chunk data kept in memory
+CHUNK_FOCUS_RADIUS = 2 # Chunks around the player and camera kept loaded
+CHUNK_CACHE_DIR = None # Where dug chunks are saved, None for a temp directory
+LOADING_REDRAW_INTERVAL = 0.05 # Seconds between progress redraws while waiting for a new world
+
+# Terrain generator of the "terrain" backend
+TERRAIN_STRATA_WARP = 6 # Rows the dirt, stone and very hard stone boundaries wander up or down
+TERRAIN_STONE_SHARE = 0.2 # Share of stone among dirt, and of hard stone among stone
+TERRAIN_VERYHARD_SHARE = 0.7 # Share of very hard stone below DEPTH_THRESHOLD2
+TERRAIN_GOLD_SURFACE_FACTOR = 0.5 # Gold share at the top of the map, times GOLD_CHANCE
+TERRAIN_GOLD_BOTTOM_FACTOR = 2.0 # Gold share at the bottom of the map, times GOLD_CHANCE
+TERRAIN_CAVE_TOP = SURFACE_ROW + 8 # First row where caves can open
+TERRAIN_CAVE_WALL_CHANCE = 0.62 # Initial share of rock before the caves are grown
+TERRAIN_CAVE_STEPS = 4 # Cellular automaton steps that smooth the caves
+
+# Terrain render cache
+TERRAIN_TILE_CELLS = 8 # Cells per cached tile side
+TERRAIN_TILE_CACHE_SIZE = 96 # Tiles kept before the least recently used is dropped
+
+# Rendered text surfaces kept before the least recently used is dropped
+TEXT_CACHE_SIZE = 256
+
+# Generated block types remembered by the seeded world before its cache is cleared
+SEEDED_TYPE_CACHE_SIZE = 1 << 20
+
+# Cells per side of the ore index's buckets
+ORE_BUCKET_SIZE = 32
+
+# Auto-dig: G routes to the nearest gold within the search radius, a click to
+# the clicked cell. Routes are planned inside a window this many cells larger
+# than the box around the player and the target.
+AUTODIG_SEARCH_RADIUS = 32
+AUTODIG_MARGIN = 16
+
+# Minimap (M cycles minimap, overview, off). Level k shows 2**k cells per pixel.
+MINIMAP_LEVELS = 4
+MINIMAP_TILE_PIXELS = 32 # Pixels per cached minimap tile side
+MINIMAP_TILE_CACHE_SIZE = 512 # Tiles kept per level, enough for a full overview
+MINIMAP_BUILD_BUDGET = 0.001 # Seconds per frame spent building missing tiles
+MINIMAP_RECT = (WINDOW_WIDTH - 170, WINDOW_HEIGHT - 130, 160, 120)
+OVERVIEW_RECT = (120, 80, 600, 440)
+
+# Fog of war (L toggles it). Light fades one level per cell from the sky and the
+# player's lamp through open cells; level 0 is black.
+LIGHTING_ENABLED = True
+LIGHT_LEVELS = 16 # Sky light below the surface row starts at LIGHT_LEVELS - 2
+LAMP_LEVEL = 6 # Light of the player's own cell
+
+# Falling blocks: loose dirt and gold nuggets drop into the open cell below
+# them, one cell per FALL_INTERVAL seconds. Also turned on with --falling-blocks.
+FALLING_BLOCKS = False
+FALL_INTERVAL = 0.1
+
+# Save file, loaded on start and written in the background while playing
+SAVE_PATH = "golddigger.sav"
+AUTOSAVE_INTERVAL = 5.0 # Seconds between autosaves
+
+# Multiplayer server (server.py): the world and every player are stepped
+# SERVER_TICK_RATE times a second and only the changes are sent to clients
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 7777
+SERVER_TICK_RATE = 20
+SERVER_MAX_CLIENT_BUFFER = 1024 * 1024 # Bytes queued for a client before it is dropped as too slow
+
+# Frame profiler, toggled in game with F3; F4 writes the recorded frames as a Chrome trace
+PROFILER_FRAMES = 600 # Frames kept in the profiler's ring buffer
+PROFILER_TRACE_PATH = "golddigger-trace.json"
+
+# Seconds the main loop sleeps on the event queue while nothing is happening
+# before waking up to run the autosave check
+IDLE_WAKE_INTERVAL = 1.0
@@ -0,0 +1,318 @@
+#Headless game rules for Gold Digger. The Simulation owns the world and the
+#player and advances them with step(inputs, dt); it never touches pygame, so
+#it can run faster than real time for balance tests and CI without SDL.
+
+import threading
+from collections import namedtuple
+
+from settings import (
+    GRID_SIZE, BASE_DIG_TIME, MOVEMENT_DELAY, SURFACE_ROW, WORLD_BACKEND, CHUNK_FOCUS_RADIUS, FALLING_BLOCKS,
+)
+from world import WorldGrid, SeededWorld, new_seed
+from chunks import ChunkedWorld
+from ores import OreIndex
+from physics import FallingBlocks
+from terrain import TerrainGenerator
+
+# Player input for a single step: the held arrow direction ("RIGHT", "LEFT",
+# "DOWN", "UP" or None) and whether a key was released since the last step
+StepInput = namedtuple("StepInput", ("direction", "released"))
+NO_INPUT = StepInput(None, False)
+
+# Events reported by Simulation.step
+EVENT_GOLD = "gold" # A gold block was dug out
+EVENT_ARTIFACT = "artifact" # The artifact was uncovered, the round is over
+EVENT_DRILL_BROKE = "drill_broke" # Durability ran out
+EVENT_PURCHASE_OFFER = "purchase_offer" # The broken drill message finished fading in
+EVENT_RESURFACED = "resurfaced" # The player reached the surface and got a new drill bit
+
+NO_EVENTS = ()
+
+GOLD_VALUE = 100 # Score for each gold block
+DURABILITY_PRICE = 100 # Gold per percent of bonus durability
+GAME_OVER_FADE_STEP = 5 # Alpha added to the broken drill message each step
+
+class Player:
+    #Class representing the player character
+    # Initialize player position and stats
+    def __init__(self, x, y):
+        self.grid_x = x
+        self.grid_y = y + 3
+        self.score = 0
+        self.dig_time_remaining = BASE_DIG_TIME
+        self.bonus_time = 0
+        self.mining_target = None
+        self.mining_start_time = 0
+        self.moving_direction = None
+        self.mining_elapsed_time = 0
+        self.last_move_time = 0
+        self.world = None
+        self.found_artifact = False
+
+    #Start mining a block at the given position
+    def start_mining(self, block_pos, current_time, block_progress):
+        self.mining_target = block_pos
+        self.mining_start_time = current_time
+        self.mining_elapsed_time = block_progress * self.world.get_mine_time(*self.mining_target)
+
+    #Stop mining and reset mining-related variables
+    def stop_mining(self):
+        self.mining_target = None
+        self.moving_direction = None
+        self.mining_elapsed_time = 0
+
+    #Get the coordinates of the block the player is trying to mine based on direction
+    def get_target_block(self):
+        if self.moving_direction == "RIGHT":
+            return (self.grid_x + 1, self.grid_y)
+        elif self.moving_direction == "LEFT":
+            return (self.grid_x - 1, self.grid_y)
+        elif self.moving_direction == "DOWN":
+            return (self.grid_x, self.grid_y + 1)
+        elif self.moving_direction == "UP":
+            return (self.grid_x, self.grid_y - 1)
+        return None
+
+    #Move player to new coordinates within grid boundaries
+    def move_to(self, x, y):
+        self.grid_x = max(0, min(x, self.world.width - 1))
+        self.grid_y = max(3, min(y, self.world.height - 1))
+
+    #Check if enough time has passed to allow movement
+    def can_move(self, current_time):
+        return current_time - self.last_move_time >= MOVEMENT_DELAY
+
+#Build a new world with the configured storage backend
+def create_world(seed=None, size=GRID_SIZE, backend=WORLD_BACKEND):
+    if backend == "seeded":
+        return SeededWorld(size, size, seed=seed)
+    if backend == "chunked":
+        return ChunkedWorld(size, size, seed=seed)
+    if backend == "terrain":
+        return WorldGrid(size, size).generate(seed, TerrainGenerator())
+    return WorldGrid(size, size).generate(seed)
+
+class WorldLoader:
+    #Builds a world on a worker thread so the window can come up first. A grid
+    #is filled chunk by chunk starting around the spawn point, and ready is set
+    #as soon as those chunks can be played; the game thread fills in any chunk
+    #it reaches before the worker does. Backends that cost nothing to create
+    #are built right away.
+    def __init__(self, seed=None, size=GRID_SIZE, backend=WORLD_BACKEND, radius=CHUNK_FOCUS_RADIUS):
+        self.seed = new_seed() if seed is None else seed
+        self.size = size
+        self.backend = backend
+        self.radius = radius
+        self.ready = threading.Event() # The area around the spawn point is generated
+        self.finished = threading.Event() # The whole world is generated
+        self.error = None
+        self.world = None
+        self.ores = None # Ore index of a grid filled in the background, once it is complete
+        self.thread = None # Only set while a world is built in the background
+        if backend in ("seeded", "chunked"):
+            self.world = create_world(self.seed, size, backend)
+            self.ready.set()
+            self.finished.set()
+            return
+        if backend == "grid":
+            self.world = WorldGrid(size, size).begin_generation(self.seed)
+            target = self.fill_grid
+        else:
+            target = self.build_world
+        self.thread = threading.Thread(target=self.run, args=(target,), name="world loader", daemon=True)
+        self.thread.start()
+
+    def run(self, target):
+        try:
+            target()
+        except Exception as e:
+            self.error = e
+        self.ready.set()
+        self.finished.set()
+
+    def build_world(self):
+        self.world = create_world(self.seed, self.size, self.backend)
+
+    #Generate the grid's chunks nearest the spawn point first
+    def fill_grid(self):
+        world = self.world
+        # Players start on the surface row in the middle of the map
+        spawn_chunk_x = self.size // 2 // world.chunk_size
+        spawn_chunk_y = SURFACE_ROW // world.chunk_size
+        def spawn_distance(chunk):
+            return max(abs(chunk[0] - spawn_chunk_x), abs(chunk[1] - spawn_chunk_y))
+        chunks = sorted(((chunk_x, chunk_y) for chunk_y in range(world.chunks_down)
+                         for chunk_x in range(world.chunks_across)), key=spawn_distance)
+        for chunk in chunks:
+            if not self.ready.is_set() and spawn_distance(chunk) > self.radius:
+                self.ready.set()
+            world.generate_chunk(*chunk)
+        # The game started with an index that only fills buckets as they are
+        # queried; the complete one is built here rather than on the game thread
+        self.ores = OreIndex(world, background=True)
+
+    #Share of the world generated so far, from 0 to 1
+    @property
+    def progress(self):
+        if self.finished.is_set():
+            return 1.0
+        if isinstance(self.world, WorldGrid) and self.world.pending_chunks is not None:
+            total = len(self.world.pending_chunks)
+            return (total - self.world.chunks_left) / total
+        return 0.0
+
+    #Wait up to timeout seconds (None waits forever) for the world to be
+    #playable, returns it or None if it isn't ready yet
+    def wait(self, timeout=None):
+        if not self.ready.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.world
+
+class Simulation:
+    #Game rules: mining, drill durability, scoring, the artifact, resurfacing and,
+    #when falling_blocks is set, loose blocks dropping into open cells.
+    #Starts in the given world, or in a new one generated from the seed.
+    #shared_physics is a set of falling blocks for the world that the caller
+    #steps itself, like a server stepping one for all of its players.
+    def __init__(self, seed=None, size=GRID_SIZE, backend=WORLD_BACKEND, world=None, falling_blocks=FALLING_BLOCKS,
+                 shared_physics=None):
+        self.size = size
+        self.backend = backend
+        self.falling_blocks = falling_blocks
+        self.shared_physics = shared_physics
+        self.physics = None
+        self.starting_x = size // 2
+        self.starting_y = 0
+        if world is None:
+            self.reset(seed)
+        else:
+            self.start(world)
+
+    #Start a new round with a fresh world and player. With the seeded backend
+    #this costs the same whatever the map size.
+    def reset(self, seed=None):
+        self.start(create_world(new_seed() if seed is None else seed, self.size, self.backend))
+
+    #Put a new player at the start of the given world
+    def start(self, world):
+        self.seed = world.seed
+        self.world = world
+        self.ores = OreIndex(world)
+        if self.physics is not None and self.physics is not self.shared_physics:
+            self.physics.close()
+        if self.shared_physics is not None:
+            self.physics = self.shared_physics
+        else:
+            self.physics = FallingBlocks(world) if self.falling_blocks else None
+        self.player = Player(self.starting_x, self.starting_y)
+        self.player.world = world
+        self.time = 0.0
+        self.steps = 0
+        self.show_game_over = False
+        self.game_over_alpha = 0
+        self.popup_shown = False
+
+    #Spend gold on bonus durability, returns False if the amount can't be spent
+    def buy_durability(self, gold_to_spend):
+        if not 0 <= gold_to_spend <= self.player.score:
+            return False
+        percent_to_buy = gold_to_spend // DURABILITY_PRICE
+        if percent_to_buy > 0:
+            self.player.bonus_time += percent_to_buy
+            self.player.score -= percent_to_buy * DURABILITY_PRICE
+        return True
+
+    #Advance the game by dt seconds and return the events that happened
+    def step(self, inputs, dt):
+        self.time += dt
+        self.steps += 1
+        current_time = self.time
+        player = self.player
+        world = self.world
+        events = NO_EVENTS
+
+        # Releasing a key keeps the progress made on the block so far
+        if inputs.released:
+            if player.mining_target:
+                target_x, target_y = player.mining_target
+                mine_time = world.get_mine_time(target_x, target_y)
+                world.set_progress(target_x, target_y, min(player.mining_elapsed_time / mine_time, 1.0))
+            player.stop_mining()
+
+        if inputs.direction and not self.show_game_over:
+            player.moving_direction = inputs.direction
+
+        if player.moving_direction:
+            target_pos = player.get_target_block()
+            target_x, target_y = target_pos
+
+            if target_pos in world:
+                if not world.is_dug(target_x, target_y):
+                    # A broken drill can still dig out blocks that fell in by
+                    # hand, so a tunnel that caved in behind the player can't
+                    # trap it below the surface. Untouched ground stays out of
+                    # reach and hand-dug gold is worth nothing.
+                    drill_working = player.dig_time_remaining > 0
+                    if drill_working or (self.physics is not None
+                                         and self.physics.has_landed(target_x, target_y)):
+                        if world.is_artifact(target_x, target_y):
+                            world.set_dug(target_x, target_y)
+                            player.found_artifact = True
+                            return (EVENT_ARTIFACT,)
+
+                        if player.mining_target != target_pos:
+                            player.start_mining(target_pos, current_time, world.get_progress(target_x, target_y))
+
+                        player.mining_elapsed_time += dt
+                        mining_progress = min(player.mining_elapsed_time / world.get_mine_time(target_x, target_y), 1.0)
+                        world.set_progress(target_x, target_y, mining_progress)
+
+                        if drill_working:
+                            player.dig_time_remaining -= dt
+
+                        if mining_progress >= 1.0:
+                            world.set_dug(target_x, target_y)
+                            if drill_working and world.is_gold(target_x, target_y):
+                                player.score += GOLD_VALUE
+                                events = (EVENT_GOLD,)
+                            player.move_to(target_x, target_y)
+                            player.stop_mining()
+                elif player.can_move(current_time):
+                    player.move_to(target_x, target_y)
+                    player.last_move_time = current_time
+                    player.stop_mining()
+            elif player.can_move(current_time):
+                player.move_to(target_x, target_y)
+                player.last_move_time = current_time
+                player.stop_mining()
+
+        # Loose blocks fall after the player has moved, and never into the player's cell
+        if self.physics is not None and self.shared_physics is None:
+            self.physics.step(dt, frozenset(((player.grid_x, player.grid_y),)))
+
+        # Handle game over state
+        if player.dig_time_remaining <= 0 and not self.show_game_over and not self.popup_shown:
+            self.show_game_over = True
+            self.game_over_alpha = 0
+            events = events + (EVENT_DRILL_BROKE,)
+
+        if self.show_game_over:
+            self.game_over_alpha = min(self.game_over_alpha + GAME_OVER_FADE_STEP, 255)
+            if self.game_over_alpha >= 255 and not self.popup_shown:
+                self.popup_shown = True
+                self.show_game_over = False
+                # Let the front end offer a purchase before a resurface refills the drill
+                return events + (EVENT_PURCHASE_OFFER,)
+
+        # Reset game state when reaching surface
+        if player.grid_y == SURFACE_ROW and (self.popup_shown or self.show_game_over):
+            player.dig_time_remaining = BASE_DIG_TIME + player.bonus_time
+            player.stop_mining()
+            self.show_game_over = False
+            self.game_over_alpha = 0
+            self.popup_shown = False # Reset for next round
+            events = events + (EVENT_RESURFACED,)
+
+        return events
@@ -0,0 +1,149 @@
+#Whole-map terrain generation for Gold Digger with NumPy. Instead of rolling
+#every cell on its own, the map is built from a few coherent noise fields:
+#  strata        the dirt, stone and hard stone bands follow the depth
+#                thresholds, with their boundaries warped by noise
+#  stone patches stone and hardness come in clumps instead of speckles
+#  gold veins    gold sits in clusters, and the share of cells holding gold
+#                grows from the surface to the bottom of the map
+#  caves         open caverns grown with a cellular automaton below the
+#                first rows, so the spawn area stays solid
+#Every step works on whole arrays, so a 4096x4096 map takes about a second.
+#NumPy is only needed by the "terrain" world backend.
+#The result only depends on the seed and the generator settings.
+
+try:
+    import numpy as np
+except ImportError: # The grid and seeded backends work without NumPy
+    np = None
+
+from settings import (
+    SURFACE_ROW, DEPTH_THRESHOLD, DEPTH_THRESHOLD2, GOLD_CHANCE,
+    TERRAIN_STRATA_WARP, TERRAIN_STONE_SHARE, TERRAIN_VERYHARD_SHARE,
+    TERRAIN_GOLD_SURFACE_FACTOR, TERRAIN_GOLD_BOTTOM_FACTOR,
+    TERRAIN_CAVE_TOP, TERRAIN_CAVE_WALL_CHANCE, TERRAIN_CAVE_STEPS,
+)
+from world import (
+    BLOCK_EMPTY, BLOCK_DIRT, BLOCK_VERYHARD_STONE, BLOCK_GOLD, BLOCK_STONE_GOLD,
+)
+
+# Spacing in cells of the noise sample used to turn shares of cells into thresholds
+QUANTILE_SAMPLE_STEP = 4
+
+class TerrainGenerator:
+    #Seedable generator of block type arrays for whole maps
+    def __init__(self, strata_warp=TERRAIN_STRATA_WARP, stone_share=TERRAIN_STONE_SHARE,
+                 veryhard_share=TERRAIN_VERYHARD_SHARE, gold_chance=GOLD_CHANCE,
+                 gold_surface_factor=TERRAIN_GOLD_SURFACE_FACTOR, gold_bottom_factor=TERRAIN_GOLD_BOTTOM_FACTOR,
+                 cave_top=TERRAIN_CAVE_TOP, cave_wall_chance=TERRAIN_CAVE_WALL_CHANCE,
+                 cave_steps=TERRAIN_CAVE_STEPS):
+        if np is None:
+            raise RuntimeError("The terrain generator needs NumPy, install it or pick another world backend")
+        self.strata_warp = strata_warp
+        self.stone_share = stone_share
+        self.veryhard_share = veryhard_share
+        self.gold_chance = gold_chance
+        self.gold_surface_factor = gold_surface_factor
+        self.gold_bottom_factor = gold_bottom_factor
+        self.cave_top = cave_top
+        self.cave_wall_chance = cave_wall_chance
+        self.cave_steps = cave_steps
+
+    #Block type codes of a width x height map as a bytearray in row order
+    def generate(self, seed, width, height):
+        rng = np.random.default_rng(seed)
+        rows = np.arange(height, dtype=np.float32)[:, None]
+
+        # Strata: the depth thresholds become boundaries that wander up and
+        # down with smooth noise along the map
+        deep = rows > DEPTH_THRESHOLD + self.boundary_offsets(rng, width)
+        very_deep = rows > DEPTH_THRESHOLD2 + self.boundary_offsets(rng, width)
+        scratch = np.empty((height + 16) * width, dtype=np.float32)
+        field = value_noise(rng, width, height, 6, scratch=scratch)
+        stone = field > quantile(field, 1.0 - self.stone_share)
+        # Dirt, stone and hard stone have consecutive codes: depth moves a cell
+        # one band down and a stone patch another
+        types = deep.view(np.uint8) + stone.view(np.uint8)
+        types += BLOCK_DIRT
+        field = value_noise(rng, width, height, 16, out=field, scratch=scratch)
+        types[very_deep & (field < quantile(field, self.veryhard_share))] = BLOCK_VERYHARD_STONE
+
+        # Gold veins: one noise threshold per row, picked so that the share of
+        # gold cells in the row follows the depth ramp
+        field = value_noise(rng, width, height, 3, 9, out=field, scratch=scratch)
+        ramp = np.linspace(self.gold_surface_factor, self.gold_bottom_factor, height)
+        gold = field > quantile(field, 1.0 - np.clip(ramp * self.gold_chance, 0.0, 1.0))[:, None]
+        types[gold] = BLOCK_GOLD
+        types[gold & stone & ~deep] = BLOCK_STONE_GOLD
+
+        # Caves: majority-rule automaton over random rock, denser where a
+        # coarse noise field says the rock is solid
+        top = min(max(self.cave_top, SURFACE_ROW + 1), height)
+        if top < height:
+            cave_height = height - top
+            coarse = value_noise(rng, -(-width // 8), -(-cave_height // 8), 6)
+            limits = ((self.cave_wall_chance + (coarse - 0.5) * 0.2) * 256).clip(0, 255).astype(np.uint8)
+            limits = limits.repeat(8, axis=0).repeat(8, axis=1)[:cave_height, :width]
+            draws = np.frombuffer(rng.bytes(cave_height * width), dtype=np.uint8).reshape(cave_height, width)
+            walls = draws < limits
+            for _ in range(self.cave_steps):
+                walls = cave_step(walls)
+            types[top:][~walls] = BLOCK_EMPTY
+
+        types[:SURFACE_ROW + 1] = BLOCK_EMPTY
+        return bytearray(types.tobytes())
+
+    #Per-column shift of a depth boundary, within strata_warp rows either way
+    def boundary_offsets(self, rng, width):
+        return (value_noise(rng, width, 1, 24)[0] - 0.5) * (2 * self.strata_warp)
+
+#Smooth noise in [0, 1) made of random values on a lattice with the given
+#spacings in cells, blended with smoothstep. Several spacings are averaged with
+#the finer ones weighted half as much as the one before. Big maps pass in the
+#output and scratch arrays of the previous field, since touching fresh memory
+#costs about as much as the arithmetic.
+def value_noise(rng, width, height, *spacings, out=None, scratch=None):
+    weights = [0.5 ** octave for octave in range(len(spacings))]
+    if out is None:
+        out = np.empty((height, width), dtype=np.float32)
+    scratch_size = (height + max(spacings)) * width
+    if scratch is None or scratch.size < scratch_size:
+        scratch = np.empty(scratch_size, dtype=np.float32)
+    columns = np.arange(width)
+    for octave, (spacing, weight) in enumerate(zip(spacings, weights)):
+        lattice = rng.random((-(-height // spacing) + 1, -(-width // spacing) + 1), dtype=np.float32)
+        lattice *= weight / sum(weights)
+        blend = smoothstep(spacing)
+        # Blend along the rows of the small lattice first, then between its
+        # rows. Every lattice interval spans spacing rows with the same blend
+        # factors, so the second pass is one broadcast over (interval, offset, x).
+        left = lattice.take(columns // spacing, axis=1)
+        lattice_rows = left + (lattice.take(columns // spacing + 1, axis=1) - left) * blend[columns % spacing]
+        intervals = lattice_rows.shape[0] - 1
+        blended = scratch[:intervals * spacing * width].reshape(intervals, spacing, width)
+        np.multiply((lattice_rows[1:] - lattice_rows[:-1])[:, None, :], blend[None, :, None], out=blended)
+        blended += lattice_rows[:-1, None, :]
+        if octave == 0:
+            out[...] = blended.reshape(-1, width)[:height]
+        else:
+            out += blended.reshape(-1, width)[:height]
+    return out
+
+#Smoothstep blend factors of the cells inside one lattice interval
+def smoothstep(spacing):
+    position = np.arange(spacing, dtype=np.float32) / spacing
+    return position * position * (3 - 2 * position)
+
+#Noise values below which the given shares of a field lie. The field is
+#sampled on a sparse grid and sorted once, which is plenty for the smooth
+#fields used here and much cheaper than exact quantiles of the whole map.
+def quantile(field, shares):
+    sample = np.sort(field[::QUANTILE_SAMPLE_STEP, ::QUANTILE_SAMPLE_STEP], axis=None)
+    positions = (np.asarray(shares) * len(sample)).astype(np.intp)
+    return sample[np.clip(positions, 0, len(sample) - 1)]
+
+#One automaton step: a cell is wall when five or more of the nine cells around
+#and including it are walls. Cells outside the map count as walls.
+def cave_step(walls):
+    padded = np.pad(walls.view(np.uint8), 1, constant_values=1)
+    across = padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]
+    return across[:-2] + across[1:-1] + across[2:] >= 5
@@ -0,0 +1,29 @@
+#Shared helpers for the Gold Digger tests. The game modules live at the top
+#of the repository, next to this folder.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings import SURFACE_ROW, SIMULATION_STEP
+from simulation import StepInput
+from world import WorldGrid, BLOCK_DIRT, BLOCK_ARTIFACT, artifact_position
+
+#A small world of plain dirt, so a test knows what every cell holds
+def dirt_world(size=20, seed=1):
+    world = WorldGrid(size, size)
+    world.seed = seed
+    for y in range(SURFACE_ROW + 1, size):
+        world.types[y * size:(y + 1) * size] = bytes((BLOCK_DIRT,)) * size
+    world.artifact_pos = artifact_position(size, size)
+    world.types[world.artifact_pos[1] * size + world.artifact_pos[0]] = BLOCK_ARTIFACT
+    return world
+
+#Hold a direction for the given number of seconds of game time, then let go
+def hold(sim, direction, seconds, dt=SIMULATION_STEP):
+    events = []
+    for _ in range(round(seconds / dt)):
+        events.extend(sim.step(StepInput(direction, False), dt))
+    events.extend(sim.step(StepInput(None, True), dt))
+    return events
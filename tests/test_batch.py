@@ -0,0 +1,14 @@
+import settings
+from batch import run_one
+
+def test_artifact_policy_finds_the_artifact(monkeypatch):
+    monkeypatch.setattr(settings, "GRID_SIZE", 24)
+    row = run_one((1, "artifact", "D", 300.0, False))
+    assert row["artifact_found"]
+    assert row["time_to_artifact"] == row["sim_time"] < 300.0
+
+def test_runs_resurface_and_play_until_max_time(monkeypatch):
+    monkeypatch.setattr(settings, "GRID_SIZE", 24)
+    row = run_one((1, "greedy", "D", 60.0, True))
+    assert row["drills_broken"] >= 2
+    assert row["sim_time"] >= 60.0 or row["artifact_found"]
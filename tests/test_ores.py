@@ -0,0 +1,23 @@
+from ores import OreIndex
+from simulation import create_world
+from world import GOLD_TYPES
+
+def undug_gold(world, x0, y0, x1, y1):
+    return sum(1 for y in range(y0, y1) for x in range(x0, x1)
+               if world.block_type(x, y) in GOLD_TYPES and not world.is_dug(x, y))
+
+def test_grid_counts_match_a_scan_after_digging():
+    world = create_world(5, 100, "grid")
+    ores = OreIndex(world, bucket_size=16)
+    assert ores.prefix is not None
+    for x in range(0, 100, 3):
+        for y in range(4, 100, 5):
+            world.set_dug(x, y)
+    for region in ((0, 0, 100, 100), (7, 13, 61, 90), (15, 16, 17, 48), (90, 3, 120, 40)):
+        assert ores.count(*region) == undug_gold(world, *region[:2], min(region[2], 100), min(region[3], 100))
+
+def test_seeded_counts_match_a_scan():
+    world = create_world(5, 100, "seeded")
+    ores = OreIndex(world, bucket_size=16)
+    assert ores.prefix is None
+    assert ores.count(7, 13, 61, 90) == undug_gold(world, 7, 13, 61, 90)
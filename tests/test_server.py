@@ -0,0 +1,46 @@
+import asyncio
+
+from settings import SURFACE_ROW
+from server import GameServer, HeadlessClient
+from world import BLOCK_DIRT
+
+TICK_RATE = 60
+
+#Hold a direction on the client for the given seconds of server ticks, then let go
+async def hold(server, client, direction, seconds):
+    client.send_input(direction)
+    await asyncio.sleep(0.05)
+    for _ in range(round(seconds * TICK_RATE)):
+        server.tick()
+    client.send_input(None, True)
+    await asyncio.sleep(0.05)
+    server.tick()
+
+async def dig_out_of_cave_in():
+    server = GameServer(seed=1, size=20, backend="seeded", tick_rate=TICK_RATE, falling_blocks=True)
+    # Plain dirt around the spawn point, and ticks driven by the test
+    for y in range(SURFACE_ROW + 1, 12):
+        for x in range(5, 16):
+            server.world.fill(x, y, BLOCK_DIRT)
+    await server.start("127.0.0.1", 0)
+    server.ticker.cancel()
+    client = HeadlessClient()
+    await client.connect("127.0.0.1", server.server.sockets[0].getsockname()[1])
+    await asyncio.sleep(0.05)
+    try:
+        player = server.sessions[client.player_id].sim.player
+        await hold(server, client, "DOWN", 2)
+        await hold(server, client, "RIGHT", 2)
+        await hold(server, client, None, 2)
+        assert player.grid_y == SURFACE_ROW + 3
+        assert not server.world.is_dug(player.grid_x - 1, player.grid_y)
+        player.dig_time_remaining = 0
+        await hold(server, client, "LEFT", 5)
+        await hold(server, client, "UP", 2)
+        return player.grid_y
+    finally:
+        await client.close()
+        await server.close()
+
+def test_broken_drill_digs_out_of_a_cave_in():
+    assert asyncio.run(dig_out_of_cave_in()) == SURFACE_ROW
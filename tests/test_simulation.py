@@ -0,0 +1,35 @@
+from conftest import dirt_world, hold
+from settings import SURFACE_ROW
+from simulation import Simulation, EVENT_RESURFACED
+
+#Dig a shaft three cells down and a tunnel three cells to the right, which
+#caves in behind the player
+def dig_and_cave_in(sim):
+    hold(sim, "DOWN", 2)
+    hold(sim, "RIGHT", 2)
+    hold(sim, None, 2)
+
+def test_broken_drill_cannot_dig_untouched_ground():
+    sim = Simulation(size=20, world=dirt_world(), falling_blocks=True)
+    # Standing on the surface refills the drill, so break it down a shaft
+    hold(sim, "DOWN", 2)
+    sim.player.dig_time_remaining = 0
+    start = (sim.player.grid_x, sim.player.grid_y)
+    hold(sim, "RIGHT", 5)
+    hold(sim, "DOWN", 5)
+    assert (sim.player.grid_x, sim.player.grid_y) == start
+    assert not sim.world.is_dug(start[0] + 1, start[1])
+    assert not sim.world.is_dug(start[0], start[1] + 1)
+
+def test_broken_drill_digs_out_of_a_cave_in():
+    sim = Simulation(size=20, world=dirt_world(), falling_blocks=True)
+    dig_and_cave_in(sim)
+    player = sim.player
+    assert player.grid_y == SURFACE_ROW + 3
+    assert not sim.world.is_dug(player.grid_x - 1, player.grid_y)
+    player.dig_time_remaining = 0
+    score = player.score
+    events = hold(sim, "LEFT", 5) + hold(sim, "UP", 2)
+    assert player.grid_y == SURFACE_ROW
+    assert EVENT_RESURFACED in events
+    assert player.score == score
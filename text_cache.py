@@ -0,0 +1,56 @@
+#Shared font and text cache. Fonts are loaded once per size and rendered
+#strings are memoized by (text, size, color) with least-recently-used
+#eviction, so unchanged HUD and dialog text is never rendered twice.
+
+from collections import OrderedDict
+
+import pygame
+
+from settings import BLACK, TEXT_CACHE_SIZE
+
+class TextCache:
+    #Cache of loaded fonts and rendered text surfaces
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    #Get the default font at the given size, loading it on first use
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+
+    #Get an antialiased surface for the text, rendering it only on a cache miss
+    def render(self, text, size, color=BLACK):
+        key = (text, size, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = self.font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+            self.evictions += 1
+        return surface
+
+    #Counters for checking how well the cache is doing
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "fonts": len(self.fonts),
+            "entries": len(self.surfaces),
+        }
@@ -0,0 +1,388 @@
+#World storage for Gold Digger. Every cell lives in a few flat typed arrays
+#(block type, dug flag, mining progress) instead of one Block object per cell,
+#so large maps stay small in memory and quick to build.
+
+import argparse
+import random
+import threading
+from array import array
+
+from settings import (
+    GRID_SIZE, GOLD_CHANCE, SURFACE_ROW, SEEDED_TYPE_CACHE_SIZE, CHUNK_SIZE, CHUNK_FOCUS_RADIUS,
+    DEPTH_THRESHOLD, DEPTH_THRESHOLD2,
+    DIRT_MINE_TIME, STONE_MINE_TIME, HARD_STONE_MINE_TIME, VERYHARD_STONE_MINE_TIME,
+    TAN, BROWN, GRAY, DARKGRAY, GOLD, GREEN,
+)
+
+# Block type codes stored per cell
+BLOCK_EMPTY = 0 # Open sky, no block to mine
+BLOCK_DIRT = 1
+BLOCK_STONE = 2
+BLOCK_HARD_STONE = 3
+BLOCK_VERYHARD_STONE = 4
+BLOCK_GOLD = 5
+BLOCK_STONE_GOLD = 6 # Gold embedded in stone near the surface, mines like stone
+BLOCK_ARTIFACT = 7
+
+# Lookup tables indexed by block type code
+MINE_TIMES = (
+    0.0,
+    DIRT_MINE_TIME,
+    STONE_MINE_TIME,
+    HARD_STONE_MINE_TIME,
+    VERYHARD_STONE_MINE_TIME,
+    DIRT_MINE_TIME,
+    STONE_MINE_TIME,
+    DIRT_MINE_TIME,
+)
+BLOCK_COLORS = (None, TAN, BROWN, GRAY, DARKGRAY, GOLD, GOLD, GREEN)
+GOLD_TYPES = frozenset((BLOCK_GOLD, BLOCK_STONE_GOLD))
+
+# Cell hashing: each cell gets three 21-bit uniform draws from one 64-bit hash
+MASK64 = (1 << 64) - 1
+DRAW_BITS = 21
+DRAW_MASK = (1 << DRAW_BITS) - 1
+DRAW_SCALE = 1.0 / (1 << DRAW_BITS)
+
+#Pick a block type for a cell at depth y from three uniform draws in [0, 1)
+def roll_block_type(y, gold_draw, stone_draw, hardness_draw):
+    if gold_draw < GOLD_CHANCE:
+        if y > DEPTH_THRESHOLD:
+            return BLOCK_GOLD
+        return BLOCK_STONE_GOLD if stone_draw < 0.2 else BLOCK_GOLD
+
+    if y > DEPTH_THRESHOLD:
+        if y > DEPTH_THRESHOLD2 and hardness_draw < 0.7:
+            return BLOCK_VERYHARD_STONE
+        return BLOCK_HARD_STONE if stone_draw < 0.2 else BLOCK_STONE
+    return BLOCK_STONE if stone_draw < 0.2 else BLOCK_DIRT
+
+#Counter-based hash of a cell (splitmix64 finalizer), the same for a given seed and position
+def hash_cell(seed, x, y):
+    h = (seed * 0x9E3779B97F4A7C15 + x * 0xBF58476D1CE4E5B9 + y * 0x94D049BB133111EB) & MASK64
+    h ^= h >> 30
+    h = (h * 0xBF58476D1CE4E5B9) & MASK64
+    h ^= h >> 27
+    h = (h * 0x94D049BB133111EB) & MASK64
+    return h ^ (h >> 31)
+
+#Get the generated block type of a cell below the surface as a pure function of (seed, x, y)
+def seeded_block_type(seed, x, y):
+    h = hash_cell(seed, x, y)
+    return roll_block_type(
+        y,
+        (h & DRAW_MASK) * DRAW_SCALE,
+        ((h >> DRAW_BITS) & DRAW_MASK) * DRAW_SCALE,
+        ((h >> 2 * DRAW_BITS) & DRAW_MASK) * DRAW_SCALE,
+    )
+
+#Generate the block types for count cells of row y starting at start_x. Same
+#result as seeded_block_type per cell, with the hash and thresholds inlined.
+def seeded_row_types(seed, y, start_x, count):
+    row = bytearray(count)
+    if y <= SURFACE_ROW:
+        return row
+    gold_limit = GOLD_CHANCE * (1 << DRAW_BITS)
+    stone_limit = 0.2 * (1 << DRAW_BITS)
+    hardness_limit = 0.7 * (1 << DRAW_BITS) if y > DEPTH_THRESHOLD2 else -1
+    deep = y > DEPTH_THRESHOLD
+    gold_in_stone = BLOCK_GOLD if deep else BLOCK_STONE_GOLD
+    stone_or_hard = BLOCK_HARD_STONE if deep else BLOCK_STONE
+    plain = BLOCK_STONE if deep else BLOCK_DIRT
+    base = seed * 0x9E3779B97F4A7C15 + y * 0x94D049BB133111EB
+    for i in range(count):
+        h = (base + (start_x + i) * 0xBF58476D1CE4E5B9) & MASK64
+        h ^= h >> 30
+        h = (h * 0xBF58476D1CE4E5B9) & MASK64
+        h ^= h >> 27
+        h = (h * 0x94D049BB133111EB) & MASK64
+        h ^= h >> 31
+        stone = ((h >> DRAW_BITS) & DRAW_MASK) < stone_limit
+        if (h & DRAW_MASK) < gold_limit:
+            row[i] = gold_in_stone if stone else BLOCK_GOLD
+        elif ((h >> 2 * DRAW_BITS) & DRAW_MASK) < hardness_limit:
+            row[i] = BLOCK_VERYHARD_STONE
+        else:
+            row[i] = stone_or_hard if stone else plain
+    return row
+
+#Pick a random seed for a new world
+def new_seed():
+    return random.randrange(1 << 63)
+
+#Saves and recordings store the seed as an unsigned 64-bit number. Returns
+#the seed, or raises ValueError when it doesn't fit.
+def check_seed(seed):
+    if not 0 <= seed <= MASK64:
+        raise ValueError(f"Seed must be between 0 and {MASK64}, got {seed}")
+    return seed
+
+#argparse type for a seed given on the command line
+def parse_seed(text):
+    try:
+        return check_seed(int(text))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+#Position of the special artifact block near the bottom of the map
+def artifact_position(width, height):
+    return (width // 6, height - 2)
+
+#Get the color used to draw a block of the given type at depth y
+def block_color(block_type, y):
+    if block_type == BLOCK_DIRT and y > DEPTH_THRESHOLD:
+        return GRAY
+    return BLOCK_COLORS[block_type]
+
+class ObservableWorld:
+    #Base for world stores that tell observers when a cell's state changes
+    observers = ()
+    
+    #Register a callback(x, y) run whenever a cell is dug, mined or replaced
+    def add_observer(self, callback):
+        self.observers = self.observers + (callback,)
+    
+    def remove_observer(self, callback):
+        self.observers = tuple(observer for observer in self.observers if observer != callback)
+    
+    def notify(self, x, y):
+        for callback in self.observers:
+            callback(x, y)
+
+class WorldGrid(ObservableWorld):
+    #Structure-of-arrays store holding the state of every cell in the world
+    pending_chunks = None # Per chunk, 1 until begin_generation's blocks are filled in
+
+    def __init__(self, width=GRID_SIZE, height=GRID_SIZE):
+        self.width = width
+        self.height = height
+        cell_count = width * height
+        self.types = bytearray(cell_count)
+        self.dug = bytearray(cell_count)
+        self.progress = array('f', bytes(4 * cell_count))
+
+    #Fill the grid with the blocks generated for the seed and place the artifact.
+    #A terrain generator builds the whole map at once instead of row by row.
+    def generate(self, seed=None, terrain=None):
+        self.seed = new_seed() if seed is None else seed
+        width = self.width
+        if terrain is not None:
+            self.types[:] = terrain.generate(self.seed, width, self.height)
+        else:
+            for y in range(SURFACE_ROW + 1, self.height):
+                self.types[y * width:(y + 1) * width] = seeded_row_types(self.seed, y, 0, width)
+
+        # Place the special artifact block near the bottom
+        self.artifact_pos = artifact_position(self.width, self.height)
+        self.set_block_type(*self.artifact_pos, BLOCK_ARTIFACT)
+        return self
+
+    #Start a generation that fills the grid one chunk at a time, so the chunks
+    #around the spawn point can be played while a worker thread does the rest.
+    #Cells of a chunk that hasn't been generated yet read as sky.
+    def begin_generation(self, seed=None, chunk_size=CHUNK_SIZE):
+        self.seed = new_seed() if seed is None else seed
+        self.artifact_pos = artifact_position(self.width, self.height)
+        self.chunk_size = chunk_size
+        self.chunks_across = (self.width + chunk_size - 1) // chunk_size
+        self.chunks_down = (self.height + chunk_size - 1) // chunk_size
+        self.chunks_left = self.chunks_across * self.chunks_down
+        self.pending_chunks = bytearray([1]) * self.chunks_left
+        self.generation_lock = threading.Lock()
+        return self
+
+    #Fill in one chunk of a generation if nobody has yet. Safe to call from
+    #the worker and the game thread at once.
+    def generate_chunk(self, chunk_x, chunk_y):
+        index = chunk_y * self.chunks_across + chunk_x
+        with self.generation_lock:
+            if not self.pending_chunks[index]:
+                return False
+            size = self.chunk_size
+            width = self.width
+            left = chunk_x * size
+            count = min(size, width - left)
+            for y in range(max(chunk_y * size, SURFACE_ROW + 1), min((chunk_y + 1) * size, self.height)):
+                self.types[y * width + left:y * width + left + count] = seeded_row_types(self.seed, y, left, count)
+            artifact_x, artifact_y = self.artifact_pos
+            if artifact_x // size == chunk_x and artifact_y // size == chunk_y:
+                self.types[artifact_y * width + artifact_x] = BLOCK_ARTIFACT
+            self.pending_chunks[index] = 0
+            self.chunks_left -= 1
+            return True
+
+    #True while chunks of a begin_generation are still waiting to be generated
+    def is_generating(self):
+        return self.pending_chunks is not None and self.chunks_left > 0
+
+    #Block type codes and 0/1 dug flags of every cell, or None while chunks
+    #are still waiting to be generated
+    def cell_arrays(self):
+        if self.is_generating():
+            return None
+        return self.types, self.dug
+
+    #Check if the coordinates are inside the grid
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    #Check if there is a block (dug or not) at the given position
+    def __contains__(self, pos):
+        x, y = pos
+        return 0 <= x < self.width and 0 <= y < self.height and self.types[y * self.width + x] != BLOCK_EMPTY
+
+    def block_type(self, x, y):
+        return self.types[y * self.width + x]
+
+    def set_block_type(self, x, y, block_type):
+        self.types[y * self.width + x] = block_type
+        self.notify(x, y)
+
+    def is_dug(self, x, y):
+        return self.dug[y * self.width + x] != 0
+
+    def set_dug(self, x, y):
+        self.dug[y * self.width + x] = 1
+        self.notify(x, y)
+
+    #Put an undug block in a cell, clearing its dug flag and mining progress
+    def fill(self, x, y, block_type):
+        index = y * self.width + x
+        self.types[index] = block_type
+        self.dug[index] = 0
+        self.progress[index] = 0.0
+        self.notify(x, y)
+
+    def is_gold(self, x, y):
+        return self.types[y * self.width + x] in GOLD_TYPES
+
+    def is_artifact(self, x, y):
+        return self.types[y * self.width + x] == BLOCK_ARTIFACT
+
+    def get_progress(self, x, y):
+        return self.progress[y * self.width + x]
+
+    def set_progress(self, x, y, value):
+        self.progress[y * self.width + x] = value
+        self.notify(x, y)
+
+    #Get the time required to mine the block at the given position
+    def get_mine_time(self, x, y):
+        return MINE_TIMES[self.types[y * self.width + x]]
+
+    #Chunked worlds load and evict around these positions. A full grid only has
+    #work to do while it is still being generated: the chunks around the
+    #player and the view are filled in right away instead of waiting their turn.
+    def update_focus(self, positions, radius=CHUNK_FOCUS_RADIUS):
+        if self.pending_chunks is None or not self.chunks_left:
+            return
+        for x, y in positions:
+            center_x = x // self.chunk_size
+            center_y = y // self.chunk_size
+            for chunk_y in range(max(0, center_y - radius), min(self.chunks_down, center_y + radius + 1)):
+                for chunk_x in range(max(0, center_x - radius), min(self.chunks_across, center_x + radius + 1)):
+                    if self.pending_chunks[chunk_y * self.chunks_across + chunk_x]:
+                        self.generate_chunk(chunk_x, chunk_y)
+
+    #Approximate bytes held by the cell arrays
+    def memory_usage(self):
+        return len(self.types) + len(self.dug) + self.progress.itemsize * len(self.progress)
+
+class SeededWorld(ObservableWorld):
+    #World whose blocks are derived from the seed on demand. Only the player's
+    #changes (dug cells, partial mining progress, replaced blocks) are stored,
+    #in sparse overlays keyed by cell index, so building or resetting it is O(1).
+    def __init__(self, width=GRID_SIZE, height=GRID_SIZE, seed=None):
+        self.width = width
+        self.height = height
+        self.artifact_pos = artifact_position(width, height)
+        self.reseed(seed)
+
+    #Switch to a new seed and forget every change made to the old world
+    def reseed(self, seed=None):
+        self.seed = new_seed() if seed is None else seed
+        self.dug = set()
+        self.progress = {}
+        self.replaced = {}
+        self.type_cache = {}
+
+    #Generated or replaced block type of a cell, cached after the first lookup
+    def block_type(self, x, y):
+        index = y * self.width + x
+        block_type = self.type_cache.get(index)
+        if block_type is None:
+            if index in self.replaced:
+                block_type = self.replaced[index]
+            elif y <= SURFACE_ROW:
+                block_type = BLOCK_EMPTY
+            elif x == self.artifact_pos[0] and y == self.artifact_pos[1]:
+                block_type = BLOCK_ARTIFACT
+            else:
+                block_type = seeded_block_type(self.seed, x, y)
+            if len(self.type_cache) >= SEEDED_TYPE_CACHE_SIZE:
+                self.type_cache = {}
+            self.type_cache[index] = block_type
+        return block_type
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    #Check if there is a block (dug or not) at the given position
+    def __contains__(self, pos):
+        x, y = pos
+        return 0 <= x < self.width and 0 <= y < self.height and self.block_type(x, y) != BLOCK_EMPTY
+
+    def set_block_type(self, x, y, block_type):
+        index = y * self.width + x
+        self.replaced[index] = block_type
+        self.type_cache[index] = block_type
+        self.notify(x, y)
+
+    def is_dug(self, x, y):
+        return y * self.width + x in self.dug
+
+    def set_dug(self, x, y):
+        self.dug.add(y * self.width + x)
+        self.notify(x, y)
+
+    #Put an undug block in a cell, clearing its dug flag and mining progress
+    def fill(self, x, y, block_type):
+        index = y * self.width + x
+        self.replaced[index] = block_type
+        self.type_cache[index] = block_type
+        self.dug.discard(index)
+        self.progress.pop(index, None)
+        self.notify(x, y)
+
+    def is_gold(self, x, y):
+        return self.block_type(x, y) in GOLD_TYPES
+
+    def is_artifact(self, x, y):
+        return self.block_type(x, y) == BLOCK_ARTIFACT
+
+    def get_progress(self, x, y):
+        return self.progress.get(y * self.width + x, 0.0)
+
+    def set_progress(self, x, y, value):
+        self.progress[y * self.width + x] = value
+        self.notify(x, y)
+
+    #Get the time required to mine the block at the given position
+    def get_mine_time(self, x, y):
+        return MINE_TIMES[self.block_type(x, y)]
+
+    def update_focus(self, positions):
+        pass
+
+    #Generated block type codes for every cell, without the player's replacements
+    def base_types(self):
+        types = bytearray(self.width * (SURFACE_ROW + 1))
+        for y in range(SURFACE_ROW + 1, self.height):
+            types += seeded_row_types(self.seed, y, 0, self.width)
+        artifact_x, artifact_y = self.artifact_pos
+        types[artifact_y * self.width + artifact_x] = BLOCK_ARTIFACT
+        return types
+
+    #Approximate bytes held by the overlays, which grow only with the player's changes
+    def memory_usage(self):
+        return 64 * (len(self.dug) + len(self.progress) + len(self.replaced) + len(self.type_cache))